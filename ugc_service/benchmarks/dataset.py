@@ -0,0 +1,298 @@
+"""Deterministic synthetic UGC dataset with skewed activity.
+
+Films and users are drawn from Zipf distributions: a few blockbuster films
+get most of the likes and reviews, and a few heavy users write most of
+them. The ids are derived from the seed and the position of the film or
+user, so the load driver (benchmarks.load) targets the same hot films and
+heavy users when given the same --seed, --users, --films and --skew.
+
+The documents are written straight to the collections of the configured
+database (MONGO_*), a local mongod for instance, in the storage format of
+the models (COMPACT_STORAGE included), with the film stats of the likes.
+The indexes are built after the load, which is faster.
+
+Usage:
+    python -m ugc_service.benchmarks.dataset [--seed N] [--users N]
+        [--films N] [--skew S] [--likes N] [--bookmarks N]
+        [--review-ratio R] [--drop]
+"""
+import argparse
+import asyncio
+import hashlib
+import heapq
+import random
+import sys
+from bisect import bisect
+from datetime import datetime, timedelta, UTC
+from itertools import accumulate
+from uuid import UUID
+
+from ugc_service.src.core.mongo import DOCUMENT_MODELS, init_mongo
+from ugc_service.src.models.bookmark import Bookmark
+from ugc_service.src.models.fields import F
+from ugc_service.src.models.film_stats import FilmStats
+from ugc_service.src.models.like import Like
+from ugc_service.src.models.review import Review
+
+BATCH_SIZE = 10000
+# Fixed, so that the dates are the same on every run
+EPOCH = datetime(2024, 1, 1, tzinfo=UTC)
+HISTORY = timedelta(days=365)
+# Likelihood of each rating from 0 to 10, leaning to the good ones
+RATING_WEIGHTS = [1, 1, 1, 2, 2, 4, 6, 9, 12, 10, 8]
+WORDS = (
+    "film plot actor scene music ending story great boring slow twist "
+    "camera cast script sequel classic"
+).split()
+
+
+class Dataset:
+    """The ids of the films and users and their Zipf popularity."""
+
+    def __init__(self, seed: int, users: int, films: int, skew: float):
+        self.seed = seed
+        self.users = users
+        self.films = films
+        self.skew = skew
+        self._user_weights = self._cumulative_weights(users)
+        self._film_weights = self._cumulative_weights(films)
+
+    def _cumulative_weights(self, count: int) -> list[float]:
+        return list(
+            accumulate(1 / rank ** self.skew for rank in range(1, count + 1))
+        )
+
+    def _id(self, kind: str, index: int) -> UUID:
+        digest = hashlib.blake2b(
+            f"{self.seed}:{kind}:{index}".encode(), digest_size=16
+        ).digest()
+        return UUID(bytes=digest, version=4)
+
+    def user_id(self, index: int) -> UUID:
+        return self._id("user", index)
+
+    def film_id(self, index: int) -> UUID:
+        return self._id("film", index)
+
+    @staticmethod
+    def _pick(rng: random.Random, weights: list[float]) -> int:
+        return bisect(weights, rng.random() * weights[-1])
+
+    def pick_user(self, rng: random.Random) -> int:
+        return self._pick(rng, self._user_weights)
+
+    def pick_film(self, rng: random.Random) -> int:
+        return self._pick(rng, self._film_weights)
+
+    def user_share(self, index: int) -> float:
+        previous = self._user_weights[index - 1] if index else 0.0
+        return (self._user_weights[index] - previous) / self._user_weights[-1]
+
+    def films_of_user(
+            self, rng: random.Random, count: int
+    ) -> list[int]:
+        """count distinct films, the popular ones more likely."""
+        count = min(count, self.films)
+        if count * 10 > self.films:
+            # Drawing them one by one would keep hitting the same hot
+            # films. Weighted sampling without replacement instead
+            # (Efraimidis-Spirakis): the count films with the smallest
+            # exponential keys divided by their weight
+            return heapq.nsmallest(
+                count,
+                range(self.films),
+                key=lambda film: (
+                    rng.expovariate(1.0) * (film + 1) ** self.skew
+                ),
+            )
+        films = set()
+        while len(films) < count:
+            films.add(self.pick_film(rng))
+        return list(films)
+
+
+def add_dataset_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--films", type=int, default=20000)
+    parser.add_argument(
+        "--skew",
+        type=float,
+        default=1.1,
+        help="Zipf exponent of the film and user popularity",
+    )
+
+
+def dataset_from_arguments(args: argparse.Namespace) -> Dataset:
+    return Dataset(args.seed, args.users, args.films, args.skew)
+
+
+def _count(rng: random.Random, expected: float) -> int:
+    # Rounded up or down at random, so that the total is kept
+    return int(expected) + (rng.random() < expected % 1)
+
+
+def _created_at(rng: random.Random) -> datetime:
+    return EPOCH + HISTORY * rng.random()
+
+
+class Writer:
+    """Inserts the documents of a collection in unordered batches."""
+
+    def __init__(self, model):
+        self.collection = model.get_motor_collection()
+        self.batch: list[dict] = []
+        self.written = 0
+
+    async def add(self, document: dict):
+        self.batch.append(document)
+        if len(self.batch) >= BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if self.batch:
+            await self.collection.insert_many(self.batch, ordered=False)
+            self.written += len(self.batch)
+            self.batch = []
+
+
+def _document(
+        rng: random.Random,
+        user_id: UUID,
+        film_id: UUID,
+        created_at: datetime,
+) -> dict:
+    return {
+        "_id": UUID(int=rng.getrandbits(128), version=4),
+        F.user_id: user_id,
+        F.film_id: film_id,
+        F.created_at: created_at,
+        F.updated_at: created_at,
+        F.is_deleted: False,
+    }
+
+
+async def generate(
+        dataset: Dataset, likes: int, bookmarks: int, review_ratio: float
+) -> dict[str, int]:
+    rng = random.Random(dataset.seed)
+    like_writer, review_writer, bookmark_writer = (
+        Writer(Like), Writer(Review), Writer(Bookmark)
+    )
+    # Film index -> [like count, rating sum, histogram]
+    stats: dict[int, list] = {}
+    for user in range(dataset.users):
+        user_id = dataset.user_id(user)
+        share = dataset.user_share(user)
+        for film in dataset.films_of_user(rng, _count(rng, likes * share)):
+            film_id = dataset.film_id(film)
+            created_at = _created_at(rng)
+            rating = rng.choices(range(11), weights=RATING_WEIGHTS)[0]
+            await like_writer.add(
+                {
+                    **_document(rng, user_id, film_id, created_at),
+                    F.rating: rating,
+                }
+            )
+            film_stats = stats.setdefault(film, [0, 0, {}])
+            film_stats[0] += 1
+            film_stats[1] += rating
+            film_stats[2][str(rating)] = film_stats[2].get(str(rating), 0) + 1
+            if rng.random() < review_ratio:
+                text = " ".join(rng.choices(WORDS, k=rng.randint(5, 80)))
+                await review_writer.add(
+                    {
+                        **_document(rng, user_id, film_id, created_at),
+                        F.text: text,
+                    }
+                )
+        for film in dataset.films_of_user(
+                rng, _count(rng, bookmarks * share)
+        ):
+            await bookmark_writer.add(
+                _document(
+                    rng, user_id, dataset.film_id(film), _created_at(rng)
+                )
+            )
+    for writer in (like_writer, review_writer, bookmark_writer):
+        await writer.flush()
+
+    stats_writer = Writer(FilmStats)
+    for film, (like_count, rating_sum, histogram) in stats.items():
+        await stats_writer.add(
+            {
+                "_id": dataset.film_id(film),
+                "like_count": like_count,
+                "rating_sum": rating_sum,
+                "histogram": histogram,
+            }
+        )
+    await stats_writer.flush()
+    return {
+        writer.collection.name: writer.written
+        for writer in (like_writer, review_writer, bookmark_writer,
+                       stats_writer)
+    }
+
+
+async def main(
+        dataset: Dataset,
+        likes: int,
+        bookmarks: int,
+        review_ratio: float,
+        drop: bool,
+) -> int:
+    mongo = await init_mongo(skip_indexes=True)
+    try:
+        if drop:
+            for model in DOCUMENT_MODELS:
+                await model.get_motor_collection().drop()
+        written = await generate(dataset, likes, bookmarks, review_ratio)
+        for name, documents in written.items():
+            print(f"{name}: {documents} documents")
+        for model in DOCUMENT_MODELS:
+            indexes = getattr(model.Settings, "indexes", [])
+            if indexes:
+                await model.get_motor_collection().create_indexes(indexes)
+    finally:
+        mongo.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a skewed synthetic UGC dataset"
+    )
+    add_dataset_arguments(parser)
+    parser.add_argument(
+        "--likes", type=int, default=1000000, help="about as many likes"
+    )
+    parser.add_argument(
+        "--bookmarks",
+        type=int,
+        default=200000,
+        help="about as many bookmarks",
+    )
+    parser.add_argument(
+        "--review-ratio",
+        type=float,
+        default=0.05,
+        help="share of the likes that come with a review",
+    )
+    parser.add_argument(
+        "--drop",
+        action="store_true",
+        help="drop the collections first",
+    )
+    args = parser.parse_args()
+    sys.exit(
+        asyncio.run(
+            main(
+                dataset_from_arguments(args),
+                args.likes,
+                args.bookmarks,
+                args.review_ratio,
+                args.drop,
+            )
+        )
+    )
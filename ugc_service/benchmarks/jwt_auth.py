@@ -0,0 +1,84 @@
+"""Per-request cost of the Bearer token verification.
+
+Compares a plain jwt.decode, as done on every request before the verified
+claims were cached, with JWTBearer.parse_token on a cache miss (a token
+seen for the first time) and on a cache hit (a reused token).
+
+Usage:
+    python -m ugc_service.benchmarks.jwt_auth [--iterations N]
+        [--private-key PATH]
+
+The private key signs the tokens for the asymmetric algorithms, whose
+public key is configured as for the service (JWT_PUBLIC_KEY[_PATH]).
+"""
+import argparse
+import time
+import timeit
+from pathlib import Path
+from uuid import uuid4
+
+import jwt
+
+from ugc_service.src.core.jwt import ASYMMETRIC_ALGORITHM_PREFIXES, JWTBearer
+from ugc_service.src.core.settings import app_settings
+
+
+def _make_tokens(count: int, signing_key: str) -> list[str]:
+    expires_at = int(time.time()) + 3600
+    tokens = [
+        jwt.encode(
+            {"user_id": str(uuid4()), "exp": expires_at},
+            signing_key,
+            algorithm=app_settings.jwt_algorithm,
+        )
+        for _ in range(count)
+    ]
+    return [
+        token.decode() if isinstance(token, bytes) else token
+        for token in tokens
+    ]
+
+
+def _decode(token: str) -> dict:
+    key = app_settings.jwt_secret_key
+    if app_settings.jwt_algorithm.startswith(ASYMMETRIC_ALGORITHM_PREFIXES):
+        key = app_settings.jwt_public_key or Path(
+            app_settings.jwt_public_key_path
+        ).read_text()
+    return jwt.decode(token, key, algorithms=[app_settings.jwt_algorithm])
+
+
+def _per_call_us(function, tokens: list[str]) -> float:
+    iterator = iter(tokens)
+    seconds = timeit.timeit(
+        lambda: function(next(iterator)), number=len(tokens)
+    )
+    return seconds / len(tokens) * 1_000_000
+
+
+def main(iterations: int, private_key: str | None):
+    signing_key = app_settings.jwt_secret_key
+    if private_key:
+        signing_key = Path(private_key).read_text()
+    tokens = _make_tokens(iterations, signing_key)
+    bearer = JWTBearer()
+    results = {
+        "jwt.decode": _per_call_us(_decode, tokens),
+        "parse_token, cache miss": _per_call_us(bearer.parse_token, tokens),
+        "parse_token, cache hit": _per_call_us(
+            bearer.parse_token, [tokens[0]] * iterations
+        ),
+    }
+    print(f"{app_settings.jwt_algorithm}, {iterations} tokens")
+    for name, per_call in results.items():
+        print(f"{name:<26}{per_call:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Bearer token verification"
+    )
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--private-key", help="PEM file signing the tokens")
+    args = parser.parse_args()
+    main(args.iterations, args.private_key)
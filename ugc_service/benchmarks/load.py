@@ -0,0 +1,403 @@
+"""Load test of every api/v1 endpoint at a target request rate.
+
+Requests are sent open loop: request i is due i / rate seconds after the
+start, whether the previous ones have returned or not, and its latency is
+counted from that moment. A slow server thus shows up in the latencies
+instead of lowering the rate (no coordinated omission). At most
+--concurrency requests are in flight, later ones wait for a slot.
+
+The mix of endpoints (ENDPOINTS, by weight) and the users and films of the
+requests follow the skew of the dataset (benchmarks.dataset, run with the
+same --seed, --users, --films and --skew), and the same seed sends the
+same requests. By default the requests go through the FastAPI app in
+process (httpx ASGITransport, lifespan included), with the service
+settings; with --url to a running service instead. The tokens are signed
+with JWT_SECRET_KEY, or with --private-key for the asymmetric algorithms.
+
+404 and 409 answers are expected from random writes; any other 4xx or 5xx
+answer, or a failed request, counts as an error. Needs httpx.
+
+Usage:
+    python -m ugc_service.benchmarks.load [--rate N] [--duration SECONDS]
+        [--warmup SECONDS] [--concurrency N] [--url URL] [--only TEXT]
+        [--output FILE] [--baseline FILE] [--tolerance R]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import httpx
+import jwt
+
+from ugc_service.benchmarks.dataset import (
+    Dataset,
+    add_dataset_arguments,
+    dataset_from_arguments,
+)
+from ugc_service.benchmarks.report import (
+    compare,
+    print_results,
+    save,
+    summarize,
+)
+from ugc_service.src.core.settings import app_settings
+
+EXPECTED_STATUSES = {HTTPStatus.NOT_FOUND, HTTPStatus.CONFLICT}
+BATCH_ITEMS = 20
+STATS_FILMS = 10
+TOKEN_LIFETIME = 24 * 3600
+
+
+class Request(NamedTuple):
+    method: str
+    url: str
+    params: dict | None = None
+    json: dict | None = None
+
+
+def _film(dataset: Dataset, rng: random.Random) -> str:
+    return str(dataset.film_id(dataset.pick_film(rng)))
+
+
+def _films(dataset: Dataset, rng: random.Random, count: int) -> list[str]:
+    return [_film(dataset, rng) for _ in range(count)]
+
+
+def _rating(rng: random.Random) -> int:
+    return rng.randint(0, 10)
+
+
+def _text(rng: random.Random) -> str:
+    return "benchmark review " * rng.randint(1, 20)
+
+
+Builder = Callable[[Dataset, random.Random], Request]
+
+# Route template -> (weight, builder of the request). Reads dominate, as
+# on the film pages
+ENDPOINTS: dict[str, tuple[int, Builder]] = {
+    "GET /api/v1/likes/{film_id}/count": (
+        15,
+        lambda d, rng: Request(
+            "GET", f"/api/v1/likes/{_film(d, rng)}/count"
+        ),
+    ),
+    "GET /api/v1/likes/{film_id}/average-rating": (
+        10,
+        lambda d, rng: Request(
+            "GET", f"/api/v1/likes/{_film(d, rng)}/average-rating"
+        ),
+    ),
+    "GET /api/v1/likes/stats": (
+        5,
+        lambda d, rng: Request(
+            "GET",
+            "/api/v1/likes/stats",
+            params={"film_id": _films(d, rng, STATS_FILMS)},
+        ),
+    ),
+    "GET /api/v1/reviews/{film_id}/all": (
+        12,
+        lambda d, rng: Request("GET", f"/api/v1/reviews/{_film(d, rng)}/all"),
+    ),
+    "GET /api/v1/likes": (8, lambda d, rng: Request("GET", "/api/v1/likes")),
+    "GET /api/v1/bookmarks": (
+        8,
+        lambda d, rng: Request("GET", "/api/v1/bookmarks"),
+    ),
+    "GET /api/v1/reviews": (
+        4,
+        lambda d, rng: Request("GET", "/api/v1/reviews"),
+    ),
+    "POST /api/v1/likes": (
+        8,
+        lambda d, rng: Request(
+            "POST",
+            "/api/v1/likes",
+            json={"film_id": _film(d, rng), "rating": _rating(rng)},
+        ),
+    ),
+    "PATCH /api/v1/likes": (
+        4,
+        lambda d, rng: Request(
+            "PATCH",
+            "/api/v1/likes",
+            json={"film_id": _film(d, rng), "rating": _rating(rng)},
+        ),
+    ),
+    "DELETE /api/v1/likes": (
+        2,
+        lambda d, rng: Request(
+            "DELETE", "/api/v1/likes", params={"film_id": _film(d, rng)}
+        ),
+    ),
+    "POST /api/v1/likes/batch": (
+        1,
+        lambda d, rng: Request(
+            "POST",
+            "/api/v1/likes/batch",
+            json={
+                "items": [
+                    {"film_id": film_id, "rating": _rating(rng)}
+                    for film_id in _films(d, rng, BATCH_ITEMS)
+                ]
+            },
+        ),
+    ),
+    "POST /api/v1/bookmarks": (
+        4,
+        lambda d, rng: Request(
+            "POST", "/api/v1/bookmarks", params={"film_id": _film(d, rng)}
+        ),
+    ),
+    "DELETE /api/v1/bookmarks": (
+        2,
+        lambda d, rng: Request(
+            "DELETE", "/api/v1/bookmarks", params={"film_id": _film(d, rng)}
+        ),
+    ),
+    "POST /api/v1/bookmarks/batch": (
+        1,
+        lambda d, rng: Request(
+            "POST",
+            "/api/v1/bookmarks/batch",
+            json={
+                "items": [
+                    {"film_id": film_id}
+                    for film_id in _films(d, rng, BATCH_ITEMS)
+                ]
+            },
+        ),
+    ),
+    "POST /api/v1/reviews": (
+        3,
+        lambda d, rng: Request(
+            "POST",
+            "/api/v1/reviews",
+            json={"film_id": _film(d, rng), "text": _text(rng)},
+        ),
+    ),
+    "PATCH /api/v1/reviews": (
+        2,
+        lambda d, rng: Request(
+            "PATCH",
+            "/api/v1/reviews",
+            json={"film_id": _film(d, rng), "text": _text(rng)},
+        ),
+    ),
+    "DELETE /api/v1/reviews": (
+        1,
+        lambda d, rng: Request(
+            "DELETE", "/api/v1/reviews", params={"film_id": _film(d, rng)}
+        ),
+    ),
+    "POST /api/v1/reviews/batch": (
+        1,
+        lambda d, rng: Request(
+            "POST",
+            "/api/v1/reviews/batch",
+            json={
+                "items": [
+                    {"film_id": film_id, "text": _text(rng)}
+                    for film_id in _films(d, rng, BATCH_ITEMS)
+                ]
+            },
+        ),
+    ),
+}
+
+
+class Tokens:
+    """A Bearer token per user, signed once."""
+
+    def __init__(self, dataset: Dataset, signing_key: str):
+        self.dataset = dataset
+        self.signing_key = signing_key
+        self.expires_at = int(time.time()) + TOKEN_LIFETIME
+        self._headers: dict[int, dict] = {}
+
+    def headers(self, user: int) -> dict:
+        if user not in self._headers:
+            token = jwt.encode(
+                {
+                    "user_id": str(self.dataset.user_id(user)),
+                    "exp": self.expires_at,
+                },
+                self.signing_key,
+                algorithm=app_settings.jwt_algorithm,
+            )
+            if isinstance(token, bytes):
+                token = token.decode()
+            self._headers[user] = {"Authorization": f"Bearer {token}"}
+        return self._headers[user]
+
+
+@asynccontextmanager
+async def open_client(url: str | None):
+    if url:
+        async with httpx.AsyncClient(base_url=url) as client:
+            yield client
+        return
+    # Imported here, the app connects to Mongo on startup
+    from ugc_service.src.main import app, lifespan
+
+    async with lifespan(app):
+        async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://benchmark",
+        ) as client:
+            yield client
+
+
+async def run(
+        client: httpx.AsyncClient,
+        dataset: Dataset,
+        tokens: Tokens,
+        endpoints: dict,
+        rate: float,
+        duration: float,
+        warmup: float,
+        concurrency: int,
+) -> dict[str, dict]:
+    rng = random.Random(dataset.seed)
+    names = list(endpoints)
+    weights = [endpoints[name][0] for name in names]
+    slots = asyncio.Semaphore(concurrency)
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    running: set[asyncio.Task] = set()
+    started = time.perf_counter()
+    measured_from = started + warmup
+    finished_at = measured_from
+
+    async def send(name: str, request: Request, headers: dict, due: float):
+        nonlocal finished_at
+        async with slots:
+            try:
+                response = await client.request(
+                    request.method,
+                    request.url,
+                    params=request.params,
+                    json=request.json,
+                    headers=headers,
+                )
+                failed = (
+                    response.status_code >= HTTPStatus.BAD_REQUEST
+                    and response.status_code not in EXPECTED_STATUSES
+                )
+            except httpx.HTTPError:
+                failed = True
+        now = time.perf_counter()
+        if due < measured_from:
+            return
+        finished_at = max(finished_at, now)
+        latencies[name].append(now - due)
+        errors[name] += failed
+
+    sent = 0
+    while True:
+        due = started + sent / rate
+        if due >= measured_from + duration:
+            break
+        name = rng.choices(names, weights=weights)[0]
+        request = endpoints[name][1](dataset, rng)
+        headers = tokens.headers(dataset.pick_user(rng))
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(send(name, request, headers, due))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        sent += 1
+    await asyncio.gather(*running)
+
+    elapsed = finished_at - measured_from
+    results = {
+        name: summarize(latencies[name], errors[name], elapsed)
+        for name in names
+        if latencies[name]
+    }
+    results["total"] = summarize(
+        [latency for values in latencies.values() for latency in values],
+        sum(errors.values()),
+        elapsed,
+    )
+    return results
+
+
+async def main(args: argparse.Namespace) -> int:
+    dataset = dataset_from_arguments(args)
+    signing_key = app_settings.jwt_secret_key
+    if args.private_key:
+        signing_key = Path(args.private_key).read_text()
+    endpoints = {
+        name: endpoint
+        for name, endpoint in ENDPOINTS.items()
+        if not args.only or args.only in name
+    }
+    if not endpoints:
+        print(f"No endpoint matches {args.only}", file=sys.stderr)
+        return 1
+    async with open_client(args.url) as client:
+        results = await run(
+            client,
+            dataset,
+            Tokens(dataset, signing_key),
+            endpoints,
+            args.rate,
+            args.duration,
+            args.warmup,
+            args.concurrency,
+        )
+    print_results(results)
+    if args.output:
+        save(results, args.output)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"[REGRESSION] {regression}")
+        if regressions:
+            return 1
+        print(f"No regression against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test the UGC API at a target request rate"
+    )
+    add_dataset_arguments(parser)
+    parser.add_argument(
+        "--rate", type=float, default=200, help="requests per second"
+    )
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=5,
+        help="seconds of requests left out of the results",
+    )
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--url", help="running service, e.g. http://host")
+    parser.add_argument(
+        "--only", help="only the endpoints containing this text"
+    )
+    parser.add_argument("--private-key", help="PEM file signing the tokens")
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument(
+        "--baseline", help="JSON results of an earlier run to compare with"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change flagged as a regression",
+    )
+    sys.exit(asyncio.run(main(parser.parse_args())))
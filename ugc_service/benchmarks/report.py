@@ -0,0 +1,80 @@
+"""Latency percentiles, and comparison with a stored baseline.
+
+Results are JSON: {name: {"requests", "errors", "throughput", "p50",
+"p95", "p99"}}, the latencies in milliseconds and the throughput in
+requests per second.
+"""
+import json
+import math
+from pathlib import Path
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: list[float], rank: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    index = math.ceil(rank / 100 * len(sorted_values)) - 1
+    return sorted_values[max(index, 0)]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    summary = {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+    }
+    for rank in PERCENTILES:
+        summary[f"p{rank}"] = percentile(latencies, rank) * 1000
+    return summary
+
+
+def print_results(results: dict[str, dict]):
+    width = max(len(name) for name in results)
+    print(
+        f"{'':<{width}}  {'requests':>8} {'errors':>6} {'req/s':>8} "
+        + " ".join(f"{f'p{rank} ms':>8}" for rank in PERCENTILES)
+    )
+    for name, summary in results.items():
+        print(
+            f"{name:<{width}}  {summary['requests']:>8} "
+            f"{summary['errors']:>6} {summary['throughput']:>8.1f} "
+            + " ".join(
+                f"{summary[f'p{rank}']:>8.2f}" for rank in PERCENTILES
+            )
+        )
+
+
+def save(results: dict[str, dict], path: str):
+    Path(path).write_text(json.dumps(results, indent=2, sort_keys=True))
+
+
+def compare(
+        results: dict[str, dict], baseline_path: str, tolerance: float
+) -> list[str]:
+    """The regressions against the baseline: a percentile latency higher
+    or a throughput lower by more than the tolerance (0.1 for 10%), or
+    errors where there were none."""
+    baseline = json.loads(Path(baseline_path).read_text())
+    regressions = []
+    for name, summary in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for rank in PERCENTILES:
+            field = f"p{rank}"
+            if summary[field] > before[field] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {field} {before[field]:.2f} ms -> "
+                    f"{summary[field]:.2f} ms"
+                )
+        if summary["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {before['throughput']:.1f} -> "
+                f"{summary['throughput']:.1f} req/s"
+            )
+        if summary["errors"] and not before["errors"]:
+            regressions.append(f"{name}: {summary['errors']} errors")
+    return regressions
@@ -0,0 +1,131 @@
+"""CPU time and memory per row of the list responses: the rows of the
+services against the models they replaced.
+
+Both paths build the body of GET /api/v1/likes for the heaviest user of
+the dataset (benchmarks.dataset, run with the same --seed, --users,
+--films and --skew), read from the configured database:
+
+- models: Like documents loaded by Beanie, dumped into LikeOutput models,
+  validated again against response_model by FastAPI and encoded by
+  JSONResponse, as the route used to do;
+- rows: the rows of LikeService.get_by_user_id, projected and renamed by
+  Mongo, encoded by ORJSONResponse (api.responses.page_response).
+
+The CPU time is the process time, Motor threads included, so it counts
+the BSON decoding but not the wait for Mongo. The memory is the
+tracemalloc peak while building a body, measured on separate runs as
+tracing slows them down.
+
+Usage:
+    python -m ugc_service.benchmarks.serialization [--rows N]
+        [--repeat N] [--seed N] [--users N] [--films N] [--skew S]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from ugc_service.benchmarks.dataset import (
+    add_dataset_arguments,
+    dataset_from_arguments,
+)
+from ugc_service.src.api.responses import page_response
+from ugc_service.src.core.mongo import init_mongo
+from ugc_service.src.core.pagination import KEYSET_SORT
+from ugc_service.src.models.fields import F
+from ugc_service.src.models.like import Like
+from ugc_service.src.schemas.like import LikeOutput
+from ugc_service.src.services.like import LikeService
+
+RESPONSE_FIELD = create_response_field(
+    name="Response_get_likes", type_=list[LikeOutput]
+)
+
+
+async def models_body(user_id: UUID, rows: int) -> tuple[int, bytes]:
+    likes = await Like.find(
+        {F.user_id: user_id, F.is_deleted: False}
+    ).sort(*KEYSET_SORT).limit(rows + 1).to_list()
+    content = await serialize_response(
+        field=RESPONSE_FIELD,
+        response_content=[
+            LikeOutput(**like.model_dump()) for like in likes[:rows]
+        ],
+    )
+    return len(content), JSONResponse(content).body
+
+
+async def rows_body(user_id: UUID, rows: int) -> tuple[int, bytes]:
+    likes, cursor = await LikeService().get_by_user_id(str(user_id), rows)
+    return len(likes), page_response(likes, cursor).body
+
+
+async def measure(path, user_id: UUID, rows: int, repeat: int) -> dict:
+    count, body = await path(user_id, rows)
+    cpu = 0.0
+    for _ in range(repeat):
+        started = time.process_time()
+        await path(user_id, rows)
+        cpu += time.process_time() - started
+    peak = 0
+    for _ in range(max(repeat // 10, 1)):
+        tracemalloc.start()
+        await path(user_id, rows)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        "rows": count,
+        "body": body,
+        "cpu_us": cpu / repeat / max(count, 1) * 1_000_000,
+        "peak_bytes": peak / max(count, 1),
+    }
+
+
+async def main(args: argparse.Namespace) -> int:
+    user_id = dataset_from_arguments(args).user_id(0)
+    mongo = await init_mongo(skip_indexes=True)
+    try:
+        results = {
+            name: await measure(path, user_id, args.rows, args.repeat)
+            for name, path in (("models", models_body), ("rows", rows_body))
+        }
+    finally:
+        mongo.close()
+    models, rows = results["models"], results["rows"]
+    if not rows["rows"]:
+        print(f"No likes of the user {user_id}", file=sys.stderr)
+        return 1
+    if models["body"] != rows["body"]:
+        print("The bodies differ", file=sys.stderr)
+        return 1
+    print(f"{rows['rows']} rows per response, {args.repeat} responses")
+    print(f"{'':<8} {'CPU us/row':>11} {'peak B/row':>11}")
+    for name, result in results.items():
+        print(
+            f"{name:<8} {result['cpu_us']:>11.2f} "
+            f"{result['peak_bytes']:>11.0f}"
+        )
+    print(
+        f"{'saved':<8} {1 - rows['cpu_us'] / models['cpu_us']:>11.0%} "
+        f"{1 - rows['peak_bytes'] / models['peak_bytes']:>11.0%}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the CPU and memory per row of the list "
+                    "responses with the model-based path"
+    )
+    add_dataset_arguments(parser)
+    parser.add_argument(
+        "--rows", type=int, default=500, help="rows per response"
+    )
+    parser.add_argument("--repeat", type=int, default=50)
+    sys.exit(asyncio.run(main(parser.parse_args())))
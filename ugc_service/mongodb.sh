@@ -81,13 +81,36 @@ const db = db.getSiblingDB(\"${MONGO_DB}\");
 db.createCollection(\"${BOOKMARK_COLLECTION}\");
 db.createCollection(\"${LIKE_COLLECTION}\");
 db.createCollection(\"${REVIEW_COLLECTION}\");
+db.createCollection(\"${FILM_STATS_COLLECTION}\");
+"
+
+# Stored field names, see src/models/fields.py
+if [ "${COMPACT_STORAGE}" = "true" ]; then
+  USER_ID=u
+  FILM_ID=f
+else
+  USER_ID=user_id
+  FILM_ID=film_id
+fi
+
+# Under the names declared on the models (src/models), before sharding:
+# otherwise shardCollection creates them under the default names and the
+# services fail to create them again on startup. Unique, as the services
+# rely on the (user_id, film_id) constraint for their upserts
+echo "Creating the shard key indexes"
+mongosh --host "mongos1" --port "${MONGO_PORT}" --eval "
+const db = db.getSiblingDB(\"${MONGO_DB}\");
+db.getCollection(\"${BOOKMARK_COLLECTION}\").createIndex({\"${USER_ID}\": 1, \"${FILM_ID}\": 1}, {name: \"user_film\", unique: true});
+db.getCollection(\"${LIKE_COLLECTION}\").createIndex({\"${FILM_ID}\": 1, \"${USER_ID}\": 1}, {name: \"film_user\", unique: true});
+db.getCollection(\"${REVIEW_COLLECTION}\").createIndex({\"${FILM_ID}\": 1, \"${USER_ID}\": 1}, {name: \"film_user\", unique: true});
 "
 
 echo "Sharding collections"
 mongosh --host "mongos1" --port "${MONGO_PORT}" --eval "
-sh.shardCollection(\"${MONGO_DB}.${BOOKMARK_COLLECTION}\", {\"id\": \"hashed\"});
-sh.shardCollection(\"${MONGO_DB}.${LIKE_COLLECTION}\", {\"id\": \"hashed\"});
-sh.shardCollection(\"${MONGO_DB}.${REVIEW_COLLECTION}\", {\"id\": \"hashed\"});
+sh.shardCollection(\"${MONGO_DB}.${BOOKMARK_COLLECTION}\", {\"${USER_ID}\": 1, \"${FILM_ID}\": 1}, true);
+sh.shardCollection(\"${MONGO_DB}.${LIKE_COLLECTION}\", {\"${FILM_ID}\": 1, \"${USER_ID}\": 1}, true);
+sh.shardCollection(\"${MONGO_DB}.${REVIEW_COLLECTION}\", {\"${FILM_ID}\": 1, \"${USER_ID}\": 1}, true);
+sh.shardCollection(\"${MONGO_DB}.${FILM_STATS_COLLECTION}\", {\"_id\": \"hashed\"});
 "
 
 echo "MongoDB cluster setup is complete"
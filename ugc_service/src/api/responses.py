@@ -0,0 +1,85 @@
+from typing import AsyncIterator
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from ugc_service.src.core.admission import take_admission_slot
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Rows per chunk written by NDJSONResponse
+NDJSON_CHUNK_ROWS = 100
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Seconds, sent with 503 when the write-behind buffer is full
+WRITE_RETRY_AFTER = 1
+
+# Writes accepted by the write-behind buffers (WRITE_BEHIND=true)
+BUFFERED_WRITE_RESPONSES = {
+    202: {
+        "description": "Accepted with WRITE_BEHIND=true and written later. "
+                       "There is no id, and neither a conflict nor a "
+                       "missing document is reported",
+    },
+}
+
+LIST_RESPONSES = {
+    200: {
+        "content": {NDJSON_MEDIA_TYPE: {}},
+        "headers": {
+            NEXT_CURSOR_HEADER: {
+                "description": "Cursor of the next page, "
+                               "absent on the last page",
+                "schema": {"type": "string"},
+            },
+        },
+    },
+}
+
+
+class NDJSONResponse(StreamingResponse):
+    """Writes one JSON document per line as the rows come from Mongo, in
+    chunks of NDJSON_CHUNK_ROWS rows rather than a write per row. Holds
+    the admission slot of the request until the stream ends."""
+    media_type = NDJSON_MEDIA_TYPE
+
+    def __init__(self, rows: AsyncIterator[dict], **kwargs):
+        super().__init__(self._encode(rows), **kwargs)
+        self.admission_slot = take_admission_slot()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Also when the client disconnects or the stream fails
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.admission_slot:
+                self.admission_slot.release()
+
+    @staticmethod
+    async def _encode(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+        chunk = []
+        async for row in rows:
+            chunk.append(orjson.dumps(row))
+            if len(chunk) >= NDJSON_CHUNK_ROWS:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def set_next_cursor(response: Response, cursor: str | None):
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
+def page_response(rows: list[dict], cursor: str | None) -> ORJSONResponse:
+    """A page of rows, already shaped like the output model. Returned as a
+    Response, it is not validated against response_model again, which
+    then only documents it."""
+    response = ORJSONResponse(rows)
+    set_next_cursor(response, cursor)
+    return response
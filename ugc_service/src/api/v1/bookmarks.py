@@ -1,15 +1,31 @@
 from http import HTTPStatus
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 
+from ugc_service.src.api.responses import (
+    BUFFERED_WRITE_RESPONSES,
+    LIST_RESPONSES,
+    WRITE_RETRY_AFTER,
+    NDJSONResponse,
+    page_response,
+    wants_ndjson,
+)
+from ugc_service.src.core.admission import admit_user_lists, admit_writes
 from ugc_service.src.core.exceptions import (
     AlreadyExistsException,
+    BufferFullException,
+    InvalidCursorException,
     NotFoundException,
 )
 from ugc_service.src.core.jwt import security_jwt
+from ugc_service.src.core.settings import app_settings
 from ugc_service.src.schemas.bookmark import BookmarkOutput
-from ugc_service.src.schemas.common import NewDocument
+from ugc_service.src.schemas.common import (
+    BatchInput,
+    BatchItemResult,
+    NewDocument,
+)
 from ugc_service.src.services.bookmark import BookmarkService
 
 router = APIRouter(prefix="/api/v1/bookmarks", tags=["BookmarkService"])
@@ -19,7 +35,9 @@ router = APIRouter(prefix="/api/v1/bookmarks", tags=["BookmarkService"])
     "",
     response_model=NewDocument,
     status_code=HTTPStatus.CREATED,
+    responses=BUFFERED_WRITE_RESPONSES,
     description="Add a bookmark",
+    dependencies=[Depends(admit_writes)],
 )
 async def add_bookmark(
         film_id: UUID,
@@ -29,33 +47,82 @@ async def add_bookmark(
     user_id = token.get("user_id")
     try:
         doc_id = await bookmark_service.create(user_id, film_id)
+        if doc_id is None:
+            return Response(status_code=HTTPStatus.ACCEPTED)
         return NewDocument(id=doc_id)
     except AlreadyExistsException:
         raise HTTPException(
             status_code=HTTPStatus.CONFLICT,
             detail="Bookmark is already added",
         )
+    except BufferFullException:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Too many writes, retry later",
+            headers={"Retry-After": str(WRITE_RETRY_AFTER)},
+        )
+
+
+@router.post(
+    "/batch",
+    response_model=list[BatchItemResult],
+    status_code=HTTPStatus.OK,
+    description=f"Add up to {app_settings.batch_max_items} bookmarks in "
+                "one request. Returns a result per item, in the order of "
+                "the items",
+    dependencies=[Depends(admit_writes)],
+)
+async def add_bookmarks(
+        batch_input: BatchInput,
+        bookmark_service: BookmarkService = Depends(BookmarkService),
+        token: dict = Depends(security_jwt),  # noqa
+) -> list[BatchItemResult]:
+    user_id = token.get("user_id")
+    return await bookmark_service.create_many(user_id, batch_input.items)
 
 
 @router.get(
     "",
     response_model=list[BookmarkOutput],
     status_code=HTTPStatus.OK,
-    description="Get all bookmarks added by the current user",
+    description="Get all bookmarks added by the current user. "
+                "Newest first, the next page is requested with the cursor "
+                "from the X-Next-Cursor header. With "
+                "Accept: application/x-ndjson all of them are streamed",
+    responses=LIST_RESPONSES,
+    dependencies=[Depends(admit_user_lists)],
 )
 async def get_bookmarks(
+        request: Request,
+        limit: int = Query(
+            app_settings.page_size, ge=1, le=app_settings.max_page_size
+        ),
+        cursor: str | None = None,
         bookmark_service: BookmarkService = Depends(BookmarkService),
         token: dict = Depends(security_jwt),  # noqa
-) -> list[BookmarkOutput]:
+) -> Response:
     user_id = token.get("user_id")
-    bookmarks = await bookmark_service.get_by_user_id(user_id)
-    return [BookmarkOutput(**bookmark.model_dump()) for bookmark in bookmarks]
+    try:
+        if wants_ndjson(request):
+            return NDJSONResponse(
+                bookmark_service.stream_by_user_id(user_id, cursor)
+            )
+        bookmarks, next_cursor = await bookmark_service.get_by_user_id(
+            user_id, limit, cursor
+        )
+    except InvalidCursorException:
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor",
+        )
+    return page_response(bookmarks, next_cursor)
 
 
 @router.delete(
     "",
     status_code=HTTPStatus.OK,
     description="Delete a bookmark",
+    dependencies=[Depends(admit_writes)],
 )
 async def delete_bookmark(
         film_id: UUID,
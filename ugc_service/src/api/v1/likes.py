@@ -1,15 +1,39 @@
 from http import HTTPStatus
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 
+from ugc_service.src.api.responses import (
+    BUFFERED_WRITE_RESPONSES,
+    LIST_RESPONSES,
+    WRITE_RETRY_AFTER,
+    NDJSONResponse,
+    page_response,
+    wants_ndjson,
+)
+from ugc_service.src.core.admission import (
+    admit_film_aggregates,
+    admit_user_lists,
+    admit_writes,
+)
 from ugc_service.src.core.exceptions import (
     AlreadyExistsException,
+    BufferFullException,
+    InvalidCursorException,
     NotFoundException,
 )
 from ugc_service.src.core.jwt import security_jwt
-from ugc_service.src.schemas.common import NewDocument
-from ugc_service.src.schemas.like import LikeInput, LikeOutput
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.schemas.common import (
+    BatchInput,
+    BatchItemResult,
+    NewDocument,
+)
+from ugc_service.src.schemas.like import (
+    FilmStatsOutput,
+    LikeInput,
+    LikeOutput,
+)
 from ugc_service.src.services.like import LikeService
 
 router = APIRouter(prefix="/api/v1/likes", tags=["LikeService"])
@@ -19,7 +43,9 @@ router = APIRouter(prefix="/api/v1/likes", tags=["LikeService"])
     "",
     response_model=NewDocument,
     status_code=HTTPStatus.CREATED,
+    responses=BUFFERED_WRITE_RESPONSES,
     description="Add a like to a film",
+    dependencies=[Depends(admit_writes)],
 )
 async def add_like(
         like_input: LikeInput,
@@ -29,27 +55,93 @@ async def add_like(
     user_id = token.get("user_id")
     try:
         doc_id = await like_service.create(user_id, like_input)
+        if doc_id is None:
+            return Response(status_code=HTTPStatus.ACCEPTED)
         return NewDocument(id=doc_id)
     except AlreadyExistsException:
         raise HTTPException(
             status_code=HTTPStatus.CONFLICT,
             detail="The like already exists",
         )
+    except BufferFullException:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Too many writes, retry later",
+            headers={"Retry-After": str(WRITE_RETRY_AFTER)},
+        )
+
+
+@router.post(
+    "/batch",
+    response_model=list[BatchItemResult],
+    status_code=HTTPStatus.OK,
+    description=f"Add up to {app_settings.batch_max_items} likes in "
+                "one request. Returns a result per item, in the order of "
+                "the items",
+    dependencies=[Depends(admit_writes)],
+)
+async def add_likes(
+        batch_input: BatchInput,
+        like_service: LikeService = Depends(LikeService),
+        token: dict = Depends(security_jwt),  # noqa
+) -> list[BatchItemResult]:
+    user_id = token.get("user_id")
+    return await like_service.create_many(user_id, batch_input.items)
 
 
 @router.get(
     "",
     response_model=list[LikeOutput],
     status_code=HTTPStatus.OK,
-    description="Get all likes added by the current user",
+    description="Get all likes added by the current user. "
+                "Newest first, the next page is requested with the cursor "
+                "from the X-Next-Cursor header. With "
+                "Accept: application/x-ndjson all of them are streamed",
+    responses=LIST_RESPONSES,
+    dependencies=[Depends(admit_user_lists)],
 )
 async def get_likes(
+        request: Request,
+        limit: int = Query(
+            app_settings.page_size, ge=1, le=app_settings.max_page_size
+        ),
+        cursor: str | None = None,
         like_service: LikeService = Depends(LikeService),
         token: dict = Depends(security_jwt),  # noqa
-) -> list[LikeOutput]:
+) -> Response:
     user_id = token.get("user_id")
-    likes = await like_service.get_by_user_id(user_id)
-    return [LikeOutput(**like.model_dump()) for like in likes]
+    try:
+        if wants_ndjson(request):
+            return NDJSONResponse(
+                like_service.stream_by_user_id(user_id, cursor)
+            )
+        likes, next_cursor = await like_service.get_by_user_id(
+            user_id, limit, cursor
+        )
+    except InvalidCursorException:
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor",
+        )
+    return page_response(likes, next_cursor)
+
+
+@router.get(
+    "/stats",
+    response_model=list[FilmStatsOutput],
+    status_code=HTTPStatus.OK,
+    description="Get the number of likes and the average rating of "
+                "several films at once, in the order of the film ids",
+    dependencies=[Depends(admit_film_aggregates)],
+)
+async def get_films_stats(
+        film_id: list[UUID] = Query(
+            min_length=1, max_length=app_settings.batch_max_items
+        ),
+        like_service: LikeService = Depends(LikeService),
+        token: dict = Depends(security_jwt),  # noqa
+) -> list[FilmStatsOutput]:
+    return await like_service.get_stats(film_id)
 
 
 @router.get(
@@ -57,6 +149,7 @@ async def get_likes(
     response_model=int,
     status_code=HTTPStatus.OK,
     description="Get the total number of likes for a film",
+    dependencies=[Depends(admit_film_aggregates)],
 )
 async def get_like_count(
         film_id: UUID,
@@ -71,6 +164,7 @@ async def get_like_count(
     response_model=float,
     status_code=HTTPStatus.OK,
     description="Get the average rating for a film",
+    dependencies=[Depends(admit_film_aggregates)],
 )
 async def get_average_rating(
         film_id: UUID,
@@ -90,6 +184,8 @@ async def get_average_rating(
     "",
     status_code=HTTPStatus.OK,
     description="Update the rating of an existing like",
+    responses=BUFFERED_WRITE_RESPONSES,
+    dependencies=[Depends(admit_writes)],
 )
 async def update_rating(
         like_input: LikeInput,
@@ -99,17 +195,26 @@ async def update_rating(
     user_id = token.get("user_id")
     try:
         await like_service.update(user_id, like_input)
+        if app_settings.write_behind:
+            return Response(status_code=HTTPStatus.ACCEPTED)
     except NotFoundException:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail="The like does not exist",
         )
+    except BufferFullException:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Too many writes, retry later",
+            headers={"Retry-After": str(WRITE_RETRY_AFTER)},
+        )
 
 
 @router.delete(
     "",
     status_code=HTTPStatus.OK,
     description="Remove a like from a specific film",
+    dependencies=[Depends(admit_writes)],
 )
 async def delete_like(
         film_id: UUID,
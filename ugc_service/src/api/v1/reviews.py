@@ -1,14 +1,31 @@
 from http import HTTPStatus
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 
+from ugc_service.src.api.responses import (
+    LIST_RESPONSES,
+    NDJSONResponse,
+    page_response,
+    wants_ndjson,
+)
+from ugc_service.src.core.admission import (
+    admit_film_aggregates,
+    admit_user_lists,
+    admit_writes,
+)
 from ugc_service.src.core.exceptions import (
     AlreadyExistsException,
+    InvalidCursorException,
     NotFoundException,
 )
 from ugc_service.src.core.jwt import security_jwt
-from ugc_service.src.schemas.common import NewDocument
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.schemas.common import (
+    BatchInput,
+    BatchItemResult,
+    NewDocument,
+)
 from ugc_service.src.schemas.review import ReviewInput, ReviewOutput
 from ugc_service.src.services.review import ReviewService
 
@@ -20,6 +37,7 @@ router = APIRouter(prefix="/api/v1/reviews", tags=["ReviewService"])
     response_model=NewDocument,
     status_code=HTTPStatus.CREATED,
     description="Add a review",
+    dependencies=[Depends(admit_writes)],
 )
 async def add_review(
         review_input: ReviewInput,
@@ -37,35 +55,104 @@ async def add_review(
         )
 
 
+@router.post(
+    "/batch",
+    response_model=list[BatchItemResult],
+    status_code=HTTPStatus.OK,
+    description=f"Add up to {app_settings.batch_max_items} reviews in "
+                "one request. Returns a result per item, in the order of "
+                "the items",
+    dependencies=[Depends(admit_writes)],
+)
+async def add_reviews(
+        batch_input: BatchInput,
+        review_service: ReviewService = Depends(ReviewService),
+        token: dict = Depends(security_jwt),  # noqa
+) -> list[BatchItemResult]:
+    user_id = token.get("user_id")
+    return await review_service.create_many(user_id, batch_input.items)
+
+
 @router.get(
     "",
     response_model=list[ReviewOutput],
     status_code=HTTPStatus.OK,
-    description="Get all reviews added by the current user",
+    description="Get all reviews added by the current user. "
+                "Newest first, the next page is requested with the cursor "
+                "from the X-Next-Cursor header. With "
+                "Accept: application/x-ndjson all of them are streamed",
+    responses=LIST_RESPONSES,
+    dependencies=[Depends(admit_user_lists)],
 )
 async def get_reviews_by_user_id(
+        request: Request,
+        limit: int = Query(
+            app_settings.page_size, ge=1, le=app_settings.max_page_size
+        ),
+        cursor: str | None = None,
         review_service: ReviewService = Depends(ReviewService),
         token: dict = Depends(security_jwt),  # noqa
-) -> list[ReviewOutput]:
+) -> Response:
     user_id = token.get("user_id")
-    return await review_service.get_all(user_id=user_id)
+    try:
+        if wants_ndjson(request):
+            return NDJSONResponse(
+                review_service.stream_all(user_id=user_id, cursor=cursor)
+            )
+        reviews, next_cursor = await review_service.get_all(
+            user_id=user_id, limit=limit, cursor=cursor
+        )
+    except InvalidCursorException:
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor",
+        )
+    return page_response(reviews, next_cursor)
 
 
 @router.get(
     "/{film_id}/all",
     response_model=list[ReviewOutput],
     status_code=HTTPStatus.OK,
-    description="Get all film reviews",
+    description="Get all film reviews. "
+                "Newest first, the next page is requested with the cursor "
+                "from the X-Next-Cursor header. With "
+                "Accept: application/x-ndjson all of them are streamed",
+    responses=LIST_RESPONSES,
+    dependencies=[Depends(admit_film_aggregates)],
 )
 async def get_film_reviews(
         film_id: UUID,
+        request: Request,
+        limit: int = Query(
+            app_settings.page_size, ge=1, le=app_settings.max_page_size
+        ),
+        cursor: str | None = None,
         review_service: ReviewService = Depends(ReviewService),
         token: dict = Depends(security_jwt),  # noqa
-) -> list[ReviewOutput]:
-    return await review_service.get_all(film_id=film_id)
+) -> Response:
+    try:
+        if wants_ndjson(request):
+            return NDJSONResponse(
+                review_service.stream_all(film_id=film_id, cursor=cursor)
+            )
+        reviews, next_cursor = await review_service.get_all(
+            film_id=film_id, limit=limit, cursor=cursor
+        )
+    except InvalidCursorException:
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor",
+        )
+    return page_response(reviews, next_cursor)
 
 
-@router.patch("", status_code=HTTPStatus.OK, description="Update the review")
+@router.patch(
+    "",
+    status_code=HTTPStatus.OK,
+    description="Update the review",
+    dependencies=[Depends(admit_writes)],
+)
 async def update_review(
         review_input: ReviewInput,
         review_service: ReviewService = Depends(ReviewService),
@@ -81,7 +168,12 @@ async def update_review(
         )
 
 
-@router.delete("", status_code=HTTPStatus.OK, description="Delete the review")
+@router.delete(
+    "",
+    status_code=HTTPStatus.OK,
+    description="Delete the review",
+    dependencies=[Depends(admit_writes)],
+)
 async def delete_review(
         film_id: UUID,
         review_service: ReviewService = Depends(ReviewService),
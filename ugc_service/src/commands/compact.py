@@ -0,0 +1,243 @@
+"""Remove the tombstones of deleted bookmarks, likes and reviews.
+
+The services only mark deleted documents with is_deleted, so they stay in
+the collections and their indexes. Tombstones not updated for the
+retention period are archived, to the <collection>_archive collection or
+to NDJSON files (Extended JSON), or only deleted, in batches with a pause
+in between to leave room for the foreground traffic. A document
+reactivated meanwhile is not deleted.
+
+The reclaimed size is the BSON size of the removed documents. WiredTiger
+reuses the space for new documents, but only returns it to the file
+system after a compact.
+
+Usage:
+    python -m ugc_service.src.commands.compact [--retention-days N]
+        [--archive {collection,file,none}] [--archive-dir DIR]
+        [--batch-size N] [--pause SECONDS] [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+
+from bson import json_util
+from bson.binary import UuidRepresentation
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import DeleteOne
+from pymongo.errors import BulkWriteError
+
+from ugc_service.src.core.mongo import init_mongo
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.models.bookmark import Bookmark
+from ugc_service.src.models.fields import F
+from ugc_service.src.models.like import Like
+from ugc_service.src.models.review import Review
+
+COMPACTED_MODELS = [Bookmark, Like, Review]
+DUPLICATE_KEY_ERROR = 11000
+# Documents are moved as raw BSON, without decoding and encoding them
+RAW_OPTIONS = CodecOptions(
+    document_class=RawBSONDocument,
+    uuid_representation=UuidRepresentation.STANDARD,
+)
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(
+    uuid_representation=UuidRepresentation.STANDARD
+)
+
+
+def tombstone_filter(cutoff: datetime) -> dict:
+    # Served by the deleted_updated partial index
+    return {F.is_deleted: True, F.updated_at: {"$lt": cutoff}}
+
+
+async def _archive(
+        collection,
+        documents: list[RawBSONDocument],
+        archive: str,
+        archive_dir: str,
+):
+    if archive == "collection":
+        archive_collection = collection.database[f"{collection.name}_archive"]
+        try:
+            await archive_collection.insert_many(documents, ordered=False)
+        except BulkWriteError as error:
+            # Archived by a previous run that stopped before the delete
+            if any(
+                    write_error["code"] != DUPLICATE_KEY_ERROR
+                    for write_error in error.details["writeErrors"]
+            ):
+                raise
+    elif archive == "file":
+        lines = "".join(
+            json_util.dumps(document, json_options=JSON_OPTIONS) + "\n"
+            for document in documents
+        )
+        path = Path(archive_dir) / f"{collection.name}.ndjson"
+        await asyncio.to_thread(_append, path, lines)
+
+
+def _append(path: Path, lines: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as file:
+        file.write(lines)
+        file.flush()
+        # The documents are deleted next
+        os.fsync(file.fileno())
+
+
+async def _delete(
+        collection, documents: list[RawBSONDocument], cutoff
+) -> tuple[int, int]:
+    """Delete the tombstones and return their number and BSON size."""
+    # With the shard key, each delete only goes to the shard owning the
+    # document. The tombstone conditions are checked again
+    result = await collection.bulk_write(
+        [
+            DeleteOne(
+                {
+                    "_id": document["_id"],
+                    F.user_id: document[F.user_id],
+                    F.film_id: document[F.film_id],
+                    **tombstone_filter(cutoff),
+                }
+            )
+            for document in documents
+        ],
+        ordered=False,
+    )
+    deleted = documents
+    if result.deleted_count < len(documents):
+        # Some were reactivated since they were read, and are kept
+        kept = {
+            document["_id"]
+            async for document in collection.find(
+                {"_id": {"$in": [document["_id"] for document in documents]}},
+                projection={"_id": True},
+            )
+        }
+        deleted = [
+            document for document in documents if document["_id"] not in kept
+        ]
+    return result.deleted_count, sum(len(document.raw) for document in deleted)
+
+
+async def compact(
+        model,
+        cutoff: datetime,
+        archive: str,
+        archive_dir: str,
+        batch_size: int,
+        pause: float,
+        dry_run: bool,
+) -> tuple[int, int]:
+    collection = model.get_motor_collection().with_options(
+        codec_options=RAW_OPTIONS
+    )
+    documents = removed = size = 0
+    batch = []
+
+    async def remove_batch():
+        nonlocal removed, size
+        if dry_run:
+            size += sum(len(document.raw) for document in batch)
+        else:
+            await _archive(collection, batch, archive, archive_dir)
+            deleted, deleted_size = await _delete(collection, batch, cutoff)
+            removed += deleted
+            size += deleted_size
+        batch.clear()
+        await asyncio.sleep(pause)
+
+    async for document in collection.find(
+            tombstone_filter(cutoff), batch_size=batch_size
+    ):
+        documents += 1
+        batch.append(document)
+        if len(batch) >= batch_size:
+            await remove_batch()
+    if batch:
+        await remove_batch()
+    return (documents if dry_run else removed), size
+
+
+async def main(
+        retention_days: int,
+        archive: str,
+        archive_dir: str,
+        batch_size: int,
+        pause: float,
+        dry_run: bool,
+) -> int:
+    mongo = await init_mongo(skip_indexes=True)
+    cutoff = datetime.now(UTC) - timedelta(days=retention_days)
+    action = "would be removed" if dry_run else "removed"
+    try:
+        for model in COMPACTED_MODELS:
+            documents, size = await compact(
+                model,
+                cutoff,
+                archive,
+                archive_dir,
+                batch_size,
+                pause,
+                dry_run,
+            )
+            print(
+                f"{model.get_collection_name()}: {documents} tombstones "
+                f"{action}, {size / 2 ** 20:.1f} MiB"
+            )
+    finally:
+        mongo.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Archive and remove old tombstones"
+    )
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=app_settings.tombstone_retention_days,
+        help="keep the tombstones updated more recently",
+    )
+    parser.add_argument(
+        "--archive",
+        choices=["collection", "file", "none"],
+        default="collection",
+        help="where the tombstones are copied before they are deleted",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        default=app_settings.archive_dir,
+        help="directory of the NDJSON files with --archive file",
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--pause",
+        type=float,
+        default=0.2,
+        help="seconds to wait between batches",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only report what would be removed",
+    )
+    args = parser.parse_args()
+    sys.exit(
+        asyncio.run(
+            main(
+                args.retention_days,
+                args.archive,
+                args.archive_dir,
+                args.batch_size,
+                args.pause,
+                args.dry_run,
+            )
+        )
+    )
@@ -0,0 +1,122 @@
+"""Rebuild the film stats from the like collection and fix any drift.
+
+LikeService keeps the film stats up to date with $inc after every like
+write, but the two writes are not transactional, so a crash between them
+leaves the stats off by one. The command recomputes the stats of every
+film and only rewrites the ones that differ. Likes written while it runs
+may be counted twice or missed, so run it at a quiet time or twice.
+
+Usage:
+    python -m ugc_service.src.commands.film_stats [--dry-run]
+"""
+import argparse
+import asyncio
+import sys
+
+from pymongo import ReplaceOne
+
+from ugc_service.src.core.mongo import init_mongo
+from ugc_service.src.models.fields import F
+from ugc_service.src.models.film_stats import FilmStats
+from ugc_service.src.models.like import Like
+
+BATCH_SIZE = 1000
+
+STATS_PIPELINE = [
+    {"$match": {F.is_deleted: False}},
+    {
+        "$group": {
+            "_id": {"film_id": f"${F.film_id}", "rating": f"${F.rating}"},
+            "likes": {"$sum": 1},
+        }
+    },
+    {
+        "$group": {
+            "_id": "$_id.film_id",
+            "like_count": {"$sum": "$likes"},
+            "rating_sum": {
+                "$sum": {"$multiply": ["$_id.rating", "$likes"]}
+            },
+            "histogram": {
+                "$push": {"k": {"$toString": "$_id.rating"}, "v": "$likes"}
+            },
+        }
+    },
+    {"$addFields": {"histogram": {"$arrayToObject": "$histogram"}}},
+]
+
+
+def _normalize(stats: dict) -> dict:
+    return {
+        "like_count": stats.get("like_count", 0),
+        "rating_sum": stats.get("rating_sum", 0),
+        "histogram": {
+            rating: likes
+            for rating, likes in stats.get("histogram", {}).items()
+            if likes
+        },
+    }
+
+
+async def _reconcile(collection, batch: list[dict], dry_run: bool) -> int:
+    stored = {
+        stats["_id"]: _normalize(stats)
+        async for stats in collection.find(
+            {"_id": {"$in": [stats["_id"] for stats in batch]}}
+        )
+    }
+    requests = [
+        ReplaceOne({"_id": stats["_id"]}, stats, upsert=True)
+        for stats in batch
+        if stored.get(stats["_id"]) != _normalize(stats)
+    ]
+    if requests and not dry_run:
+        await collection.bulk_write(requests, ordered=False)
+    return len(requests)
+
+
+async def main(dry_run: bool) -> int:
+    mongo = await init_mongo(skip_indexes=True)
+    collection = FilmStats.get_motor_collection()
+    films = set()
+    drifted = 0
+    try:
+        batch = []
+        async for stats in Like.get_motor_collection().aggregate(
+                STATS_PIPELINE, allowDiskUse=True
+        ):
+            films.add(stats["_id"])
+            batch.append(stats)
+            if len(batch) >= BATCH_SIZE:
+                drifted += await _reconcile(collection, batch, dry_run)
+                batch = []
+        if batch:
+            drifted += await _reconcile(collection, batch, dry_run)
+
+        # Films whose likes have all been deleted
+        batch = []
+        async for stats in collection.find({"like_count": {"$ne": 0}}):
+            if stats["_id"] not in films:
+                batch.append({"_id": stats["_id"], **_normalize({})})
+        for start in range(0, len(batch), BATCH_SIZE):
+            drifted += await _reconcile(
+                collection, batch[start:start + BATCH_SIZE], dry_run
+            )
+    finally:
+        mongo.close()
+    action = "would be fixed" if dry_run else "fixed"
+    print(f"{len(films)} films checked, {drifted} {action}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the film stats from the likes"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only report the films whose stats have drifted",
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.dry_run)))
@@ -0,0 +1,275 @@
+"""Create the indexes declared on the document models and verify that
+every query issued by the services is served by one of them.
+
+Usage:
+    python -m ugc_service.src.commands.indexes [--verify-only] [--dedupe]
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime, UTC
+from uuid import uuid4
+
+from beanie import Document
+from pymongo.errors import OperationFailure
+
+from ugc_service.src.commands.compact import tombstone_filter
+from ugc_service.src.core.mongo import DOCUMENT_MODELS, init_mongo
+from ugc_service.src.core.pagination import KEYSET_SORT
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.models.bookmark import Bookmark
+from ugc_service.src.models.fields import F
+from ugc_service.src.models.like import Like
+from ugc_service.src.models.review import Review
+
+_USER_ID = uuid4()
+_FILM_ID = uuid4()
+_TOMBSTONES = {"filter": tombstone_filter(datetime.now(UTC))}
+
+# The shapes of the queries issued by the services, keyed by the model
+# they run against. Each entry is a command explainable by MongoDB
+QUERY_SHAPES: dict[type[Document], dict[str, dict]] = {
+    Bookmark: {
+        "compact (tombstones past the retention)": _TOMBSTONES,
+        "BookmarkService.create/delete": {
+            "filter": {
+                F.user_id: _USER_ID,
+                F.film_id: _FILM_ID,
+                F.is_deleted: False,
+            },
+        },
+        "BookmarkService.get_by_user_id": {
+            "filter": {F.user_id: _USER_ID, F.is_deleted: False},
+            "sort": dict(KEYSET_SORT),
+        },
+    },
+    Like: {
+        "compact (tombstones past the retention)": _TOMBSTONES,
+        "LikeService.create/update/delete": {
+            "filter": {
+                F.user_id: _USER_ID,
+                F.film_id: _FILM_ID,
+                F.is_deleted: False,
+            },
+        },
+        "LikeService.get_by_user_id": {
+            "filter": {F.user_id: _USER_ID, F.is_deleted: False},
+            "sort": dict(KEYSET_SORT),
+        },
+        "ReviewService.get_all ($lookup of the reviewer's like)": {
+            "filter": {
+                F.film_id: _FILM_ID,
+                F.user_id: _USER_ID,
+                F.is_deleted: False,
+            },
+        },
+    },
+    Review: {
+        "compact (tombstones past the retention)": _TOMBSTONES,
+        "ReviewService.create/update/delete": {
+            "filter": {
+                F.user_id: _USER_ID,
+                F.film_id: _FILM_ID,
+                F.is_deleted: False,
+            },
+        },
+        "ReviewService.get_all(user_id)": {
+            "filter": {F.user_id: _USER_ID, F.is_deleted: False},
+            "sort": dict(KEYSET_SORT),
+        },
+        "ReviewService.get_all(film_id)": {
+            "filter": {F.film_id: _FILM_ID, F.is_deleted: False},
+            "sort": dict(KEYSET_SORT),
+        },
+    },
+}
+
+
+def _has_stage(plan, stage: str) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == stage:
+            return True
+        return any(_has_stage(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_stage(value, stage) for value in plan)
+    return False
+
+
+async def _explain(db, collection: str, shape: dict) -> dict:
+    if "pipeline" in shape:
+        command = {
+            "aggregate": collection,
+            "pipeline": shape["pipeline"],
+            "cursor": {},
+        }
+    else:
+        command = {"find": collection, **shape}
+    return await db.command(
+        {"explain": command, "verbosity": "queryPlanner"}
+    )
+
+
+def _same_keys(existing: dict, declared: dict) -> bool:
+    return list(existing["key"]) == list(declared["key"].items())
+
+
+async def _verify_indexes(model: type[Document]) -> list[str]:
+    problems = []
+    existing = await model.get_motor_collection().index_information()
+    for index in getattr(model.Settings, "indexes", []):
+        expected = index.document
+        name = expected["name"]
+        if name not in existing:
+            other_names = [
+                other
+                for other, details in existing.items()
+                if _same_keys(details, expected)
+            ]
+            problems.append(
+                f"index {name} is missing"
+                + (f", its keys are indexed as {other_names[0]}"
+                   if other_names else "")
+            )
+            continue
+        if list(existing[name]["key"]) != list(expected["key"].items()):
+            problems.append(
+                f"index {name} has keys {existing[name]['key']}, "
+                f"expected {list(expected['key'].items())}"
+            )
+        if existing[name].get("unique", False) != expected.get(
+                "unique", False
+        ):
+            problems.append(f"index {name} has a different unique option")
+        if existing[name].get("partialFilterExpression") != expected.get(
+                "partialFilterExpression"
+        ):
+            problems.append(
+                f"index {name} has the partial filter "
+                f"{existing[name].get('partialFilterExpression')}, expected "
+                f"{expected.get('partialFilterExpression')}"
+            )
+    return problems
+
+
+async def _verify_queries(db, model: type[Document]) -> list[str]:
+    problems = []
+    collection = model.get_collection_name()
+    for query, shape in QUERY_SHAPES.get(model, {}).items():
+        explanation = await _explain(db, collection, shape)
+        plan = explanation.get("queryPlanner", explanation)
+        if _has_stage(plan, "COLLSCAN"):
+            problems.append(f"{query} runs a collection scan")
+        if _has_stage(plan, "SORT"):
+            problems.append(f"{query} sorts in memory")
+    return problems
+
+
+async def _dedupe(model: type[Document]) -> int:
+    """Keep one document per (user_id, film_id): the active one if any,
+    otherwise the latest tombstone. Needed before the index on the pair
+    can be made unique on collections written by the old services"""
+    collection = model.get_motor_collection()
+    groups = collection.aggregate(
+        [
+            {"$sort": {F.is_deleted: 1, F.updated_at: -1}},
+            {
+                "$group": {
+                    "_id": {
+                        F.user_id: f"${F.user_id}",
+                        F.film_id: f"${F.film_id}",
+                    },
+                    "ids": {"$push": "$_id"},
+                }
+            },
+            {"$match": {"ids.1": {"$exists": True}}},
+        ],
+        allowDiskUse=True,
+    )
+    removed = 0
+    async for group in groups:
+        result = await collection.delete_many(
+            {**group["_id"], "_id": {"$in": group["ids"][1:]}}
+        )
+        removed += result.deleted_count
+    return removed
+
+
+async def make_unique(db, model: type[Document], dedupe: bool = True) -> int:
+    """Convert in place the existing non-unique indexes with the keys of
+    an index declared unique, removing the duplicates first if dedupe is
+    set. The shard key index cannot be dropped and rebuilt, so collMod is
+    used (MongoDB 6.0+). prepareUnique comes first, so that no duplicate
+    is written between the dedupe and the conversion. The indexes are
+    found by their keys, as sharding may have named the shard key index
+    after them"""
+    collection = model.get_collection_name()
+    existing = await model.get_motor_collection().index_information()
+    names = [
+        name
+        for index in getattr(model.Settings, "indexes", [])
+        if index.document.get("unique")
+        for name, details in existing.items()
+        if _same_keys(details, index.document) and not details.get("unique")
+    ]
+
+    async def set_option(option: str):
+        for name in names:
+            await db.command(
+                {"collMod": collection, "index": {"name": name, option: True}}
+            )
+
+    await set_option("prepareUnique")
+    removed = await _dedupe(model) if dedupe else 0
+    await set_option("unique")
+    return removed
+
+
+async def main(verify_only: bool, dedupe: bool) -> int:
+    mongo = await init_mongo(skip_indexes=True)
+    db = mongo[app_settings.mongo_db]
+    failed = False
+    try:
+        for model in DOCUMENT_MODELS:
+            collection = model.get_collection_name()
+            if dedupe and "user_id" in model.model_fields:
+                removed = await make_unique(db, model)
+                print(f"{collection}: removed {removed} duplicates")
+            problems = []
+            indexes = getattr(model.Settings, "indexes", [])
+            if indexes and not verify_only:
+                try:
+                    await model.get_motor_collection().create_indexes(
+                        indexes
+                    )
+                except OperationFailure as error:
+                    # An existing index with other options, reported below
+                    problems.append(f"indexes not created: {error}")
+            problems += await _verify_indexes(model)
+            problems += await _verify_queries(db, model)
+            for problem in problems:
+                print(f"[FAIL] {collection}: {problem}")
+            if not problems:
+                print(f"[OK] {collection}")
+            failed = failed or bool(problems)
+    finally:
+        mongo.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create and verify the UGC indexes"
+    )
+    parser.add_argument(
+        "--verify-only",
+        action="store_true",
+        help="do not create missing indexes, only report them",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="remove duplicate (user_id, film_id) documents and make the "
+             "existing indexes unique",
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.verify_only, args.dedupe)))
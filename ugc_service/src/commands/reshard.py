@@ -0,0 +1,164 @@
+"""Move the UGC collections to the shard keys declared in SHARD_KEYS.
+
+Unsharded collections are sharded, collections sharded on another key are
+resharded online with reshardCollection (MongoDB 5.0+), which keeps serving
+reads and writes and only blocks writes for the final commit.
+
+Run it before starting a version of the services with new shard keys: on
+startup init_beanie creates the unique indexes, which a sharded collection
+only accepts when they are prefixed by its shard key.
+
+The shard key index is created first under the name declared on the
+model. Otherwise Mongo creates it under its default name (film_id_1_...)
+and init_beanie fails to create the same keys again under the declared
+one. A collection can only be resharded with a non-unique index on the
+new key, which is made unique once the resharding is over. When
+duplicates prevent it, run the indexes command with --dedupe before
+starting the services.
+
+Out of scope: the lists of a user's own likes and reviews
+(LikeService.get_by_user_id, ReviewService.get_all(user_id)) are not
+targeted. Likes and reviews are sharded on (film_id, user_id), so those
+reads are still sent to every shard and merged by mongos. Targeting them
+would need a second copy of the likes and reviews keyed by user, kept in
+step with every write. Until then, each shard serves its part of such a
+read from the user_created_id_active index.
+
+Usage:
+    python -m ugc_service.src.commands.reshard [--dry-run]
+"""
+import argparse
+import asyncio
+import sys
+
+from beanie import Document
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from ugc_service.src.commands.indexes import make_unique
+from ugc_service.src.core.mongo import SHARD_KEYS, init_mongo
+from ugc_service.src.core.settings import app_settings
+
+PROGRESS_INTERVAL = 10
+
+
+async def _current_shard_key(mongo, namespace: str) -> dict | None:
+    collection = await mongo.config.collections.find_one(
+        {"_id": namespace, "dropped": {"$ne": True}}
+    )
+    return dict(collection["key"]) if collection else None
+
+
+async def _report_progress(mongo, namespace: str):
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        operations = mongo.admin.aggregate([
+            {"$currentOp": {"allUsers": True, "localOps": False}},
+            {
+                "$match": {
+                    "type": "op",
+                    "desc": {"$regex": "^ReshardingRecipientService"},
+                    "ns": namespace,
+                }
+            },
+        ])
+        async for operation in operations:
+            print(
+                f"{namespace}: {operation.get('recipientState')}, "
+                f"{operation.get('documentsCopied', 0)} documents copied, "
+                f"about {operation.get('remainingOperationTimeEstimatedSecs')}"
+                f"s remaining on {operation.get('shard')}"
+            )
+
+
+async def _create_key_index(
+        collection, model: type[Document], key: dict, unique: bool
+) -> str:
+    """Create the index of the shard key under its declared name, unless
+    one exists, and return its name."""
+    keys = list(key.items())
+    for name, details in (await collection.index_information()).items():
+        if list(details["key"]) == keys:
+            return name
+    for index in getattr(model.Settings, "indexes", []):
+        if list(index.document["key"].items()) == keys:
+            name = index.document["name"]
+            unique = unique and index.document.get("unique", False)
+            break
+    else:
+        return await collection.create_index(keys)
+    try:
+        return await collection.create_index(keys, name=name, unique=unique)
+    except DuplicateKeyError:
+        print(
+            f"{collection.full_name}: duplicate documents, {name} is "
+            f"created non-unique, run indexes --dedupe"
+        )
+        return await collection.create_index(keys, name=name)
+
+
+async def _reshard(mongo, namespace: str, key: dict):
+    progress = asyncio.create_task(_report_progress(mongo, namespace))
+    try:
+        await mongo.admin.command({"reshardCollection": namespace, "key": key})
+    finally:
+        progress.cancel()
+
+
+async def main(dry_run: bool) -> int:
+    mongo = await init_mongo(skip_indexes=True)
+    try:
+        for model, key in SHARD_KEYS.items():
+            collection = model.Settings.name
+            namespace = f"{app_settings.mongo_db}.{collection}"
+            current_key = await _current_shard_key(mongo, namespace)
+            # The order of the fields matters, unlike for dict equality
+            if current_key and list(current_key.items()) == list(key.items()):
+                print(f"{namespace}: already sharded on {key}")
+                continue
+            print(f"{namespace}: {current_key} -> {key}")
+            if dry_run:
+                continue
+            db = mongo[app_settings.mongo_db]
+            if current_key is None:
+                name = await _create_key_index(
+                    db[collection], model, key, True
+                )
+                indexes = await db[collection].index_information()
+                # The unique (user_id, film_id) constraint the services
+                # rely on for their upserts and 409 responses
+                await mongo.admin.command(
+                    {
+                        "shardCollection": namespace,
+                        "key": key,
+                        "unique": indexes[name].get("unique", False),
+                    }
+                )
+            else:
+                # Not prefixed by the current shard key, it cannot be
+                # unique yet
+                await _create_key_index(db[collection], model, key, False)
+                await _reshard(mongo, namespace, key)
+                try:
+                    await make_unique(db, model, dedupe=False)
+                except OperationFailure as error:
+                    print(
+                        f"{namespace}: not made unique ({error}), run "
+                        f"indexes --dedupe"
+                    )
+            print(f"{namespace}: done")
+    finally:
+        mongo.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Shard or reshard the UGC collections"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only print the shard key changes",
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.dry_run)))
@@ -0,0 +1,211 @@
+"""Convert the bookmark, like and review collections to the compact
+storage format (see models.fields) and report the size gained.
+
+The fields are not renamed in place: $rename cannot change the shard key
+fields, and the rewritten documents would keep the space of the old ones
+until a compact. Each collection is copied instead to
+<collection>_compact, created with the indexes and the shard key declared
+on the models. The copy also stores every UUID as BSON binary subtype 4
+(strings and legacy subtype 3 values are converted) and drops the empty
+revision_id written by Beanie. Every run drops the copy left by the
+previous one and makes it again, so it can be run again after an
+interruption or to catch up with the writes, and the tombstones removed,
+made meanwhile.
+
+--switch renames the collections after the copy: the source to
+<collection>_long and the copy to <collection>. Stop the services, or
+their writes are lost, and start them with COMPACT_STORAGE=true again.
+The command itself must run with COMPACT_STORAGE=true.
+
+The storage size of a fresh copy also benefits from having no
+fragmentation, which the old collection gets back after a compact.
+
+Usage:
+    python -m ugc_service.src.commands.storage [--batch-size N]
+        [--pause SECONDS] [--switch]
+"""
+import argparse
+import asyncio
+import sys
+from dataclasses import astuple
+from uuid import UUID
+
+from bson.binary import Binary, OLD_UUID_SUBTYPE, UuidRepresentation
+from pymongo import ReplaceOne
+
+from ugc_service.src.core.mongo import SHARD_KEYS, init_mongo
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.models.bookmark import Bookmark
+from ugc_service.src.models.fields import COMPACT_NAMES, F, LONG_NAMES
+from ugc_service.src.models.like import Like
+from ugc_service.src.models.review import Review
+
+MIGRATED_MODELS = [Bookmark, Like, Review]
+COPY_SUFFIX = "_compact"
+SOURCE_SUFFIX = "_long"
+RENAMES = dict(zip(astuple(LONG_NAMES), astuple(COMPACT_NAMES)))
+UUID_FIELDS = {"_id", LONG_NAMES.user_id, LONG_NAMES.film_id}
+STATS_FIELDS = ("count", "size", "storageSize", "totalIndexSize")
+
+
+def _to_uuid(value):
+    if isinstance(value, str):
+        return UUID(value)
+    if isinstance(value, Binary) and value.subtype == OLD_UUID_SUBTYPE:
+        return value.as_uuid(UuidRepresentation.PYTHON_LEGACY)
+    return value
+
+
+def to_compact(document: dict) -> dict:
+    compact = {}
+    for name, value in document.items():
+        if name == "revision_id" and value is None:
+            continue
+        if name in UUID_FIELDS:
+            value = _to_uuid(value)
+        compact[RENAMES.get(name, name)] = value
+    return compact
+
+
+async def storage_stats(collection) -> dict:
+    # One document per shard on a sharded cluster
+    totals = dict.fromkeys(STATS_FIELDS, 0)
+    async for stats in collection.aggregate(
+            [{"$collStats": {"storageStats": {}}}]
+    ):
+        for field in STATS_FIELDS:
+            totals[field] += stats["storageStats"].get(field, 0)
+    return totals
+
+
+def _print_report(name: str, before: dict, after: dict):
+    print(f"{name}: {before['count']} -> {after['count']} documents")
+    for field in STATS_FIELDS[1:]:
+        change = (
+            f"{(after[field] - before[field]) / before[field]:+.0%}"
+            if before[field]
+            else "n/a"
+        )
+        print(
+            f"  {field}: {before[field] / 2 ** 20:.1f} MiB -> "
+            f"{after[field] / 2 ** 20:.1f} MiB ({change})"
+        )
+
+
+async def _prepare(mongo, model, source, target):
+    # Upserts alone would keep the documents removed from the source since
+    # the previous run
+    await target.drop()
+    await target.create_indexes(model.Settings.indexes)
+    sharded = await mongo.config.collections.find_one(
+        {"_id": source.full_name, "dropped": {"$ne": True}}
+    )
+    copy_sharded = await mongo.config.collections.find_one(
+        {"_id": target.full_name, "dropped": {"$ne": True}}
+    )
+    if sharded and not copy_sharded:
+        await mongo.admin.command(
+            {"shardCollection": target.full_name, "key": SHARD_KEYS[model]}
+        )
+
+
+async def copy(source, target, batch_size: int, pause: float) -> int:
+    copied = 0
+    batch = []
+
+    async def write_batch():
+        nonlocal copied
+        # With the shard key, each write only goes to the owning shard
+        await target.bulk_write(
+            [
+                ReplaceOne(
+                    {
+                        "_id": document["_id"],
+                        F.user_id: document[F.user_id],
+                        F.film_id: document[F.film_id],
+                    },
+                    document,
+                    upsert=True,
+                )
+                for document in batch
+            ],
+            ordered=False,
+        )
+        copied += len(batch)
+        batch.clear()
+        await asyncio.sleep(pause)
+
+    async for document in source.find({}, batch_size=batch_size):
+        batch.append(to_compact(document))
+        if len(batch) >= batch_size:
+            await write_batch()
+    if batch:
+        await write_batch()
+    return copied
+
+
+async def _switch(mongo, source, target):
+    database = source.database.name
+    await mongo.admin.command(
+        {
+            "renameCollection": source.full_name,
+            "to": f"{database}.{source.name}{SOURCE_SUFFIX}",
+        }
+    )
+    await mongo.admin.command(
+        {"renameCollection": target.full_name, "to": source.full_name}
+    )
+
+
+async def main(batch_size: int, pause: float, switch: bool) -> int:
+    if F != COMPACT_NAMES:
+        print(
+            "Run with COMPACT_STORAGE=true, so that the indexes and shard "
+            "keys of the copies use the compact names",
+            file=sys.stderr,
+        )
+        return 1
+    mongo = await init_mongo(skip_indexes=True)
+    db = mongo[app_settings.mongo_db]
+    try:
+        for model in MIGRATED_MODELS:
+            source = model.get_motor_collection()
+            target = db[f"{source.name}{COPY_SUFFIX}"]
+            await _prepare(mongo, model, source, target)
+            copied = await copy(source, target, batch_size, pause)
+            print(f"{source.name}: {copied} documents copied to {target.name}")
+            _print_report(
+                source.name,
+                await storage_stats(source),
+                await storage_stats(target),
+            )
+            if switch:
+                await _switch(mongo, source, target)
+                print(
+                    f"{source.name}: switched, the old collection is "
+                    f"{source.name}{SOURCE_SUFFIX}"
+                )
+    finally:
+        mongo.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Copy the UGC collections to the compact storage format"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--pause",
+        type=float,
+        default=0.0,
+        help="seconds to wait between batches",
+    )
+    parser.add_argument(
+        "--switch",
+        action="store_true",
+        help="replace the collections by their copies, with the services "
+             "stopped",
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.batch_size, args.pause, args.switch)))
@@ -0,0 +1,256 @@
+"""Bulk import and export of bookmarks, likes and reviews as NDJSON.
+
+Both directions stream: memory use depends on the batch size and the
+number of workers, not on the size of the data. Every line is validated
+with the document model of the collection.
+
+Import inserts unordered batches with concurrent workers. The byte offset
+up to which every batch is written is checkpointed next to the file, so
+an interrupted import continues from there when run again; documents
+inserted twice are skipped on their _id. Likes imported this way are not
+counted in the film stats until the film_stats command is run.
+
+Export splits the _id range (random UUIDs) into one range per worker and
+scans them in parallel. "-" reads from stdin or writes to stdout.
+
+Usage:
+    python -m ugc_service.src.commands.transfer import COLLECTION FILE
+        [--batch-size N] [--workers N]
+    python -m ugc_service.src.commands.transfer export COLLECTION FILE
+        [--batch-size N] [--workers N]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from uuid import UUID
+
+from pymongo.errors import BulkWriteError
+
+from ugc_service.src.core.mongo import init_mongo
+from ugc_service.src.models.bookmark import Bookmark
+from ugc_service.src.models.like import Like
+from ugc_service.src.models.review import Review
+
+MODELS = {"bookmarks": Bookmark, "likes": Like, "reviews": Review}
+DUPLICATE_KEY_ERROR = 11000
+REPORT_INTERVAL = 5
+UUID_SPACE = 2 ** 128
+# Not part of the exported documents
+EXCLUDED_FIELDS = {"revision_id"}
+
+
+class Progress:
+    """Prints the throughput every REPORT_INTERVAL seconds."""
+
+    def __init__(self, action: str):
+        self.action = action
+        self.documents = 0
+        self.started_at = time.monotonic()
+        self._reported_at = self.started_at
+
+    def add(self, documents: int):
+        self.documents += documents
+        now = time.monotonic()
+        if now - self._reported_at >= REPORT_INTERVAL:
+            self._reported_at = now
+            self.report()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started_at
+        print(
+            f"{self.documents} documents {self.action} in {elapsed:.1f}s, "
+            f"{self.documents / max(elapsed, 1e-9):.0f}/s",
+            file=sys.stderr,
+        )
+
+
+class ImportCheckpoint:
+    """Byte offset of the input before which every line is written.
+    Batches finish out of order, so it only moves past a batch once all
+    the previous ones are written as well."""
+
+    def __init__(self, path: Path, offset: int):
+        self.path = path
+        self.offset = offset
+        self._finished: dict[int, int] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "ImportCheckpoint":
+        offset = int(path.read_text()) if path.exists() else 0
+        return cls(path, offset)
+
+    def finish(self, start: int, end: int):
+        self._finished[start] = end
+        moved = False
+        while self.offset in self._finished:
+            self.offset = self._finished.pop(self.offset)
+            moved = True
+        if moved:
+            self.path.write_text(str(self.offset))
+
+
+async def _insert(model, lines: list[bytes]) -> tuple[int, int]:
+    documents = [model.model_validate_json(line) for line in lines]
+    try:
+        result = await model.insert_many(documents, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as error:
+        write_errors = error.details["writeErrors"]
+        other_errors = [
+            write_error
+            for write_error in write_errors
+            if write_error["code"] != DUPLICATE_KEY_ERROR
+        ]
+        if other_errors:
+            raise
+        return error.details["nInserted"], len(write_errors)
+
+
+async def import_collection(
+        model, path: str, batch_size: int, workers: int
+) -> int:
+    checkpoint = None
+    if path == "-":
+        source, offset = sys.stdin.buffer, 0
+    else:
+        checkpoint = ImportCheckpoint.load(Path(f"{path}.checkpoint"))
+        offset = checkpoint.offset
+        source = open(path, "rb")
+        source.seek(offset)
+        if offset:
+            print(f"Resuming {path} at byte {offset}", file=sys.stderr)
+    progress = Progress("imported")
+    skipped = 0
+    # At most one batch per worker is read ahead
+    slots = asyncio.Semaphore(workers)
+    running: set[asyncio.Task] = set()
+
+    async def insert_batch(start: int, end: int, lines: list[bytes]):
+        nonlocal skipped
+        try:
+            inserted, duplicates = await _insert(model, lines)
+        finally:
+            slots.release()
+        skipped += duplicates
+        progress.add(inserted)
+        if checkpoint:
+            checkpoint.finish(start, end)
+
+    async def submit(start: int, end: int, lines: list[bytes]):
+        await slots.acquire()
+        for task in [task for task in running if task.done()]:
+            running.remove(task)
+            # Stops on the first failed batch, the checkpoint stays
+            # before it
+            task.result()
+        running.add(asyncio.create_task(insert_batch(start, end, lines)))
+
+    try:
+        start, lines = offset, []
+        for line in source:
+            offset += len(line)
+            if line.strip():
+                lines.append(line)
+            if len(lines) >= batch_size:
+                await submit(start, offset, lines)
+                start, lines = offset, []
+        if lines:
+            await submit(start, offset, lines)
+        await asyncio.gather(*running)
+    finally:
+        for task in running:
+            task.cancel()
+        if source is not sys.stdin.buffer:
+            source.close()
+    progress.report()
+    if skipped:
+        print(f"{skipped} documents already existed", file=sys.stderr)
+    if checkpoint:
+        checkpoint.path.unlink(missing_ok=True)
+    return 0
+
+
+def _id_ranges(workers: int) -> list[dict]:
+    # Binary UUIDs compare byte by byte, as their integer values do
+    bounds = [
+        UUID(int=UUID_SPACE * part // workers) for part in range(workers)
+    ]
+    ranges = []
+    for part, lower in enumerate(bounds):
+        id_range = {"$gte": lower}
+        if part + 1 < workers:
+            id_range["$lt"] = bounds[part + 1]
+        ranges.append({"_id": id_range})
+    return ranges
+
+
+async def export_collection(
+        model, path: str, batch_size: int, workers: int
+) -> int:
+    target = sys.stdout.buffer if path == "-" else open(path, "wb")
+    progress = Progress("exported")
+
+    async def scan(filters: dict):
+        lines = []
+        async for document in model.get_motor_collection().find(
+                filters, batch_size=batch_size
+        ):
+            lines.append(
+                model.model_validate(document).model_dump_json(
+                    exclude=EXCLUDED_FIELDS
+                ).encode() + b"\n"
+            )
+            if len(lines) >= batch_size:
+                target.write(b"".join(lines))
+                progress.add(len(lines))
+                lines = []
+        target.write(b"".join(lines))
+        progress.add(len(lines))
+
+    try:
+        await asyncio.gather(
+            *(scan(filters) for filters in _id_ranges(workers))
+        )
+    finally:
+        if target is not sys.stdout.buffer:
+            target.close()
+    progress.report()
+    return 0
+
+
+async def main(
+        action: str, collection: str, path: str, batch_size: int, workers: int
+) -> int:
+    mongo = await init_mongo(skip_indexes=True)
+    try:
+        transfer = (
+            import_collection if action == "import" else export_collection
+        )
+        return await transfer(MODELS[collection], path, batch_size, workers)
+    finally:
+        mongo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import or export a UGC collection as NDJSON"
+    )
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("collection", choices=sorted(MODELS))
+    parser.add_argument("path", help='NDJSON file, "-" for stdin/stdout')
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    sys.exit(
+        asyncio.run(
+            main(
+                args.action,
+                args.collection,
+                args.path,
+                args.batch_size,
+                args.workers,
+            )
+        )
+    )
@@ -0,0 +1,194 @@
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge
+
+from ugc_service.src.core.metrics import pool_wait_listener
+from ugc_service.src.core.settings import app_settings
+
+ADMISSION_SHED = Counter(
+    "ugc_admission_shed_total",
+    "Requests rejected with 503 by admission control by route class and "
+    "reason",
+    ["route_class", "reason"],
+)
+ADMISSION_QUEUED = Counter(
+    "ugc_admission_queued_total",
+    "Requests that waited for a slot by route class",
+    ["route_class"],
+)
+ADMISSION_RUNNING = Gauge(
+    "ugc_admission_running",
+    "Requests holding a slot by route class",
+    ["route_class"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAITING = Gauge(
+    "ugc_admission_waiting",
+    "Requests waiting for a slot by route class",
+    ["route_class"],
+    multiprocess_mode="livesum",
+)
+
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+POOL_SATURATED = "pool_saturated"
+
+
+class AdmissionSlot:
+    """The slot held by a request, released once."""
+
+    def __init__(self, limiter: "AdmissionLimiter"):
+        self.limiter = limiter
+        # Released by the streamed response rather than the dependency
+        self.streamed = False
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.limiter._release()
+
+
+_current_slot: ContextVar[AdmissionSlot | None] = ContextVar(
+    "ugc_admission_slot", default=None
+)
+
+
+def take_admission_slot() -> AdmissionSlot | None:
+    """Take over the slot of the request, for a streamed response that
+    releases it when the stream ends. To be called by a response returned
+    right away, as the dependency no longer releases the slot."""
+    slot = _current_slot.get()
+    if slot is not None:
+        slot.streamed = True
+        _current_slot.set(None)
+    return slot
+
+
+class AdmissionLimiter:
+    """Dependency letting at most limit requests of a route class run at
+    once in a worker. Up to queue_size more wait for a slot, in arrival
+    order, for at most queue_timeout seconds. Beyond that, and while the
+    Motor pool checkouts wait longer than pool_wait_threshold seconds on
+    average, requests fail fast with 503 and Retry-After instead of
+    piling up behind the pool. A limit or a threshold of 0 disables it.
+
+    The slot is released once the response is built, or when the stream
+    ends for a response taking it over (take_admission_slot)."""
+
+    def __init__(
+            self,
+            route_class: str,
+            limit: int,
+            queue_size: int,
+            queue_timeout: float,
+            pool_wait_threshold: float,
+            retry_after: int,
+    ):
+        self.route_class = route_class
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.pool_wait_threshold = pool_wait_threshold
+        self.retry_after = retry_after
+        self._running = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._running_gauge = ADMISSION_RUNNING.labels(route_class)
+        self._waiting_gauge = ADMISSION_WAITING.labels(route_class)
+
+    async def __call__(self):
+        if self._pool_saturated():
+            raise self._shed(POOL_SATURATED)
+        if not self.limit:
+            yield
+            return
+        await self._acquire()
+        slot = AdmissionSlot(self)
+        _current_slot.set(slot)
+        try:
+            yield
+        finally:
+            if not slot.streamed:
+                slot.release()
+
+    def _pool_saturated(self) -> bool:
+        # Without checkouts the average is not updated: the shedding ends
+        # a retry period after the last slow one
+        return bool(self.pool_wait_threshold) and (
+            pool_wait_listener.recent_wait(self.retry_after)
+            > self.pool_wait_threshold
+        )
+
+    def _shed(self, reason: str) -> HTTPException:
+        ADMISSION_SHED.labels(self.route_class, reason).inc()
+        return HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="The service is overloaded, retry later",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def _acquire(self):
+        if self._running < self.limit and not self._waiters:
+            self._running += 1
+            self._running_gauge.set(self._running)
+            return
+        if len(self._waiters) >= self.queue_size:
+            raise self._shed(QUEUE_FULL)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._waiting_gauge.set(len(self._waiters))
+        ADMISSION_QUEUED.labels(self.route_class).inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if waiter.done():
+                # The slot was handed over as the wait ended
+                self._release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                self._waiting_gauge.set(len(self._waiters))
+            if isinstance(error, asyncio.TimeoutError):
+                raise self._shed(QUEUE_TIMEOUT)
+            raise
+
+    def _release(self):
+        # The slot goes to the oldest waiter, if any, else it is freed
+        if self._waiters:
+            self._waiters.popleft().set_result(None)
+            self._waiting_gauge.set(len(self._waiters))
+            return
+        self._running -= 1
+        self._running_gauge.set(self._running)
+
+
+def create_limiter(route_class: str, limit: int, queue_size: int):
+    return AdmissionLimiter(
+        route_class,
+        limit,
+        queue_size,
+        queue_timeout=app_settings.admission_queue_timeout,
+        pool_wait_threshold=app_settings.admission_pool_wait_threshold,
+        retry_after=app_settings.admission_retry_after,
+    )
+
+
+admit_writes = create_limiter(
+    "writes",
+    app_settings.admission_writes_limit,
+    app_settings.admission_writes_queue_size,
+)
+admit_user_lists = create_limiter(
+    "user_lists",
+    app_settings.admission_user_lists_limit,
+    app_settings.admission_user_lists_queue_size,
+)
+admit_film_aggregates = create_limiter(
+    "film_aggregates",
+    app_settings.admission_film_aggregates_limit,
+    app_settings.admission_film_aggregates_queue_size,
+)
@@ -0,0 +1,154 @@
+import pickle
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
+from uuid import UUID, uuid4
+
+from prometheus_client import Counter
+
+from ugc_service.src.core.settings import app_settings
+
+CACHE_REQUESTS = Counter(
+    "ugc_cache_requests_total",
+    "Cache lookups by result",
+    ["backend", "result"],
+)
+CACHE_EVICTIONS = Counter(
+    "ugc_cache_evictions_total",
+    "Entries evicted from the in-process cache",
+    ["reason"],
+)
+
+# Returned by get() for absent keys, as None is a valid cached value
+MISSING = object()
+
+
+class CacheBackend(ABC):
+    name: str
+
+    async def get(self, key: str) -> Any:
+        value = await self._get(key)
+        CACHE_REQUESTS.labels(
+            self.name, "miss" if value is MISSING else "hit"
+        ).inc()
+        return value
+
+    @abstractmethod
+    async def _get(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        ...
+
+    async def close(self):
+        pass
+
+    async def get_version(self, key: str) -> str:
+        """Version of a group of entries, whose keys include it. Each
+        invalidation deletes the version and the next read picks a new
+        one: values loaded before it are stored under a stale version and
+        never read."""
+        version = await self.get(key)
+        if version is MISSING:
+            version = uuid4().hex
+            await self.set(key, version)
+        return version
+
+
+class LRUCache(CacheBackend):
+    """In-process LRU cache whose entries also expire after a TTL."""
+    name = "memory"
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def _get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            CACHE_EVICTIONS.labels("expired").inc()
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        expires_at = time.monotonic() + (ttl or self.ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            CACHE_EVICTIONS.labels("size").inc()
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+
+class RedisCache(CacheBackend):
+    """Cache shared by all the workers, for any Redis-compatible store.
+    Expiration and eviction are left to the store."""
+    name = "redis"
+
+    def __init__(self, url: str, ttl: float):
+        # Optional dependency, only needed with CACHE_BACKEND=redis
+        from redis.asyncio import Redis
+
+        self.ttl = ttl
+        self._redis = Redis.from_url(url)
+
+    async def _get(self, key: str) -> Any:
+        value = await self._redis.get(key)
+        return MISSING if value is None else pickle.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        await self._redis.set(
+            key, pickle.dumps(value), px=int((ttl or self.ttl) * 1000)
+        )
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def film_stats_key(film_id: UUID) -> str:
+    # Version of the cached film stats, deleted to invalidate them
+    return f"film_stats_version:{film_id}"
+
+
+def film_stats_value_key(film_id: UUID, version: str) -> str:
+    return f"film_stats:{film_id}:{version}"
+
+
+def film_reviews_key(film_id: UUID) -> str:
+    # Version of the cached pages of the film reviews, deleted to
+    # invalidate them all
+    return f"film_review_version:{film_id}"
+
+
+def film_reviews_page_key(
+        film_id: UUID, version: str, limit: int | None
+) -> str:
+    # Pages of rows, the pages of ReviewOutput were under film_reviews:
+    return f"film_review_rows:{film_id}:{version}:{limit}"
+
+
+@lru_cache
+def get_cache() -> CacheBackend:
+    if app_settings.cache_backend == "redis":
+        return RedisCache(app_settings.redis_url, app_settings.cache_ttl)
+    return LRUCache(app_settings.cache_max_size, app_settings.cache_ttl)
@@ -4,3 +4,11 @@ class AlreadyExistsException(Exception):
 
 class NotFoundException(Exception):
     pass
+
+
+class InvalidCursorException(Exception):
+    pass
+
+
+class BufferFullException(Exception):
+    pass
@@ -1,18 +1,47 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
 from http import HTTPStatus
+from pathlib import Path
 
 import jwt
 from fastapi import HTTPException, Request
 from fastapi.security import HTTPBearer
 from jwt import DecodeError, ExpiredSignatureError
+from jwt.algorithms import get_default_algorithms
+from prometheus_client import Counter
 
+from ugc_service.src.core.profiling import stage
 from ugc_service.src.core.settings import app_settings
 
+JWT_CACHE_REQUESTS = Counter(
+    "ugc_jwt_cache_requests_total",
+    "Verified token cache lookups by result",
+    ["result"],
+)
+
+# header.payload.signature, each part base64url encoded
+TOKEN_PATTERN = re.compile(r"[\w-]+\.[\w-]+\.[\w-]*", re.ASCII)
+MAX_TOKEN_LENGTH = 8192
+ASYMMETRIC_ALGORITHM_PREFIXES = ("RS", "PS", "ES")
+
 
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super().__init__(auto_error=auto_error)
+        self.algorithms = [app_settings.jwt_algorithm]
+        self.key = self._load_key(app_settings.jwt_algorithm)
+        self.cache_size = app_settings.jwt_cache_size
+        self.cache_ttl = app_settings.jwt_cache_ttl
+        # Token digest -> (expires at, claims), least recently used first
+        self._cache: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
 
     async def __call__(self, request: Request) -> dict:
+        with stage("auth"):
+            return await self._authenticate(request)
+
+    async def _authenticate(self, request: Request) -> dict:
         credentials = await super().__call__(request)
         if not credentials or credentials.scheme != "Bearer":
             raise HTTPException(
@@ -29,12 +58,42 @@ class JWTBearer(HTTPBearer):
         return decoded_token
 
     @staticmethod
-    def parse_token(jwt_token: str) -> dict:
-        payload = jwt.decode(
-            jwt_token,
-            app_settings.jwt_secret_key,
-            algorithms=[app_settings.jwt_algorithm],
-        )
+    def _load_key(algorithm: str):
+        """Parse the verification key once instead of on every decode."""
+        if algorithm.startswith(ASYMMETRIC_ALGORITHM_PREFIXES):
+            key = app_settings.jwt_public_key or Path(
+                app_settings.jwt_public_key_path
+            ).read_text()
+        else:
+            key = app_settings.jwt_secret_key
+        return get_default_algorithms()[algorithm].prepare_key(key)
+
+    def parse_token(self, jwt_token: str) -> dict:
+        if (
+                len(jwt_token) > MAX_TOKEN_LENGTH
+                or not TOKEN_PATTERN.fullmatch(jwt_token)
+        ):
+            raise DecodeError("Malformed token")
+
+        digest = hashlib.sha256(jwt_token.encode()).digest()
+        cached = self._cache.get(digest)
+        if cached is not None:
+            expires_at, payload = cached
+            if expires_at > time.time():
+                JWT_CACHE_REQUESTS.labels("hit").inc()
+                self._cache.move_to_end(digest)
+                return payload
+            del self._cache[digest]
+        JWT_CACHE_REQUESTS.labels("miss").inc()
+
+        payload = jwt.decode(jwt_token, self.key, algorithms=self.algorithms)
+        expires_at = time.time() + self.cache_ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        if self.cache_size:
+            self._cache[digest] = (expires_at, payload)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
         return payload
 
 
@@ -0,0 +1,179 @@
+import copy
+import logging
+import queue
+import socket
+import threading
+import time
+from logging.handlers import QueueHandler
+
+from logstash.formatter import LogstashFormatterVersion1
+from prometheus_client import Counter, Gauge
+
+LOG_RECORDS = Counter(
+    "ugc_log_records_total",
+    "Log records handed to the Logstash pipeline by outcome",
+    ["outcome"],
+)
+LOG_FRAMES = Counter(
+    "ugc_log_frames_total",
+    "UDP datagrams sent to Logstash",
+)
+LOG_QUEUE_SIZE = Gauge(
+    "ugc_log_queue_size",
+    "Log records waiting to be shipped to Logstash",
+    multiprocess_mode="livesum",
+)
+
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+
+SHUTDOWN_TIMEOUT = 5
+
+_STOP = object()
+
+
+class _Shipper(threading.Thread):
+    """Drains the queue and sends the records as JSON arrays, several
+    records per UDP datagram. The Logstash json codec turns every element
+    of an array into its own event."""
+
+    def __init__(
+            self,
+            records: queue.Queue,
+            address: tuple[str, int],
+            formatter: logging.Formatter,
+            batch_size: int,
+            flush_interval: float,
+            max_datagram_size: int,
+    ):
+        super().__init__(name="logstash-shipper", daemon=True)
+        self.records = records
+        self.address = address
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_datagram_size = max_datagram_size
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            LOG_QUEUE_SIZE.set(self.records.qsize())
+            if batch:
+                self._send(batch)
+        self.socket.close()
+
+    def _collect(self) -> tuple[list[logging.LogRecord], bool]:
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                record = (
+                    self.records.get(timeout=timeout)
+                    if timeout > 0
+                    else self.records.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if record is _STOP:
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    def _send(self, batch: list[logging.LogRecord]):
+        frame, size = [], 2
+        for record in batch:
+            try:
+                event = self.formatter.format(record)
+            except Exception:  # noqa
+                LOG_RECORDS.labels("failed").inc()
+                continue
+            if frame and size + len(event) + 1 > self.max_datagram_size:
+                self._send_frame(frame)
+                frame, size = [], 2
+            frame.append(event)
+            size += len(event) + 1
+        if frame:
+            self._send_frame(frame)
+
+    def _send_frame(self, events: list[bytes]):
+        try:
+            self.socket.sendto(
+                b"[" + b",".join(events) + b"]", self.address
+            )
+        except OSError:
+            LOG_RECORDS.labels("failed").inc(len(events))
+            return
+        LOG_FRAMES.inc()
+        LOG_RECORDS.labels("shipped").inc(len(events))
+
+
+class AsyncLogstashHandler(QueueHandler):
+    """Ships log records to Logstash's udp/json input without blocking.
+
+    The logging thread only puts the record into a bounded queue; the
+    records are formatted and sent in batches by a background thread.
+    When the queue is full, the new record (drop_newest) or the oldest
+    queued one (drop_oldest) is dropped and counted.
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            queue_size: int = 10000,
+            batch_size: int = 200,
+            flush_interval: float = 0.5,
+            max_datagram_size: int = 8192,
+            overflow_policy: str = DROP_NEWEST,
+            message_type: str = "Logstash",
+            tags: list[str] | None = None,
+    ):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.overflow_policy = overflow_policy
+        self._shipper = _Shipper(
+            self.queue,
+            (host, port),
+            LogstashFormatterVersion1(message_type, tags),
+            batch_size,
+            flush_interval,
+            max_datagram_size,
+        )
+        self._shipper.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Renders the message now, as the arguments may change before the
+        # record is shipped. exc_info is kept for the Logstash formatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow_policy != DROP_OLDEST:
+                LOG_RECORDS.labels("dropped").inc()
+                return
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+            LOG_RECORDS.labels("dropped").inc()
+            return
+        LOG_RECORDS.labels("queued").inc()
+        LOG_QUEUE_SIZE.set(self.queue.qsize())
+
+    def close(self):
+        # Flushes what is queued, called by logging.shutdown() at exit
+        if self._shipper.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=SHUTDOWN_TIMEOUT)
+                self._shipper.join(timeout=SHUTDOWN_TIMEOUT)
+            except queue.Full:
+                pass
+        super().close()
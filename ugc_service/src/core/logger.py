@@ -41,10 +41,13 @@ LOGGING = {
         },
         "logstash": {
             "level": "INFO",
-            "class": "logstash.LogstashHandler",
+            "class": "ugc_service.src.core.log_shipping.AsyncLogstashHandler",
             "host": app_settings.logstash_host,
             "port": app_settings.logstash_port,
-            "version": 1,
+            "queue_size": app_settings.log_queue_size,
+            "batch_size": app_settings.log_batch_size,
+            "flush_interval": app_settings.log_flush_interval,
+            "overflow_policy": app_settings.log_overflow_policy,
         },
     },
     "loggers": {
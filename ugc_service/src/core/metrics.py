@@ -0,0 +1,179 @@
+import os
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, multiprocess
+from pymongo import monitoring
+
+from ugc_service.src.core.profiling import add_stage_time
+
+REQUEST_LATENCY = Histogram(
+    "ugc_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+# Gauges are summed over the live workers when several share their
+# metrics (src/server.py)
+REQUESTS_IN_FLIGHT = Gauge(
+    "ugc_http_requests_in_flight",
+    "HTTP requests being served",
+    multiprocess_mode="livesum",
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "ugc_mongo_command_duration_seconds",
+    "MongoDB command latency by collection and operation",
+    ["collection", "operation", "outcome"],
+)
+MONGO_POOL_WAIT = Histogram(
+    "ugc_mongo_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the Motor pool",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+             0.5, 1.0, 2.5, 5.0),
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "ugc_mongo_pool_checkout_failures_total",
+    "Failed connection checkouts from the Motor pool by reason",
+    ["reason"],
+)
+MONGO_CONNECTIONS_CHECKED_OUT = Gauge(
+    "ugc_mongo_pool_checked_out_connections",
+    "Connections in use by the Motor pool",
+    multiprocess_mode="livesum",
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def release_worker_metrics():
+    """Remove the live gauges of this worker from the shared metrics."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class RequestMetricsMiddleware:
+    """Measures every HTTP request, labelled by the route template (e.g.
+    /api/v1/likes/{film_id}) to keep the label cardinality bounded."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                route.path if route is not None else UNMATCHED_ROUTE,
+                status_code,
+            ).observe(time.perf_counter() - started_at)
+
+
+class CommandLatencyListener(monitoring.CommandListener):
+    """Times every command sent by the driver. Only the started event
+    carries the command, so its collection is kept until the reply."""
+
+    def __init__(self):
+        self._collections: dict[tuple, str] = {}
+
+    @staticmethod
+    def _key(event: monitoring._CommandEvent) -> tuple:
+        return event.connection_id, event.request_id
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if isinstance(collection, str):
+            self._collections[self._key(event)] = collection
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._observe(event, "succeeded")
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._observe(event, "failed")
+
+    def _observe(self, event, outcome: str):
+        collection = self._collections.pop(self._key(event), "")
+        duration = event.duration_micros / 1_000_000
+        MONGO_COMMAND_LATENCY.labels(
+            collection, event.command_name, outcome
+        ).observe(duration)
+        # Motor runs the driver with the context of the awaiting request
+        add_stage_time("mongo", duration)
+
+
+class PoolWaitListener(monitoring.ConnectionPoolListener):
+    """Records how long the requests queue for a pooled connection.
+    average_wait is a moving average of the recent checkouts, in seconds,
+    read to detect pool saturation."""
+
+    def __init__(self, smoothing: float = 0.1):
+        self.smoothing = smoothing
+        self.average_wait = 0.0
+        self.updated_at = 0.0
+
+    def recent_wait(self, max_age: float) -> float:
+        """average_wait, or 0 when no connection was checked out for
+        max_age seconds, as it is then out of date."""
+        if time.monotonic() - self.updated_at > max_age:
+            return 0.0
+        return self.average_wait
+
+    def connection_checked_out(self, event):
+        MONGO_CONNECTIONS_CHECKED_OUT.inc()
+        if event.duration is None:
+            return
+        MONGO_POOL_WAIT.observe(event.duration)
+        add_stage_time("mongo_pool_wait", event.duration)
+        self.average_wait += self.smoothing * (
+            event.duration - self.average_wait
+        )
+        self.updated_at = time.monotonic()
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.labels(event.reason).inc()
+
+    def connection_checked_in(self, event):
+        MONGO_CONNECTIONS_CHECKED_OUT.dec()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+pool_wait_listener = PoolWaitListener()
@@ -0,0 +1,100 @@
+import asyncio
+
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.write_concern import WriteConcern
+
+from ugc_service.src.core.metrics import (
+    CommandLatencyListener,
+    pool_wait_listener,
+)
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.models.bookmark import Bookmark
+from ugc_service.src.models.fields import F
+from ugc_service.src.models.film_stats import FilmStats
+from ugc_service.src.models.like import Like
+from ugc_service.src.models.review import Review
+
+DOCUMENT_MODELS = [Bookmark, Like, Review, FilmStats]
+
+# Bookmarks are only ever read per user, while likes and reviews are read
+# per film far more often than per user (counts, averages, film reviews).
+# Both keys end with the other id so that the chunks of a heavy user or a
+# blockbuster film can still be split and balanced across the shards. The
+# lists of a user's likes and reviews are scatter-gather reads (see
+# commands/reshard.py).
+# Film stats are only read and written by film id
+SHARD_KEYS = {
+    Bookmark: {F.user_id: 1, F.film_id: 1},
+    Like: {F.film_id: 1, F.user_id: 1},
+    Review: {F.film_id: 1, F.user_id: 1},
+    FilmStats: {"_id": "hashed"},
+}
+
+
+def create_client() -> AsyncIOMotorClient:
+    # Raw queries pass native UUIDs, which must encode the same way
+    # Beanie stores them (BSON binary subtype 4)
+    options = {
+        "maxPoolSize": app_settings.mongo_max_pool_size,
+        "minPoolSize": app_settings.mongo_min_pool_size,
+        "maxIdleTimeMS": app_settings.mongo_max_idle_time_ms,
+        "connectTimeoutMS": app_settings.mongo_connect_timeout_ms,
+        "socketTimeoutMS": app_settings.mongo_socket_timeout_ms,
+        "serverSelectionTimeoutMS": (
+            app_settings.mongo_server_selection_timeout_ms
+        ),
+        "waitQueueTimeoutMS": app_settings.mongo_wait_queue_timeout_ms,
+    }
+    if app_settings.mongo_compressors:
+        options["compressors"] = app_settings.mongo_compressors
+    return AsyncIOMotorClient(
+        app_settings.mongo_url,
+        uuidRepresentation="standard",
+        event_listeners=[CommandLatencyListener(), pool_wait_listener],
+        **{name: value for name, value in options.items()
+           if value is not None},
+    )
+
+
+async def warm_up(mongo: AsyncIOMotorClient, connections: int):
+    """Open the connections before the first requests need them. The
+    pings are concurrent, so each one checks out its own connection."""
+    await asyncio.gather(
+        *(mongo.admin.command("ping") for _ in range(connections))
+    )
+
+
+def read_only(collection: AsyncIOMotorCollection) -> AsyncIOMotorCollection:
+    """The collection for reads that can be slightly stale, like film
+    stats and film reviews, which may then be served by a secondary."""
+    if not app_settings.mongo_secondary_reads:
+        return collection
+    return collection.with_options(
+        read_preference=SecondaryPreferred(
+            max_staleness=app_settings.mongo_max_staleness_seconds
+        )
+    )
+
+
+def with_write_concern(
+        collection: AsyncIOMotorCollection, w: str
+) -> AsyncIOMotorCollection:
+    """Collection writing with w ("majority" or a number of nodes), or
+    with the cluster default if empty."""
+    if not w:
+        return collection
+    return collection.with_options(
+        write_concern=WriteConcern(w=int(w) if w.isdigit() else w)
+    )
+
+
+async def init_mongo(skip_indexes: bool = False) -> AsyncIOMotorClient:
+    mongo = create_client()
+    await init_beanie(
+        database=mongo[app_settings.mongo_db],
+        document_models=DOCUMENT_MODELS,
+        skip_indexes=skip_indexes,
+    )
+    return mongo
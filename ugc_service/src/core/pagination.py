@@ -0,0 +1,67 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Callable
+from uuid import UUID
+
+from pymongo import DESCENDING
+
+from ugc_service.src.core.exceptions import InvalidCursorException
+from ugc_service.src.models.fields import F
+
+# Lists are returned newest first, _id breaks ties between documents
+# created in the same millisecond
+KEYSET_SORT = [(F.created_at, DESCENDING), ("_id", DESCENDING)]
+
+
+def encode_cursor(created_at: datetime, doc_id: UUID) -> str:
+    value = f"{created_at.isoformat()}|{doc_id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, doc_id = value.split("|")
+        return datetime.fromisoformat(created_at), UUID(doc_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorException
+
+
+def keyset_filter(cursor: str | None) -> dict:
+    """Filter selecting the documents that come after the cursor."""
+    if not cursor:
+        return {}
+    created_at, doc_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {F.created_at: {"$lt": created_at}},
+            {F.created_at: created_at, "_id": {"$lt": doc_id}},
+        ]
+    }
+
+
+def paginate(
+        rows: list,
+        limit: int,
+        key: Callable = lambda row: (row.created_at, row.id),
+) -> tuple[list, str | None]:
+    """Cut a page fetched with limit + 1 rows and return the cursor of the
+    next page, if there is one."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
+
+
+def paginate_rows(
+        rows: list[dict], limit: int
+) -> tuple[list[dict], str | None]:
+    """paginate() of raw rows, whose _id is dropped once the cursor of the
+    next page is taken."""
+    rows, cursor = paginate(
+        rows, limit, key=lambda row: (row["created_at"], row["_id"])
+    )
+    for row in rows:
+        del row["_id"]
+    return rows, cursor
@@ -0,0 +1,295 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, UTC
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from queue import Empty, SimpleQueue
+
+from prometheus_client import Counter as MetricCounter
+
+PROFILED_REQUESTS = MetricCounter(
+    "ugc_profiled_requests_total",
+    "Requests profiled by ProfilingMiddleware by trigger",
+    ["trigger"],
+)
+
+PROFILE_HEADER = b"x-profile"
+# Top-level package of a frame -> stage of the CPU time spent in it. The
+# first of these packages from the root of the stack wins, so Pydantic
+# validation run by Beanie counts as Beanie
+LIBRARY_STAGES = {
+    "jwt": "jwt",
+    "pydantic": "pydantic",
+    "pydantic_core": "pydantic",
+    "beanie": "beanie",
+    "motor": "driver",
+    "pymongo": "driver",
+    "bson": "driver",
+}
+APP_PACKAGE = "ugc_service"
+
+_current_profile: ContextVar["RequestProfile | None"] = ContextVar(
+    "ugc_profile", default=None
+)
+
+
+class RequestProfile:
+    """Time spent by a request: wall-clock stages timed with stage() and
+    the stacks sampled while its task runs on the event loop, weighted by
+    the microseconds since the previous sample. Stages may be added from
+    the threads of the Motor executor."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: dict[str, float] = defaultdict(float)
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage_name: str, seconds: float):
+        with self._lock:
+            self.stages[stage_name] += seconds
+
+
+def add_stage_time(stage_name: str, seconds: float):
+    """Count time in a stage of the profiled request, if there is one."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add(stage_name, seconds)
+
+
+@contextmanager
+def stage(stage_name: str):
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(stage_name, time.perf_counter() - started_at)
+
+
+def _collapse(frame) -> tuple[str, ...]:
+    stack = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        stack.append(f"{module}:{frame.f_code.co_qualname}")
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _cpu_stage(stack: tuple[str, ...]) -> str:
+    in_app = False
+    for frame in stack:
+        package = frame.split(".", 1)[0].split(":", 1)[0]
+        if package in LIBRARY_STAGES:
+            return LIBRARY_STAGES[package]
+        in_app = in_app or package == APP_PACKAGE
+    return "app" if in_app else "framework"
+
+
+class ProfileWriter:
+    """Appends the profiles to two size-capped, rotated files in
+    directory: stacks.<pid>.folded, the sampled stacks in the collapsed
+    format of flamegraph.pl and speedscope, rooted at the route and
+    weighted in microseconds, and requests.<pid>.ndjson, the stage
+    breakdown of every profiled request. Each worker process has its own
+    pair, as they cannot share a rotated file."""
+
+    def __init__(self, directory: str, max_bytes: int, backup_count: int):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        pid = os.getpid()
+        self._stacks = self._open(
+            Path(directory) / f"stacks.{pid}.folded", max_bytes, backup_count
+        )
+        self._requests = self._open(
+            Path(directory) / f"requests.{pid}.ndjson",
+            max_bytes,
+            backup_count,
+        )
+
+    @staticmethod
+    def _open(path: Path, max_bytes: int, backup_count: int):
+        # A logger of its own, so the profiles are not shipped to Logstash
+        profile_logger = logging.getLogger(f"{__name__}.{path.name}")
+        profile_logger.propagate = False
+        profile_logger.setLevel(logging.INFO)
+        handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        profile_logger.handlers = [handler]
+        return profile_logger
+
+    def write(
+            self,
+            name: str,
+            status: int,
+            profile: RequestProfile,
+            duration: float,
+    ):
+        stages = {
+            stage_name: round(seconds * 1000, 3)
+            for stage_name, seconds in profile.stages.items()
+        }
+        for stack, micros in profile.stacks.items():
+            key = f"cpu.{_cpu_stage(stack)}"
+            stages[key] = round(stages.get(key, 0) + micros / 1000, 3)
+        self._requests.info(
+            json.dumps(
+                {
+                    "time": datetime.now(UTC).isoformat(),
+                    "route": name,
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 3),
+                    "sampled_ms": sum(profile.stacks.values()) / 1000,
+                    "stages_ms": stages,
+                }
+            )
+        )
+        if profile.stacks:
+            # One record per request, so a rotation never splits it
+            self._stacks.info(
+                "\n".join(
+                    f"{name};{';'.join(stack)} {micros}"
+                    for stack, micros in profile.stacks.items()
+                )
+            )
+
+
+class StackSampler:
+    """Samples the stack of the event loop thread every interval seconds
+    while profiled requests are in flight, and counts each sample for the
+    request whose task is running. A CPU-bound loop holds the GIL for up
+    to sys.getswitchinterval(), so a sample stands for the time since the
+    previous one rather than for the interval. The thread also writes the
+    finished profiles, away from the event loop, and sleeps when there is
+    none."""
+
+    def __init__(self, interval: float, writer: ProfileWriter):
+        self.interval = interval
+        self.writer = writer
+        self._profiles: dict[asyncio.Task, RequestProfile] = {}
+        self._finished: SimpleQueue = SimpleQueue()
+        self._wake = threading.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread_id: int | None = None
+        self._thread: threading.Thread | None = None
+
+    def begin(self, task: asyncio.Task, profile: RequestProfile):
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._thread_id = threading.get_ident()
+            self._thread = threading.Thread(
+                target=self._run, name="profile-sampler", daemon=True
+            )
+            self._thread.start()
+        self._profiles[task] = profile
+        self._wake.set()
+
+    def end(self, task: asyncio.Task, name: str, status: int):
+        profile = self._profiles.pop(task)
+        duration = time.perf_counter() - profile.started_at
+        self._finished.put((name, status, profile, duration))
+        self._wake.set()
+
+    def _run(self):
+        sampled_at = None
+        while True:
+            if not self._profiles:
+                self._wake.wait()
+                self._wake.clear()
+                sampled_at = None
+            self._write_finished()
+            if self._profiles:
+                now = time.perf_counter()
+                elapsed = now - sampled_at if sampled_at else self.interval
+                self._sample(elapsed)
+                sampled_at = now
+                time.sleep(self.interval)
+
+    def _sample(self, elapsed: float):
+        task = asyncio.current_task(self._loop)
+        profile = self._profiles.get(task)
+        frame = sys._current_frames().get(self._thread_id)
+        if profile is not None and frame is not None:
+            profile.stacks[_collapse(frame)] += round(elapsed * 1_000_000)
+
+    def _write_finished(self):
+        while True:
+            try:
+                name, status, profile, duration = self._finished.get_nowait()
+            except Empty:
+                return
+            self.writer.write(name, status, profile, duration)
+
+
+class ProfilingMiddleware:
+    """Profiles a fraction of the requests, and those sent by trusted
+    callers with the X-Profile header set to the shared token."""
+
+    def __init__(
+            self,
+            app,
+            fraction: float,
+            token: str,
+            interval: float,
+            directory: str,
+            max_bytes: int,
+            backup_count: int,
+    ):
+        self.app = app
+        self.fraction = fraction
+        self.token = token.encode()
+        self.sampler = StackSampler(
+            interval, ProfileWriter(directory, max_bytes, backup_count)
+        )
+
+    def _trigger(self, scope) -> str | None:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    if hmac.compare_digest(value, self.token):
+                        return "header"
+                    break
+        if self.fraction and random.random() < self.fraction:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        PROFILED_REQUESTS.labels(trigger).inc()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        task = asyncio.current_task()
+        token = _current_profile.set(RequestProfile())
+        self.sampler.begin(task, _current_profile.get())
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            route = scope.get("route")
+            path = route.path if route is not None else scope["path"]
+            self.sampler.end(task, f"{scope['method']} {path}", status_code)
@@ -7,17 +7,87 @@ ROOT_DIR = Path(__file__).resolve().parent.parent.parent
 
 class Settings(BaseSettings):
     project_name: str = "UGC Activity Service"
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: int = 0
+    server_graceful_timeout: float = 30.0
+    server_keep_alive_timeout: int = 75
+    metrics_dir: str = "/tmp/ugc_metrics"
     mongo_host: str = "localhost"
     mongo_port: int = "27017"
     mongo_db: str = "mongoDb"
     bookmark_collection: str = ""
     like_collection: str = ""
     review_collection: str = ""
+    film_stats_collection: str = ""
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: int | None = None
+    mongo_connect_timeout_ms: int = 20000
+    mongo_socket_timeout_ms: int | None = None
+    mongo_server_selection_timeout_ms: int = 30000
+    mongo_wait_queue_timeout_ms: int | None = None
+    # Comma-separated, in order of preference, e.g. "zstd,snappy,zlib"
+    mongo_compressors: str = ""
+    mongo_warm_connections: int = 10
+    mongo_secondary_reads: bool = False
+    mongo_max_staleness_seconds: int = 90
+    bookmark_write_concern: str = ""
+    compact_storage: bool = False
     jwt_secret_key: str = "secret"
-    jwt_algorithm: str = ""
+    jwt_algorithm: str = "HS256"
+    jwt_public_key: str = ""
+    jwt_public_key_path: str = ""
+    jwt_cache_size: int = 10000
+    jwt_cache_ttl: float = 300.0
     sentry_dsn: str = ""
+    trace_target_per_second: float = 1.0
+    # Path prefix -> multiplier of the sample rate
+    trace_route_weights: dict[str, float] = {"/metrics": 0.0}
+    trace_tail_fraction: float = 1.0
+    trace_tail_max_spans: int = 20
+    trace_slow_threshold: float = 1.0
     logstash_host: str = "localhost"
     logstash_port: int = 5044
+    log_queue_size: int = 10000
+    log_batch_size: int = 200
+    log_flush_interval: float = 0.5
+    log_overflow_policy: str = "drop_newest"
+    profile_fraction: float = 0.0
+    profile_token: str = ""
+    profile_interval: float = 0.005
+    profile_dir: str = "profiles"
+    profile_max_bytes: int = 10 * 2 ** 20
+    profile_backup_count: int = 5
+    page_size: int = 50
+    max_page_size: int = 500
+    batch_max_items: int = 500
+    admission_writes_limit: int = 64
+    admission_writes_queue_size: int = 128
+    admission_user_lists_limit: int = 32
+    admission_user_lists_queue_size: int = 64
+    admission_film_aggregates_limit: int = 128
+    admission_film_aggregates_queue_size: int = 256
+    admission_queue_timeout: float = 1.0
+    admission_pool_wait_threshold: float = 0.1
+    admission_retry_after: int = 1
+    cache_backend: str = "memory"
+    cache_ttl: float = 5.0
+    cache_max_size: int = 10000
+    redis_url: str = "redis://localhost:6379/0"
+    write_behind: bool = False
+    write_behind_max_size: int = 50000
+    write_behind_flush_size: int = 1000
+    write_behind_flush_interval: float = 0.2
+    write_behind_put_timeout: float = 1.0
+    write_behind_spill_dir: str = ""
+    export_dir: str = "export"
+    export_checkpoint_dir: str = "export/checkpoints"
+    export_format: str = "ndjson"
+    export_batch_size: int = 1000
+    export_batch_interval: float = 5.0
+    tombstone_retention_days: int = 30
+    archive_dir: str = "archive"
 
     model_config = SettingsConfigDict(
         env_file=ROOT_DIR / ".env", extra="ignore"
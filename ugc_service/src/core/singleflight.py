@@ -0,0 +1,44 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from prometheus_client import Counter
+
+SINGLEFLIGHT_CALLS = Counter(
+    "ugc_singleflight_calls_total",
+    "Reads that started a query (leader) or awaited an in-flight one "
+    "(coalesced)",
+    ["name", "role"],
+)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+
+    The first caller starts the call, callers arriving while it is in
+    flight await the same result. The call runs in its own task, so a
+    cancelled caller (e.g. a closed connection) does not cancel it for
+    the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            SINGLEFLIGHT_CALLS.labels(self.name, "leader").inc()
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._done(key, task))
+        else:
+            SINGLEFLIGHT_CALLS.labels(self.name, "coalesced").inc()
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        del self._calls[key]
+        # Marks the exception as retrieved when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,167 @@
+import random
+import time
+from http import HTTPStatus
+from typing import Any
+
+from prometheus_client import Counter, Gauge
+from sentry_sdk import Hub
+
+TRACE_DECISIONS = Counter(
+    "ugc_trace_sampling_decisions_total",
+    "Sentry trace sampling decisions",
+    ["decision"],
+)
+TRACE_SAMPLE_RATE = Gauge(
+    "ugc_trace_sample_rate",
+    "Current base sample rate of the request traces",
+    multiprocess_mode="liveall",
+)
+
+# Decisions, also stored in the ASGI scope for TraceTailMiddleware
+PARENT = "parent"
+HEAD = "head"
+TENTATIVE = "tentative"
+TAIL_KEPT = "tail_kept"
+TAIL_DROPPED = "tail_dropped"
+DROPPED = "dropped"
+
+SAMPLING_DECISION_KEY = "ugc.trace_sampling"
+
+
+class AdaptiveTracesSampler:
+    """traces_sampler aiming at a fixed number of traces per second.
+
+    The base rate is the target divided by the request rate, smoothed
+    over time, and is multiplied by the weight of the route, matched by
+    the longest path prefix. A decision taken upstream is honoured.
+    A tail_fraction of the requests left out, all of them by default, are
+    still recorded so that TraceTailMiddleware can keep them if they turn
+    out slow or failed.
+    """
+
+    def __init__(
+            self,
+            target_per_second: float,
+            route_weights: dict[str, float],
+            tail_fraction: float,
+            window: float = 1.0,
+            smoothing: float = 0.3,
+    ):
+        self.target_per_second = target_per_second
+        self.route_weights = sorted(
+            route_weights.items(), key=lambda item: len(item[0]), reverse=True
+        )
+        self.tail_fraction = tail_fraction
+        self.window = window
+        self.smoothing = smoothing
+        self.rate = 1.0
+        self._requests_per_second: float | None = None
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        TRACE_SAMPLE_RATE.set(self.rate)
+
+    def __call__(self, sampling_context: dict[str, Any]) -> bool:
+        self._count_request()
+        scope = sampling_context.get("asgi_scope") or {}
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            decision = PARENT
+        elif random.random() < self.rate * self._weight(scope.get("path")):
+            decision = HEAD
+        elif random.random() < self.tail_fraction:
+            decision = TENTATIVE
+        else:
+            decision = DROPPED
+        scope[SAMPLING_DECISION_KEY] = decision
+        if decision != TENTATIVE:
+            TRACE_DECISIONS.labels(decision).inc()
+        if decision == PARENT:
+            return parent_sampled
+        return decision != DROPPED
+
+    def _weight(self, path: str | None) -> float:
+        for prefix, weight in self.route_weights:
+            if path and path.startswith(prefix):
+                return weight
+        return 1.0
+
+    def _count_request(self):
+        self._window_requests += 1
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        requests_per_second = self._window_requests / elapsed
+        if self._requests_per_second is None:
+            self._requests_per_second = requests_per_second
+        else:
+            self._requests_per_second += self.smoothing * (
+                requests_per_second - self._requests_per_second
+            )
+        self.rate = min(
+            1.0, self.target_per_second / max(self._requests_per_second, 1e-9)
+        )
+        TRACE_SAMPLE_RATE.set(self.rate)
+        self._window_start = now
+        self._window_requests = 0
+
+
+class TraceTailMiddleware:
+    """Decides at the end of the request whether a tentatively recorded
+    trace is sent: only if the request was slow or failed. A tentative
+    trace keeps at most max_spans spans, so that recording every request
+    stays cheap. Also names the transactions after the route template
+    instead of the raw path."""
+
+    def __init__(self, app, slow_threshold: float, max_spans: int):
+        self.app = app
+        self.slow_threshold = slow_threshold
+        self.max_spans = max_spans
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if scope.get(SAMPLING_DECISION_KEY) == TENTATIVE:
+            self._limit_spans(Hub.current.scope.transaction)
+
+        status_code = HTTPStatus.INTERNAL_SERVER_ERROR
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = time.monotonic()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._finish(
+                scope, status_code, time.monotonic() - started_at
+            )
+
+    def _limit_spans(self, transaction):
+        # The span recorder is created once sampled, with the max_spans of
+        # the client. The spans beyond it are not kept
+        recorder = getattr(transaction, "_span_recorder", None)
+        if recorder is not None:
+            recorder.maxlen = min(recorder.maxlen, self.max_spans)
+
+    def _finish(self, scope, status_code: int, duration: float):
+        transaction = Hub.current.scope.transaction
+        if transaction is None:
+            return
+        route = scope.get("route")
+        if route is not None:
+            transaction.name = f"{scope['method']} {route.path}"
+        if scope.get(SAMPLING_DECISION_KEY) != TENTATIVE:
+            return
+        if (
+                duration >= self.slow_threshold
+                or status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+        ):
+            TRACE_DECISIONS.labels(TAIL_KEPT).inc()
+        else:
+            transaction.sampled = False
+            TRACE_DECISIONS.labels(TAIL_DROPPED).inc()
@@ -1,40 +1,85 @@
 from contextlib import asynccontextmanager
 
 import sentry_sdk
-from beanie import init_beanie
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import ORJSONResponse
+from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 
+from ugc_service.src.api import metrics
 from ugc_service.src.api.v1 import bookmarks, likes, reviews
+from ugc_service.src.core import logger  # noqa
+from ugc_service.src.core.cache import get_cache
+from ugc_service.src.core.metrics import (
+    RequestMetricsMiddleware,
+    release_worker_metrics,
+)
+from ugc_service.src.core.mongo import init_mongo, warm_up
+from ugc_service.src.core.profiling import ProfilingMiddleware
 from ugc_service.src.core.settings import app_settings
-from ugc_service.src.models.bookmark import Bookmark
-from ugc_service.src.models.like import Like
-from ugc_service.src.models.review import Review
+from ugc_service.src.core.tracing import (
+    AdaptiveTracesSampler,
+    TraceTailMiddleware,
+)
+from ugc_service.src.services.bookmark import bookmark_buffer
+from ugc_service.src.services.like import like_buffer
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    mongo = AsyncIOMotorClient(app_settings.mongo_url)
-    db = mongo[app_settings.mongo_db]
-    await init_beanie(database=db, document_models=[Bookmark, Like, Review])
+    mongo = await init_mongo()
+    await warm_up(mongo, app_settings.mongo_warm_connections)
+    # Flushed on shutdown, before the client is closed
+    buffers = []
+    if app_settings.write_behind:
+        buffers = [like_buffer, bookmark_buffer]
+    for buffer in buffers:
+        await buffer.start()
     yield
+    for buffer in buffers:
+        await buffer.close()
+    await get_cache().close()
     mongo.close()
+    release_worker_metrics()
 
 
 sentry_sdk.init(
     dsn=app_settings.sentry_dsn,
-    traces_sample_rate=1.0,
+    traces_sampler=AdaptiveTracesSampler(
+        app_settings.trace_target_per_second,
+        app_settings.trace_route_weights,
+        app_settings.trace_tail_fraction,
+    ),
 )
 
 app = FastAPI(
     title=app_settings.project_name,
     docs_url="/api/docs",
     openapi_url="/api/openapi.json",
-    default_response_class=JSONResponse,
+    default_response_class=ORJSONResponse,
     lifespan=lifespan,
 )
 
+# The last added runs first: the Sentry transaction must be open in
+# TraceTailMiddleware
+app.add_middleware(
+    TraceTailMiddleware,
+    slow_threshold=app_settings.trace_slow_threshold,
+    max_spans=app_settings.trace_tail_max_spans,
+)
+app.add_middleware(SentryAsgiMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
+if app_settings.profile_fraction or app_settings.profile_token:
+    app.add_middleware(
+        ProfilingMiddleware,
+        fraction=app_settings.profile_fraction,
+        token=app_settings.profile_token,
+        interval=app_settings.profile_interval,
+        directory=app_settings.profile_dir,
+        max_bytes=app_settings.profile_max_bytes,
+        backup_count=app_settings.profile_backup_count,
+    )
+
 app.include_router(bookmarks.router)
 app.include_router(likes.router)
 app.include_router(reviews.router)
+app.include_router(metrics.router)
@@ -0,0 +1,57 @@
+"""Names under which the fields of the bookmarks, likes and reviews are
+stored.
+
+Field names are repeated in every document and in every index entry of a
+compound index, and they make up a good part of these small documents.
+With compact_storage they are stored under one-letter names. The models
+keep their field names, which are mapped to the stored names by aliases,
+so only the raw queries have to refer to the stored names, through F.
+"""
+from dataclasses import asdict, dataclass
+
+from ugc_service.src.core.settings import app_settings
+
+
+@dataclass(frozen=True)
+class StoredNames:
+    user_id: str = "user_id"
+    film_id: str = "film_id"
+    rating: str = "rating"
+    text: str = "text"
+    created_at: str = "created_at"
+    updated_at: str = "updated_at"
+    is_deleted: str = "is_deleted"
+
+
+LONG_NAMES = StoredNames()
+COMPACT_NAMES = StoredNames(
+    user_id="u",
+    film_id="f",
+    rating="r",
+    text="t",
+    created_at="c",
+    updated_at="m",
+    is_deleted="d",
+)
+F = COMPACT_NAMES if app_settings.compact_storage else LONG_NAMES
+
+_STORED = asdict(F)
+_FIELDS = {stored: field for field, stored in _STORED.items()}
+
+
+def to_stored_names(fields: dict) -> dict:
+    """Rename the fields of a document to their stored names."""
+    return {_STORED.get(name, name): value for name, value in fields.items()}
+
+
+def to_field_names(document: dict) -> dict:
+    """Rename the stored fields of a raw document to the field names."""
+    return {
+        _FIELDS.get(name, name): value for name, value in document.items()
+    }
+
+
+def field_projection(*names: str) -> dict:
+    """Projection of find or $project returning the stored fields under
+    their field names, so that the rows need no renaming."""
+    return {name: f"${getattr(F, name)}" for name in names}
@@ -0,0 +1,27 @@
+from uuid import UUID
+
+from beanie import Document
+from pydantic import Field
+
+from ugc_service.src.core.settings import app_settings
+
+
+class FilmStats(Document):
+    """Like statistics of a film, maintained by LikeService on every write.
+
+    The id is the film id. The histogram maps a rating (as a string, 0-10)
+    to the number of active likes with that rating.
+    """
+    id: UUID
+    like_count: int = Field(default=0)
+    rating_sum: int = Field(default=0)
+    histogram: dict[str, int] = Field(default_factory=dict)
+
+    class Settings:
+        name = app_settings.film_stats_collection
+
+    @property
+    def average_rating(self) -> float | None:
+        if self.like_count <= 0:
+            return None
+        return self.rating_sum / self.like_count
@@ -3,18 +3,56 @@ from uuid import UUID, uuid4
 
 from beanie import Document
 from pydantic import Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 from ugc_service.src.core.settings import app_settings
+from ugc_service.src.models.fields import F
 
 
 class Review(Document):
     id: UUID = Field(default_factory=uuid4)
-    user_id: UUID
-    film_id: UUID
-    text: str = Field(max_length=5000)
-    created_at: datetime
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
-    is_deleted: bool = Field(default=False)
+    user_id: UUID = Field(alias=F.user_id)
+    film_id: UUID = Field(alias=F.film_id)
+    text: str = Field(max_length=5000, alias=F.text)
+    created_at: datetime = Field(alias=F.created_at)
+    updated_at: datetime = Field(
+        default_factory=lambda: datetime.now(UTC), alias=F.updated_at
+    )
+    is_deleted: bool = Field(default=False, alias=F.is_deleted)
 
     class Settings:
         name = app_settings.review_collection
+        indexes = [
+            # Shard key index, must not be partial. Unique, so that a user
+            # has at most one document per film, deleted or not. Created
+            # under this name by mongodb.sh and the reshard command
+            IndexModel(
+                [(F.film_id, ASCENDING), (F.user_id, ASCENDING)],
+                name="film_user",
+                unique=True,
+            ),
+            IndexModel(
+                [
+                    (F.user_id, ASCENDING),
+                    (F.created_at, DESCENDING),
+                    ("_id", DESCENDING),
+                ],
+                name="user_created_id_active",
+                partialFilterExpression={F.is_deleted: False},
+            ),
+            IndexModel(
+                [
+                    (F.film_id, ASCENDING),
+                    (F.created_at, DESCENDING),
+                    ("_id", DESCENDING),
+                ],
+                name="film_created_id_active",
+                partialFilterExpression={F.is_deleted: False},
+            ),
+            # Tombstones, removed by the compact command
+            IndexModel(
+                [(F.updated_at, ASCENDING)],
+                name="deleted_updated",
+                partialFilterExpression={F.is_deleted: True},
+            ),
+        ]
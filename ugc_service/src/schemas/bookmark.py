@@ -4,6 +4,10 @@ from uuid import UUID
 from pydantic import BaseModel
 
 
+class BookmarkInput(BaseModel):
+    film_id: UUID
+
+
 class BookmarkOutput(BaseModel):
     film_id: UUID
     created_at: datetime
@@ -1,7 +1,29 @@
+from enum import StrEnum
+from typing import Any
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from ugc_service.src.core.settings import app_settings
 
 
 class NewDocument(BaseModel):
     id: UUID
+
+
+class BatchInput(BaseModel):
+    items: list[dict[str, Any]] = Field(
+        min_length=1, max_length=app_settings.batch_max_items
+    )
+
+
+class BatchItemStatus(StrEnum):
+    CREATED = "created"
+    ALREADY_EXISTS = "already_exists"
+    INVALID = "invalid"
+
+
+class BatchItemResult(BaseModel):
+    status: BatchItemStatus
+    id: UUID | None = None
+    detail: str | None = None
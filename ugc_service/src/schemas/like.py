@@ -14,3 +14,9 @@ class LikeOutput(BaseModel):
     rating: int
     created_at: datetime
     updated_at: datetime
+
+
+class FilmStatsOutput(BaseModel):
+    film_id: UUID
+    count: int
+    average_rating: float | None = None
@@ -0,0 +1,106 @@
+"""Production server: uvicorn workers running ugc_service.src.main:app.
+
+There is one worker per CPU available to the process, as limited by its
+CPU affinity and the cgroup CPU quota of the container, unless
+SERVER_WORKERS is set. The workers are processes sharing the listening
+socket, each with its own event loop (uvloop), HTTP parser (httptools)
+and Motor client. A worker runs the app lifespan, which opens and warms
+its connection pool, before it accepts connections, and the supervisor
+replaces a worker that dies. Pools, write-behind buffers and the memory
+cache are per worker: up to SERVER_WORKERS x MONGO_MAX_POOL_SIZE
+connections are opened to Mongo.
+
+On SIGTERM or SIGINT the workers stop accepting connections, finish the
+requests in flight within SERVER_GRACEFUL_TIMEOUT seconds and run the
+lifespan shutdown, which flushes the write-behind buffers.
+
+With several workers the Prometheus metrics are kept in files in
+METRICS_DIR, emptied on start, and /metrics aggregates those of all the
+workers.
+
+Usage:
+    python -m ugc_service.src.server [--workers N] [--host HOST]
+        [--port PORT]
+"""
+import argparse
+import math
+import os
+import shutil
+from pathlib import Path
+
+import uvicorn
+
+from ugc_service.src.core.settings import app_settings
+
+APP = "ugc_service.src.main:app"
+CGROUP_V2_CPU_MAX = Path("/sys/fs/cgroup/cpu.max")
+CGROUP_V1_CPU_QUOTA = Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+CGROUP_V1_CPU_PERIOD = Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+
+
+def _cgroup_cpu_quota() -> float | None:
+    """CPUs allowed by the cgroup quota, None without a quota."""
+    try:
+        if CGROUP_V2_CPU_MAX.exists():
+            quota, period = CGROUP_V2_CPU_MAX.read_text().split()
+            if quota == "max":
+                return None
+            return int(quota) / int(period)
+        quota = int(CGROUP_V1_CPU_QUOTA.read_text())
+        if quota <= 0:
+            return None
+        return quota / int(CGROUP_V1_CPU_PERIOD.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+
+def _prepare_metrics_dir():
+    # Read by prometheus_client when the workers import it. The files of
+    # a previous run would add up with the new ones
+    directory = Path(app_settings.metrics_dir)
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(directory)
+
+
+def main(workers: int, host: str, port: int):
+    workers = workers or available_cpus()
+    if workers > 1:
+        _prepare_metrics_dir()
+    uvicorn.run(
+        APP,
+        host=host,
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        timeout_graceful_shutdown=app_settings.server_graceful_timeout,
+        # Longer than the keepalive_timeout of the nginx upstream, so that
+        # nginx never reuses a connection the worker is closing
+        timeout_keep_alive=app_settings.server_keep_alive_timeout,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the UGC API")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=app_settings.server_workers,
+        help="worker processes, 0 for one per available CPU",
+    )
+    parser.add_argument("--host", default=app_settings.server_host)
+    parser.add_argument("--port", type=int, default=app_settings.server_port)
+    args = parser.parse_args()
+    main(args.workers, args.host, args.port)
@@ -0,0 +1,108 @@
+from datetime import datetime, UTC
+from uuid import UUID, uuid4
+
+from pydantic import BaseModel, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ugc_service.src.models.fields import F
+from ugc_service.src.schemas.common import BatchItemResult, BatchItemStatus
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def validate_items(
+        items: list[dict], schema: type[BaseModel]
+) -> tuple[dict[int, BaseModel], dict[int, BatchItemResult]]:
+    """Split the raw batch items into valid inputs and invalid results,
+    both keyed by the position of the item in the batch."""
+    inputs, results = {}, {}
+    for position, item in enumerate(items):
+        try:
+            inputs[position] = schema.model_validate(item)
+        except ValidationError as error:
+            results[position] = BatchItemResult(
+                status=BatchItemStatus.INVALID,
+                detail="; ".join(
+                    f"{'.'.join(map(str, details['loc']))}: {details['msg']}"
+                    for details in error.errors()
+                ),
+            )
+    return inputs, results
+
+
+async def bulk_create(
+        collection, user_id: str, documents: dict[int, dict]
+) -> dict[int, BatchItemResult]:
+    """Create the documents of a user as one unordered bulk write.
+
+    Each document is the same upsert as a single create: it reactivates a
+    deleted document of the user for the film or inserts a new one, and
+    hits the unique (user_id, film_id) index if an active one exists.
+    `documents` maps the position of an item in the batch to its fields by
+    their stored names (see models.fields), film_id included.
+    """
+    if not documents:
+        return {}
+    now = datetime.now(UTC)
+    positions = list(documents)
+    requests = [
+        UpdateOne(
+            {
+                F.user_id: UUID(user_id),
+                F.film_id: documents[position][F.film_id],
+                F.is_deleted: True,
+            },
+            {
+                "$set": {
+                    **documents[position],
+                    F.is_deleted: False,
+                    F.created_at: now,
+                    F.updated_at: now,
+                },
+                "$setOnInsert": {"_id": uuid4()},
+            },
+            upsert=True,
+        )
+        for position in positions
+    ]
+    try:
+        result = await collection.bulk_write(requests, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as error:
+        details = error.details
+
+    results = {}
+    for error in details["writeErrors"]:
+        results[positions[error["index"]]] = BatchItemResult(
+            status=(
+                BatchItemStatus.ALREADY_EXISTS
+                if error["code"] == DUPLICATE_KEY_ERROR
+                else BatchItemStatus.INVALID
+            ),
+            detail=error["errmsg"],
+        )
+    for upserted in details["upserted"]:
+        results[positions[upserted["index"]]] = BatchItemResult(
+            status=BatchItemStatus.CREATED, id=upserted["_id"]
+        )
+
+    # Reactivated documents keep their id, which the bulk write does not
+    # return
+    reactivated = {
+        documents[position][F.film_id]: position
+        for position in positions
+        if position not in results
+    }
+    if reactivated:
+        async for document in collection.find(
+                {
+                    F.user_id: UUID(user_id),
+                    F.film_id: {"$in": list(reactivated)},
+                },
+                projection={F.film_id: True},
+        ):
+            results[reactivated[document[F.film_id]]] = BatchItemResult(
+                status=BatchItemStatus.CREATED, id=document["_id"]
+            )
+    return results
@@ -1,47 +1,128 @@
 from datetime import datetime, UTC
-from uuid import UUID
+from typing import AsyncIterator
+from uuid import UUID, uuid4
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 from ugc_service.src.core.exceptions import (
     AlreadyExistsException,
     NotFoundException,
 )
+from ugc_service.src.core.mongo import with_write_concern
+from ugc_service.src.core.pagination import (
+    KEYSET_SORT,
+    keyset_filter,
+    paginate_rows,
+)
+from ugc_service.src.core.settings import app_settings
 from ugc_service.src.models.bookmark import Bookmark
+from ugc_service.src.models.fields import F, field_projection
+from ugc_service.src.schemas.bookmark import BookmarkInput
+from ugc_service.src.schemas.common import BatchItemResult
+from ugc_service.src.services.batch import bulk_create, validate_items
+from ugc_service.src.services.write_behind import bulk_apply, create_buffer
+
+# Rows shaped like BookmarkOutput, sent as they come from Mongo
+BOOKMARK_ROW = field_projection("film_id", "created_at")
 
 
 class BookmarkService:
 
     def __init__(self):
-        self.model = Bookmark
-
-    async def _get_one(self, user_id: str, film_id: UUID) -> Bookmark:
-        return await self.model.find_one(
-            self.model.user_id == UUID(user_id),
-            self.model.film_id == film_id,
-            self.model.is_deleted == False,  # noqa
+        self.collection = with_write_concern(
+            Bookmark.get_motor_collection(),
+            app_settings.bookmark_write_concern,
         )
 
-    async def create(self, user_id: str, film_id: UUID) -> UUID:
-        bookmark = await self._get_one(user_id, film_id)
-        if bookmark:
+    @staticmethod
+    def _get_filter(
+            user_id: str, film_id: UUID, is_deleted: bool = False
+    ) -> dict:
+        return {
+            F.user_id: UUID(user_id),
+            F.film_id: film_id,
+            F.is_deleted: is_deleted,
+        }
+
+    async def create(self, user_id: str, film_id: UUID) -> UUID | None:
+        # None when the bookmark is buffered: it is written later, if at all
+        if app_settings.write_behind:
+            await bookmark_buffer.put(UUID(user_id), film_id, {}, upsert=True)
+            return None
+        now = datetime.now(UTC)
+        try:
+            # Reactivates a deleted bookmark or inserts a new one. An active
+            # bookmark is not matched, so the upsert hits the unique index
+            bookmark = await self.collection.find_one_and_update(
+                self._get_filter(user_id, film_id, is_deleted=True),
+                {
+                    "$set": {
+                        F.is_deleted: False,
+                        F.created_at: now,
+                        F.updated_at: now,
+                    },
+                    "$setOnInsert": {"_id": uuid4()},
+                },
+                projection={"_id": True},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
             raise AlreadyExistsException
-        new_bookmark = await self.model(
-            user_id=user_id,
-            film_id=film_id,
-            created_at=datetime.now(UTC),
-        ).insert()  # noqa
-        return new_bookmark.id
-
-    async def get_by_user_id(self, user_id: str) -> list[Bookmark]:
-        bookmarks = await self.model.find(
-            self.model.user_id == UUID(user_id),
-            self.model.is_deleted == False,  # noqa
-        ).to_list()
-        return bookmarks
+        return bookmark["_id"]
+
+    async def create_many(
+            self, user_id: str, items: list[dict]
+    ) -> list[BatchItemResult]:
+        inputs, results = validate_items(items, BookmarkInput)
+        await bookmark_buffer.flush_pending(
+            *((UUID(user_id), bookmark_input.film_id)
+              for bookmark_input in inputs.values())
+        )
+        results |= await bulk_create(
+            self.collection,
+            user_id,
+            {
+                position: {F.film_id: bookmark_input.film_id}
+                for position, bookmark_input in inputs.items()
+            },
+        )
+        return [results[position] for position in range(len(items))]
+
+    def _find_by_user_id(
+            self, user_id: str, cursor: str | None, projection: dict
+    ):
+        filters = {F.user_id: UUID(user_id), F.is_deleted: False}
+        filters.update(keyset_filter(cursor))
+        return self.collection.find(filters, projection).sort(KEYSET_SORT)
+
+    async def get_by_user_id(
+            self, user_id: str, limit: int, cursor: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        bookmarks = await self._find_by_user_id(
+            user_id, cursor, BOOKMARK_ROW
+        ).limit(limit + 1).to_list()
+        return paginate_rows(bookmarks, limit)
+
+    def stream_by_user_id(
+            self, user_id: str, cursor: str | None = None
+    ) -> AsyncIterator[dict]:
+        return self._find_by_user_id(
+            user_id, cursor, {"_id": 0, **BOOKMARK_ROW}
+        )
 
     async def delete(self, user_id: str, film_id: UUID):
-        bookmark = await self._get_one(user_id, film_id)
-        if not bookmark:
+        await bookmark_buffer.flush_pending((UUID(user_id), film_id))
+        result = await self.collection.update_one(
+            self._get_filter(user_id, film_id),
+            {"$set": {F.is_deleted: True, F.updated_at: datetime.now(UTC)}},
+        )
+        if not result.matched_count:
             raise NotFoundException
-        bookmark.is_deleted = True
-        bookmark.updated_at = datetime.now(UTC)
-        await bookmark.save()  # noqa
+
+
+bookmark_buffer = create_buffer(
+    "bookmarks",
+    lambda entries: bulk_apply(BookmarkService().collection, entries),
+)
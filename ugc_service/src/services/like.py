@@ -1,73 +1,384 @@
+import logging
 from datetime import datetime, UTC
-from uuid import UUID
+from typing import AsyncIterator
+from uuid import UUID, uuid4
 
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from ugc_service.src.core.cache import (
+    MISSING,
+    film_reviews_key,
+    film_stats_key,
+    film_stats_value_key,
+    get_cache,
+)
 from ugc_service.src.core.exceptions import (
     AlreadyExistsException,
     NotFoundException,
 )
+from ugc_service.src.core.mongo import read_only
+from ugc_service.src.core.pagination import (
+    KEYSET_SORT,
+    keyset_filter,
+    paginate_rows,
+)
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.core.singleflight import SingleFlight
+from ugc_service.src.models.fields import (
+    F,
+    field_projection,
+    to_stored_names,
+)
+from ugc_service.src.models.film_stats import FilmStats
 from ugc_service.src.models.like import Like
-from ugc_service.src.schemas.like import LikeInput
+from ugc_service.src.schemas.common import BatchItemResult, BatchItemStatus
+from ugc_service.src.schemas.like import FilmStatsOutput, LikeInput
+from ugc_service.src.services.batch import bulk_create, validate_items
+from ugc_service.src.services.write_behind import (
+    Key,
+    PendingWrite,
+    bulk_apply,
+    create_buffer,
+)
+
+logger = logging.getLogger(__name__)
+
+film_stats_flight = SingleFlight("film_stats")
+# Rows shaped like LikeOutput, sent as they come from Mongo
+LIKE_ROW = field_projection("film_id", "rating", "created_at", "updated_at")
 
 
 class LikeService:
 
     def __init__(self):
-        self.model = Like
+        self.collection = Like.get_motor_collection()
+        self.stats_collection = FilmStats.get_motor_collection()
+        self.stats_reader = read_only(self.stats_collection)
+        self.cache = get_cache()
+
+    @staticmethod
+    def _get_filter(
+            user_id: str, film_id: UUID, is_deleted: bool = False
+    ) -> dict:
+        return {
+            F.user_id: UUID(user_id),
+            F.film_id: film_id,
+            F.is_deleted: is_deleted,
+        }
 
-    async def _get_one(self, user_id: str, film_id: UUID) -> Like:
-        return await self.model.find_one(
-            self.model.user_id == UUID(user_id),
-            self.model.film_id == film_id,
-            self.model.is_deleted == False,  # noqa
+    @staticmethod
+    def _get_stats_increments(
+            added: int | None = None, removed: int | None = None
+    ) -> dict:
+        increments = {}
+        for rating, delta in ((added, 1), (removed, -1)):
+            if rating is None:
+                continue
+            for field, value in (
+                    ("like_count", delta),
+                    ("rating_sum", delta * rating),
+                    (f"histogram.{rating}", delta),
+            ):
+                increments[field] = increments.get(field, 0) + value
+        return {field: value for field, value in increments.items() if value}
+
+    async def _update_stats(
+            self,
+            film_id: UUID,
+            added: int | None = None,
+            removed: int | None = None,
+    ):
+        increments = self._get_stats_increments(added, removed)
+        if increments:
+            await self.stats_collection.update_one(
+                {"_id": film_id}, {"$inc": increments}, upsert=True
+            )
+            # Film reviews show the rating of each reviewer
+            await self.cache.delete(
+                film_stats_key(film_id), film_reviews_key(film_id)
+            )
+
+    @staticmethod
+    def _to_stats_output(
+            film_id: UUID, film_stats: dict | None
+    ) -> FilmStatsOutput:
+        if not film_stats:
+            return FilmStatsOutput(film_id=film_id, count=0)
+        film_stats = FilmStats.model_validate(film_stats)
+        return FilmStatsOutput(
+            film_id=film_id,
+            count=film_stats.like_count,
+            average_rating=film_stats.average_rating,
+        )
+
+    async def _load_film_stats(
+            self, film_id: UUID, key: str
+    ) -> FilmStatsOutput:
+        stats = self._to_stats_output(
+            film_id, await self.stats_reader.find_one({"_id": film_id})
         )
+        await self.cache.set(key, stats)
+        return stats
 
-    async def create(self, user_id: str, like_input: LikeInput) -> UUID:
-        like = await self._get_one(user_id, like_input.film_id)
-        if like:
+    async def _get_film_stats(self, film_id: UUID) -> FilmStatsOutput:
+        # Versioned, so that stats read before a like write are not cached
+        # after its invalidation
+        version = await self.cache.get_version(film_stats_key(film_id))
+        key = film_stats_value_key(film_id, version)
+        stats = await self.cache.get(key)
+        if stats is MISSING:
+            stats = await film_stats_flight.do(
+                key, lambda: self._load_film_stats(film_id, key)
+            )
+        return stats
+
+    async def create(
+            self, user_id: str, like_input: LikeInput
+    ) -> UUID | None:
+        # None when the like is buffered: it is written later, if at all
+        if app_settings.write_behind:
+            await like_buffer.put(
+                UUID(user_id),
+                like_input.film_id,
+                {F.rating: like_input.rating},
+                upsert=True,
+            )
+            return None
+        now = datetime.now(UTC)
+        try:
+            # Reactivates a deleted like or inserts a new one. An active
+            # like is not matched, so the upsert hits the unique index
+            like = await self.collection.find_one_and_update(
+                self._get_filter(user_id, like_input.film_id, is_deleted=True),
+                {
+                    "$set": {
+                        F.rating: like_input.rating,
+                        F.is_deleted: False,
+                        F.created_at: now,
+                        F.updated_at: now,
+                    },
+                    "$setOnInsert": {"_id": uuid4()},
+                },
+                projection={"_id": True},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
             raise AlreadyExistsException
-        new_like = await self.model(
-            user_id=user_id,
-            film_id=like_input.film_id,
-            rating=like_input.rating,
-            created_at=datetime.now(UTC),
-        ).insert()  # noqa
-        return new_like.id
-
-    async def get_by_user_id(self, user_id: str) -> list[Like]:
-        likes = await self.model.find(
-            self.model.user_id == UUID(user_id),
-            self.model.is_deleted == False,  # noqa
-        ).to_list()
-        return likes
+        await self._update_stats(like_input.film_id, added=like_input.rating)
+        return like["_id"]
+
+    async def create_many(
+            self, user_id: str, items: list[dict]
+    ) -> list[BatchItemResult]:
+        inputs, results = validate_items(items, LikeInput)
+        await like_buffer.flush_pending(
+            *((UUID(user_id), like_input.film_id)
+              for like_input in inputs.values())
+        )
+        results |= await bulk_create(
+            self.collection,
+            user_id,
+            {
+                position: to_stored_names(like_input.model_dump())
+                for position, like_input in inputs.items()
+            },
+        )
+        created = [
+            like_input
+            for position, like_input in inputs.items()
+            if results[position].status == BatchItemStatus.CREATED
+        ]
+        if created:
+            await self.stats_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": like_input.film_id},
+                        {
+                            "$inc": self._get_stats_increments(
+                                added=like_input.rating
+                            )
+                        },
+                        upsert=True,
+                    )
+                    for like_input in created
+                ],
+                ordered=False,
+            )
+            await self.cache.delete(
+                *{key(like_input.film_id)
+                  for like_input in created
+                  for key in (film_stats_key, film_reviews_key)}
+            )
+        return [results[position] for position in range(len(items))]
+
+    def _find_by_user_id(
+            self, user_id: str, cursor: str | None, projection: dict
+    ):
+        filters = {F.user_id: UUID(user_id), F.is_deleted: False}
+        filters.update(keyset_filter(cursor))
+        return self.collection.find(filters, projection).sort(KEYSET_SORT)
+
+    async def get_by_user_id(
+            self, user_id: str, limit: int, cursor: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        likes = await self._find_by_user_id(
+            user_id, cursor, LIKE_ROW
+        ).limit(limit + 1).to_list()
+        return paginate_rows(likes, limit)
+
+    def stream_by_user_id(
+            self, user_id: str, cursor: str | None = None
+    ) -> AsyncIterator[dict]:
+        return self._find_by_user_id(user_id, cursor, {"_id": 0, **LIKE_ROW})
 
     async def count_by_film_id(self, film_id: UUID) -> int:
-        count = await self.model.find(
-            self.model.film_id == film_id,
-            self.model.is_deleted == False,  # noqa
-        ).count()
-        return count
-
-    async def calculate_average_rating(self, film_id) -> float:
-        avg = await self.model.find(
-            self.model.film_id == film_id,
-            self.model.is_deleted == False,  # noqa
-        ).avg(self.model.rating)
-        if not avg:
+        stats = await self._get_film_stats(film_id)
+        return stats.count
+
+    async def calculate_average_rating(self, film_id: UUID) -> float:
+        stats = await self._get_film_stats(film_id)
+        if stats.average_rating is None:
             raise NotFoundException
-        return avg
+        return stats.average_rating
+
+    async def get_stats(
+            self, film_ids: list[UUID]
+    ) -> list[FilmStatsOutput]:
+        # Catalogue pages shown to many users at once ask for the same films
+        return await film_stats_flight.do(
+            tuple(film_ids), lambda: self._load_stats(film_ids)
+        )
+
+    async def _load_stats(
+            self, film_ids: list[UUID]
+    ) -> list[FilmStatsOutput]:
+        stats = {
+            film_stats["_id"]: film_stats
+            async for film_stats in self.stats_reader.find(
+                {"_id": {"$in": film_ids}}
+            )
+        }
+        return [
+            self._to_stats_output(film_id, stats.get(film_id))
+            for film_id in film_ids
+        ]
 
     async def update(self, user_id: str, like_input: LikeInput):
-        like = await self._get_one(user_id, like_input.film_id)
+        if app_settings.write_behind:
+            await like_buffer.put(
+                UUID(user_id),
+                like_input.film_id,
+                {F.rating: like_input.rating},
+                upsert=False,
+            )
+            return
+        like = await self.collection.find_one_and_update(
+            self._get_filter(user_id, like_input.film_id),
+            {
+                "$set": {
+                    F.rating: like_input.rating,
+                    F.updated_at: datetime.now(UTC),
+                }
+            },
+            projection={F.rating: True},
+            return_document=ReturnDocument.BEFORE,
+        )
         if not like:
             raise NotFoundException
-        like.rating = like_input.rating
-        like.updated_at = datetime.now(UTC)
-        await like.save()  # noqa
+        await self._update_stats(
+            like_input.film_id, added=like_input.rating, removed=like[F.rating]
+        )
 
     async def delete(self, user_id: str, film_id: UUID):
-        like = await self._get_one(user_id, film_id)
+        await like_buffer.flush_pending((UUID(user_id), film_id))
+        like = await self.collection.find_one_and_update(
+            self._get_filter(user_id, film_id),
+            {"$set": {F.is_deleted: True, F.updated_at: datetime.now(UTC)}},
+            projection={F.rating: True},
+            return_document=ReturnDocument.BEFORE,
+        )
         if not like:
             raise NotFoundException
-        like.is_deleted = True
-        like.updated_at = datetime.now(UTC)
-        await like.save()  # noqa
+        await self._update_stats(film_id, removed=like[F.rating])
+
+    async def write_buffered(self, entries: dict[Key, PendingWrite]):
+        """Writer of the write-behind buffer. The film stats deltas are
+        computed from the likes read just before the bulk write, for the
+        writes that were applied."""
+        current = {
+            (like[F.user_id], like[F.film_id]): like
+            async for like in self.collection.find(
+                {
+                    "$or": [
+                        {F.user_id: user_id, F.film_id: film_id}
+                        for user_id, film_id in entries
+                    ]
+                },
+                projection={
+                    F.user_id: True,
+                    F.film_id: True,
+                    F.rating: True,
+                    F.is_deleted: True,
+                },
+            )
+        }
+        applied = await bulk_apply(self.collection, entries)
+
+        increments = {}
+        for key in applied:
+            pending = entries[key]
+            like = current.get(key)
+            removed = (
+                like[F.rating] if like and not like[F.is_deleted] else None
+            )
+            # An update without an active like matches nothing
+            added = (
+                pending.fields[F.rating]
+                if pending.upsert or removed is not None
+                else None
+            )
+            film_increments = increments.setdefault(key[1], {})
+            for field, value in self._get_stats_increments(
+                    added, removed
+            ).items():
+                film_increments[field] = film_increments.get(field, 0) + value
+        requests = []
+        for film_id, film_increments in increments.items():
+            film_increments = {
+                field: value
+                for field, value in film_increments.items()
+                if value
+            }
+            if film_increments:
+                requests.append(
+                    UpdateOne(
+                        {"_id": film_id},
+                        {"$inc": film_increments},
+                        upsert=True,
+                    )
+                )
+        if requests:
+            try:
+                await self.stats_collection.bulk_write(
+                    requests, ordered=False
+                )
+            except PyMongoError:
+                # Raising would requeue the likes, which are written. The
+                # film_stats command fixes the drift
+                logger.exception(
+                    "Stats of %s films not updated after a write-behind "
+                    "flush",
+                    len(requests),
+                )
+        await self.cache.delete(
+            *{key(film_id)
+              for film_id in increments
+              for key in (film_stats_key, film_reviews_key)}
+        )
+
+
+like_buffer = create_buffer(
+    "likes", lambda entries: LikeService().write_buffered(entries)
+)
@@ -1,88 +1,242 @@
 from datetime import datetime, UTC
-from uuid import UUID
+from typing import AsyncIterator
+from uuid import UUID, uuid4
 
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ugc_service.src.core.cache import (
+    MISSING,
+    film_reviews_key,
+    film_reviews_page_key,
+    get_cache,
+)
 from ugc_service.src.core.exceptions import (
     AlreadyExistsException,
     NotFoundException,
 )
+from ugc_service.src.core.mongo import read_only
+from ugc_service.src.core.pagination import (
+    KEYSET_SORT,
+    keyset_filter,
+    paginate_rows,
+)
+from ugc_service.src.core.singleflight import SingleFlight
+from ugc_service.src.models.fields import (
+    F,
+    field_projection,
+    to_stored_names,
+)
 from ugc_service.src.models.like import Like
 from ugc_service.src.models.review import Review
-from ugc_service.src.schemas.review import ReviewInput, ReviewOutput
+from ugc_service.src.schemas.common import BatchItemResult
+from ugc_service.src.schemas.review import ReviewInput
+from ugc_service.src.services.batch import bulk_create, validate_items
+
+film_reviews_flight = SingleFlight("film_reviews")
 
 
 class ReviewService:
 
     def __init__(self):
-        self.model = Review
+        self.collection = Review.get_motor_collection()
+        self.reader = read_only(self.collection)
         self.like_collection = Like.get_collection_name()
+        self.cache = get_cache()
 
-    async def _get_one(self, user_id: str, film_id: UUID) -> Review:
-        return await self.model.find_one(
-            self.model.user_id == UUID(user_id),
-            self.model.film_id == film_id,
-            self.model.is_deleted == False,  # noqa
-        )
+    @staticmethod
+    def _get_filter(
+            user_id: str, film_id: UUID, is_deleted: bool = False
+    ) -> dict:
+        return {
+            F.user_id: UUID(user_id),
+            F.film_id: film_id,
+            F.is_deleted: is_deleted,
+        }
 
     async def create(self, user_id: str, review_input: ReviewInput) -> UUID:
-        review = await self._get_one(user_id, review_input.film_id)
-        if review:
+        now = datetime.now(UTC)
+        try:
+            # Reactivates a deleted review or inserts a new one. An active
+            # review is not matched, so the upsert hits the unique index
+            review = await self.collection.find_one_and_update(
+                self._get_filter(
+                    user_id, review_input.film_id, is_deleted=True
+                ),
+                {
+                    "$set": {
+                        F.text: review_input.text,
+                        F.is_deleted: False,
+                        F.created_at: now,
+                        F.updated_at: now,
+                    },
+                    "$setOnInsert": {"_id": uuid4()},
+                },
+                projection={"_id": True},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
             raise AlreadyExistsException
-        new_review = await self.model(
-            user_id=user_id,
-            film_id=review_input.film_id,
-            text=review_input.text,
-            created_at=datetime.now(UTC),
-        ).insert()  # noqa
-        return new_review.id
+        await self.cache.delete(film_reviews_key(review_input.film_id))
+        return review["_id"]
 
-    async def get_all(
-            self, user_id: str = None, film_id: UUID = None
-    ) -> list[ReviewOutput]:
-        filters = {"is_deleted": False}
+    async def create_many(
+            self, user_id: str, items: list[dict]
+    ) -> list[BatchItemResult]:
+        inputs, results = validate_items(items, ReviewInput)
+        results |= await bulk_create(
+            self.collection,
+            user_id,
+            {
+                position: to_stored_names(review_input.model_dump())
+                for position, review_input in inputs.items()
+            },
+        )
+        await self.cache.delete(
+            *{film_reviews_key(review_input.film_id)
+              for review_input in inputs.values()}
+        )
+        return [results[position] for position in range(len(items))]
+
+    def _aggregate_all(
+            self,
+            user_id: str | None,
+            film_id: UUID | None,
+            cursor: str | None,
+            limit: int | None = None,
+    ):
+        filters = {F.is_deleted: False}
         if user_id:
-            filters["user_id"] = UUID(user_id)
+            filters[F.user_id] = UUID(user_id)
         elif film_id:
-            filters["film_id"] = film_id
-        pipeline = [
+            filters[F.film_id] = film_id
+        filters.update(keyset_filter(cursor))
+        pipeline = [{"$sort": dict(KEYSET_SORT)}]
+        if limit:
+            pipeline.append({"$limit": limit})
+        # Attaches the reviewer's own rating of the film, so every review
+        # yields exactly one row. Served by the unique film_user index
+        pipeline += [
             {
                 "$lookup": {
                     "from": self.like_collection,
-                    "localField": "film_id",
-                    "foreignField": "film_id",
-                    "as": "likes",
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$likes",
-                    "preserveNullAndEmptyArrays": True,
+                    "localField": F.film_id,
+                    "foreignField": F.film_id,
+                    "let": {"user_id": f"${F.user_id}"},
+                    "pipeline": [
+                        {
+                            "$match": {
+                                "$expr": {
+                                    "$eq": [f"${F.user_id}", "$$user_id"]
+                                },
+                                F.is_deleted: False,
+                            }
+                        },
+                        {"$limit": 1},
+                        {"$project": {"_id": 0, F.rating: 1}},
+                    ],
+                    "as": "like",
                 }
             },
+            # Rows shaped like ReviewOutput, sent as they come from Mongo.
+            # A page also has the keys of its cursor, dropped afterwards
             {
                 "$project": {
-                    "user_id": 1,
-                    "film_id": 1,
-                    "text": 1,
-                    "rating": "$likes.rating",
+                    **field_projection("user_id", "film_id", "text"),
+                    "rating": {
+                        "$ifNull": [{"$first": f"$like.{F.rating}"}, None]
+                    },
+                    **(
+                        field_projection("created_at")
+                        if limit
+                        else {"_id": 0}
+                    ),
                 }
-            }
+            },
         ]
-        return await self.model.find(filters).aggregate(
-            pipeline, projection_model=ReviewOutput
+        # A user's own reviews are read from the primary, so that they see
+        # their writes at once
+        collection = self.collection if user_id else self.reader
+        return collection.aggregate([{"$match": filters}, *pipeline])
+
+    async def _get_page(
+            self,
+            user_id: str = None,
+            film_id: UUID = None,
+            limit: int = None,
+            cursor: str | None = None,
+    ) -> tuple[list[dict], str | None]:
+        reviews = await self._aggregate_all(
+            user_id, film_id, cursor, limit + 1 if limit else None
         ).to_list()
+        if not limit:
+            return reviews, None
+        reviews, next_cursor = paginate_rows(reviews, limit)
+        for review in reviews:
+            del review["created_at"]
+        return reviews, next_cursor
+
+    async def _load_first_page(
+            self, film_id: UUID, limit: int | None, key: str
+    ) -> tuple[list[dict], str | None]:
+        page = await self._get_page(film_id=film_id, limit=limit)
+        await self.cache.set(key, page)
+        return page
+
+    async def get_all(
+            self,
+            user_id: str = None,
+            film_id: UUID = None,
+            limit: int = None,
+            cursor: str | None = None,
+    ) -> tuple[list[dict], str | None]:
+        if not film_id:
+            return await self._get_page(user_id, film_id, limit, cursor)
+        if cursor:
+            return await film_reviews_flight.do(
+                (film_reviews_key(film_id), limit, cursor),
+                lambda: self._get_page(
+                    film_id=film_id, limit=limit, cursor=cursor
+                ),
+            )
+        # The first pages of the film reviews, one entry per size
+        version = await self.cache.get_version(film_reviews_key(film_id))
+        key = film_reviews_page_key(film_id, version, limit)
+        page = await self.cache.get(key)
+        if page is not MISSING:
+            return page
+        return await film_reviews_flight.do(
+            key, lambda: self._load_first_page(film_id, limit, key)
+        )
+
+    def stream_all(
+            self,
+            user_id: str = None,
+            film_id: UUID = None,
+            cursor: str | None = None,
+    ) -> AsyncIterator[dict]:
+        return self._aggregate_all(user_id, film_id, cursor)
 
     async def update(self, user_id: str, review_input: ReviewInput):
-        review = await self._get_one(user_id, review_input.film_id)
-        if not review:
+        result = await self.collection.update_one(
+            self._get_filter(user_id, review_input.film_id),
+            {
+                "$set": {
+                    F.text: review_input.text,
+                    F.updated_at: datetime.now(UTC),
+                }
+            },
+        )
+        if not result.matched_count:
             raise NotFoundException
-        review.text = review_input.text
-        review.updated_at = datetime.now(UTC)
-        await review.save()  # noqa
+        await self.cache.delete(film_reviews_key(review_input.film_id))
 
     async def delete(self, user_id: str, film_id: UUID):
-        review = await self._get_one(user_id, film_id)
-        if not review:
+        result = await self.collection.update_one(
+            self._get_filter(user_id, film_id),
+            {"$set": {F.is_deleted: True, F.updated_at: datetime.now(UTC)}},
+        )
+        if not result.matched_count:
             raise NotFoundException
-        review.is_deleted = True
-        review.updated_at = datetime.now(UTC)
-        await review.save()  # noqa
+        await self.cache.delete(film_reviews_key(film_id))
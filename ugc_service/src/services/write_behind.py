@@ -0,0 +1,373 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Awaitable, Callable
+from uuid import UUID, uuid4
+
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from ugc_service.src.core.exceptions import BufferFullException
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.models.fields import F
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_OPERATIONS = Counter(
+    "ugc_write_behind_operations_total",
+    "Writes handled by the write-behind buffers by outcome",
+    ["buffer", "outcome"],
+)
+WRITE_BEHIND_PENDING = Gauge(
+    "ugc_write_behind_pending",
+    "Documents waiting in the write-behind buffers",
+    ["buffer"],
+    multiprocess_mode="livesum",
+)
+WRITE_BEHIND_FLUSH_DURATION = Histogram(
+    "ugc_write_behind_flush_duration_seconds",
+    "Duration of the write-behind flushes",
+    ["buffer"],
+)
+
+# (user_id, film_id)
+Key = tuple[UUID, UUID]
+
+
+@dataclass
+class PendingWrite:
+    """The coalesced writes of a user for a film. fields are $set, by their
+    stored names, later writes overwriting earlier ones field by field. An
+    upsert creates or reactivates the document, otherwise only an active
+    one is updated."""
+    fields: dict
+    upsert: bool
+    # Id of the document if the upsert inserts it
+    id: UUID
+
+    def merge(self, fields: dict, upsert: bool):
+        self.fields.update(fields)
+        self.upsert = self.upsert or upsert
+
+
+Writer = Callable[[dict[Key, PendingWrite]], Awaitable[None]]
+
+
+class WriteBehindBuffer:
+    """Accepts writes in memory and flushes them in bulk.
+
+    The writes to a (user_id, film_id) pair are coalesced until the next
+    flush, which happens every flush_interval seconds or as soon as
+    flush_size documents are pending. Flushes are sequential, so the
+    writes reach Mongo in the order they were accepted.
+
+    At most max_size documents are pending. Beyond that a write waits up
+    to put_timeout seconds for a flush and then fails with
+    BufferFullException, or, if spill_dir is set, is appended to an NDJSON
+    file replayed by the next flush; all writes are spilled until then,
+    to keep their order. A failed flush is merged back into the buffer.
+
+    Each worker process spills to a file of its own, that of the first
+    slot it locks in spill_dir. A worker started after a crash takes the
+    free slot over and replays what is left in its file.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            writer: Writer,
+            max_size: int,
+            flush_size: int,
+            flush_interval: float,
+            put_timeout: float,
+            spill_dir: str = "",
+    ):
+        self.name = name
+        self.writer = writer
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.spill_path: Path | None = None
+        self._slot_lock = None
+        self._pending: dict[Key, PendingWrite] = {}
+        # Taken from _pending by the flush in progress
+        self._writing: set[Key] = set()
+        self._spilling = False
+        self._flush_lock = asyncio.Lock()
+        self._spill_lock = asyncio.Lock()
+        self._space = asyncio.Condition()
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        # Set on every change, as with several workers the gauge is read
+        # from files rather than computed on scrape
+        self._pending_gauge = WRITE_BEHIND_PENDING.labels(name)
+
+    @property
+    def _replay_path(self) -> Path:
+        return self.spill_path.with_suffix(".replay")
+
+    def _claim_spill_path(self) -> Path:
+        # The lock is released when the process exits. The first slot
+        # keeps the file name of a single process
+        slot = 0
+        while True:
+            lock = open(self.spill_dir / f"{self.name}.{slot}.lock", "a")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                slot += 1
+                continue
+            self._slot_lock = lock
+            suffix = f".{slot}" if slot else ""
+            return self.spill_dir / f"{self.name}{suffix}.ndjson"
+
+    async def start(self):
+        if self.spill_dir:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            self.spill_path = self._claim_spill_path()
+            # Left over by the previous run
+            self._spilling = (
+                self.spill_path.exists() or self._replay_path.exists()
+            )
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # The flush task is stopped between two flushes rather than
+        # cancelled: a cancelled flush loses the entries it took from
+        # _pending, or writes the likes without their film stats
+        if self._task:
+            self._closing = True
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._slot_lock:
+            self._slot_lock.close()
+            self._slot_lock = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._closing:
+                return
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:  # noqa
+                logger.exception("Write-behind flush of %s failed", self.name)
+
+    async def put(
+            self, user_id: UUID, film_id: UUID, fields: dict, upsert: bool
+    ) -> UUID:
+        """Accept a write and return the id of the document if it is
+        inserted. fields must be JSON serializable if spill_dir is set."""
+        key = (user_id, film_id)
+        if self._spilling or self._is_full(key):
+            if not self.spill_path:
+                await self._wait_for_space(key)
+            elif doc_id := await self._spill(key, fields, upsert):
+                return doc_id
+        pending = self._pending.get(key)
+        if pending:
+            pending.merge(fields, upsert)
+            WRITE_BEHIND_OPERATIONS.labels(self.name, "coalesced").inc()
+        else:
+            pending = self._pending[key] = PendingWrite(
+                dict(fields), upsert, uuid4()
+            )
+            self._pending_gauge.set(len(self._pending))
+            WRITE_BEHIND_OPERATIONS.labels(self.name, "queued").inc()
+        if len(self._pending) >= self.flush_size:
+            self._full.set()
+        return pending.id
+
+    async def flush_pending(self, *keys: Key):
+        """Flush now if any of the pairs has a pending write, or wait for
+        the flush writing it, before a write that bypasses the buffer."""
+        if self._spilling or any(
+                key in self._pending or key in self._writing for key in keys
+        ):
+            await self.flush()
+
+    def _is_full(self, key: Key) -> bool:
+        return (
+            key not in self._pending
+            and len(self._pending) >= self.max_size
+        )
+
+    async def _wait_for_space(self, key: Key):
+        self._full.set()
+        try:
+            async with self._space:
+                await asyncio.wait_for(
+                    self._space.wait_for(lambda: not self._is_full(key)),
+                    self.put_timeout,
+                )
+        except asyncio.TimeoutError:
+            WRITE_BEHIND_OPERATIONS.labels(self.name, "rejected").inc()
+            raise BufferFullException
+
+    async def _spill(
+            self, key: Key, fields: dict, upsert: bool
+    ) -> UUID | None:
+        async with self._spill_lock:
+            # The replay may have ended while waiting for the lock
+            if not self._spilling and not self._is_full(key):
+                return None
+            doc_id = uuid4()
+            line = json.dumps(
+                {
+                    "user_id": str(key[0]),
+                    "film_id": str(key[1]),
+                    "fields": fields,
+                    "upsert": upsert,
+                    "id": str(doc_id),
+                }
+            )
+            self._spilling = True
+            await asyncio.to_thread(self._append, line)
+        WRITE_BEHIND_OPERATIONS.labels(self.name, "spilled").inc()
+        self._full.set()
+        return doc_id
+
+    def _append(self, line: str):
+        with open(self.spill_path, "a") as spill_file:
+            spill_file.write(line + "\n")
+            spill_file.flush()
+            os.fsync(spill_file.fileno())
+
+    async def flush(self):
+        async with self._flush_lock:
+            entries, self._pending = self._pending, {}
+            self._pending_gauge.set(0)
+            async with self._space:
+                self._space.notify_all()
+            if entries:
+                self._writing = set(entries)
+                try:
+                    await self._write(entries)
+                finally:
+                    self._writing = set()
+            if self.spill_path:
+                await self._replay()
+
+    async def _write(self, entries: dict[Key, PendingWrite]):
+        try:
+            with WRITE_BEHIND_FLUSH_DURATION.labels(self.name).time():
+                await self.writer(entries)
+        except PyMongoError:
+            logger.exception("Write-behind flush of %s failed", self.name)
+            self._requeue(entries)
+            return
+        WRITE_BEHIND_OPERATIONS.labels(self.name, "written").inc(len(entries))
+
+    def _requeue(self, entries: dict[Key, PendingWrite]):
+        # The failed writes are older than those accepted since
+        for key, newer in self._pending.items():
+            if key in entries:
+                entries[key].merge(newer.fields, newer.upsert)
+            else:
+                entries[key] = newer
+        self._pending = entries
+        self._pending_gauge.set(len(entries))
+        WRITE_BEHIND_OPERATIONS.labels(self.name, "requeued").inc(
+            len(entries)
+        )
+
+    async def _replay(self):
+        # Writes keep being spilled until all the spilled ones are written,
+        # as they are older than any write accepted after
+        while True:
+            async with self._spill_lock:
+                if not self._replay_path.exists():
+                    if not self.spill_path.exists():
+                        self._spilling = False
+                        return
+                    self.spill_path.rename(self._replay_path)
+            if not await self._replay_file():
+                return
+
+    async def _replay_file(self) -> bool:
+        lines = await asyncio.to_thread(self._replay_path.read_text)
+        lines = lines.splitlines()
+        for start in range(0, len(lines), self.flush_size):
+            entries = {}
+            for line in lines[start:start + self.flush_size]:
+                spilled = json.loads(line)
+                key = (UUID(spilled["user_id"]), UUID(spilled["film_id"]))
+                if key in entries:
+                    entries[key].merge(spilled["fields"], spilled["upsert"])
+                else:
+                    entries[key] = PendingWrite(
+                        spilled["fields"],
+                        spilled["upsert"],
+                        UUID(spilled["id"]),
+                    )
+            try:
+                await self.writer(entries)
+            except PyMongoError:
+                # The writes are idempotent, the file is replayed again
+                logger.exception("Replay of %s failed", self._replay_path)
+                return False
+            WRITE_BEHIND_OPERATIONS.labels(self.name, "replayed").inc(
+                len(entries)
+            )
+        self._replay_path.unlink()
+        return True
+
+
+def create_buffer(name: str, writer: Writer) -> WriteBehindBuffer:
+    return WriteBehindBuffer(
+        name,
+        writer,
+        max_size=app_settings.write_behind_max_size,
+        flush_size=app_settings.write_behind_flush_size,
+        flush_interval=app_settings.write_behind_flush_interval,
+        put_timeout=app_settings.write_behind_put_timeout,
+        spill_dir=app_settings.write_behind_spill_dir,
+    )
+
+
+async def bulk_apply(
+        collection, entries: dict[Key, PendingWrite]
+) -> set[Key]:
+    """Apply the pending writes as one unordered bulk write and return the
+    pairs whose write did not fail."""
+    now = datetime.now(UTC)
+    keys, requests = list(entries), []
+    for (user_id, film_id), pending in entries.items():
+        filters = {F.user_id: user_id, F.film_id: film_id}
+        update = {"$set": {**pending.fields, F.updated_at: now}}
+        if pending.upsert:
+            # A reactivated document keeps its creation date
+            update["$set"][F.is_deleted] = False
+            update["$setOnInsert"] = {"_id": pending.id, F.created_at: now}
+        else:
+            filters[F.is_deleted] = False
+        requests.append(UpdateOne(filters, update, upsert=pending.upsert))
+    try:
+        await collection.bulk_write(requests, ordered=False)
+    except BulkWriteError as error:
+        # Not retried, e.g. two workers inserting the same pair at once
+        write_errors = error.details["writeErrors"]
+        logger.error(
+            "%s write-behind writes failed: %s",
+            len(write_errors),
+            write_errors[0]["errmsg"],
+        )
+        return set(keys) - {keys[failed["index"]] for failed in write_errors}
+    return set(keys)
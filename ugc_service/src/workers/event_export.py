@@ -0,0 +1,287 @@
+"""Export the UGC activity to files for analytics, from change streams.
+
+Tails the change streams of the bookmark, like and review collections and
+writes their changes in batches as compact events, one file per batch, so
+that analytics never queries the live collections. The resume token of
+every collection is checkpointed once its batch is written: after a
+restart the export resumes where it stopped, and a batch may be written
+twice but is never lost.
+
+Event fields: op (insert, update, replace or delete), collection, ts (the
+cluster time), id, user_id, film_id (null when unknown) and fields (the
+inserted document or the updated fields).
+
+Usage:
+    python -m ugc_service.src.workers.event_export [--format FORMAT]
+        [--batch-size N] [--batch-interval SECONDS]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+from bson import json_util
+from pymongo.errors import OperationFailure
+
+import ugc_service.src.core.logger  # noqa
+from ugc_service.src.core.mongo import init_mongo
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.models.bookmark import Bookmark
+from ugc_service.src.models.fields import F, to_field_names
+from ugc_service.src.models.like import Like
+from ugc_service.src.models.review import Review
+
+logger = logging.getLogger(__name__)
+
+EXPORTED_MODELS = [Bookmark, Like, Review]
+
+# Only what the events need travels from the cluster. The _id is the
+# resume token and cannot be removed; documentKey holds the shard key
+CHANGE_PIPELINE = [
+    {
+        "$match": {
+            "operationType": {
+                "$in": ["insert", "update", "replace", "delete"]
+            }
+        }
+    },
+    {
+        "$project": {
+            "operationType": 1,
+            "clusterTime": 1,
+            "documentKey": 1,
+            "fullDocument": 1,
+            "updateDescription.updatedFields": 1,
+        }
+    },
+]
+# How long a getMore waits for new changes
+MAX_AWAIT_TIME_MS = 1000
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _event_id(key: dict, document: dict, name: str) -> str | None:
+    # The key has the stored names. None, sent as null, for a key and a
+    # change without the field
+    value = key.get(getattr(F, name), document.get(name))
+    return None if value is None else str(value)
+
+
+def to_event(collection: str, change: dict) -> dict:
+    # Events use the field names, whatever the stored names are
+    document = to_field_names(
+        change.get("fullDocument")
+        or change.get("updateDescription", {}).get("updatedFields")
+        or {}
+    )
+    key = change["documentKey"]
+    return {
+        "op": change["operationType"],
+        "collection": collection,
+        "ts": change["clusterTime"].as_datetime().isoformat(),
+        "id": str(key["_id"]),
+        "user_id": _event_id(key, document, "user_id"),
+        "film_id": _event_id(key, document, "film_id"),
+        "fields": {
+            field: value
+            for field, value in document.items()
+            if field not in ("_id", "user_id", "film_id")
+        },
+    }
+
+
+class EventSink(ABC):
+    """Where the batches of events go. write() must be durable when it
+    returns, as the checkpoint follows."""
+
+    @abstractmethod
+    def write(self, collection: str, events: list[dict]):
+        ...
+
+
+class FileSink(EventSink):
+    """One file per batch under <directory>/<collection>/, written under a
+    temporary name and renamed, so that readers only see whole files."""
+    extension: str
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def write(self, collection: str, events: list[dict]):
+        directory = self.directory / collection
+        directory.mkdir(parents=True, exist_ok=True)
+        name = datetime.now(UTC).strftime("%Y%m%dT%H%M%S%f")
+        path = directory / f"{name}.{self.extension}"
+        temporary = path.with_suffix(".part")
+        self._write_file(temporary, events)
+        os.replace(temporary, path)
+
+    @abstractmethod
+    def _write_file(self, path: Path, events: list[dict]):
+        ...
+
+
+class NDJSONSink(FileSink):
+    extension = "ndjson"
+
+    def _write_file(self, path: Path, events: list[dict]):
+        with open(path, "w") as file:
+            for event in events:
+                file.write(json.dumps(event, default=_to_json) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class ParquetSink(FileSink):
+    """The fields are kept as a JSON string, so that all the files of a
+    collection share the same schema."""
+    extension = "parquet"
+
+    def __init__(self, directory: str):
+        # Optional dependency, only needed with --format parquet
+        import pyarrow
+        import pyarrow.parquet
+
+        super().__init__(directory)
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+
+    def _write_file(self, path: Path, events: list[dict]):
+        table = self._pyarrow.Table.from_pylist(
+            [
+                {
+                    **event,
+                    "fields": json.dumps(event["fields"], default=_to_json),
+                }
+                for event in events
+            ]
+        )
+        self._parquet.write_table(table, path, compression="zstd")
+
+
+SINKS = {"ndjson": NDJSONSink, "parquet": ParquetSink}
+
+
+class Checkpoint:
+    """Resume token of a collection, in a JSON file replaced atomically."""
+
+    def __init__(self, directory: str, collection: str):
+        self.path = Path(directory) / f"{collection}.json"
+
+    def load(self) -> dict | None:
+        if not self.path.exists():
+            return None
+        return json_util.loads(self.path.read_text())
+
+    def save(self, token: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(".part")
+        temporary.write_text(json_util.dumps(token))
+        os.replace(temporary, self.path)
+
+
+async def export(
+        model,
+        sink: EventSink,
+        checkpoint: Checkpoint,
+        batch_size: int,
+        batch_interval: float,
+):
+    collection = model.get_motor_collection()
+    name = collection.name
+    token = checkpoint.load()
+    logger.info(
+        "Exporting %s %s", name, "from checkpoint" if token else "from now"
+    )
+    async with collection.watch(
+            CHANGE_PIPELINE,
+            resume_after=token,
+            max_await_time_ms=MAX_AWAIT_TIME_MS,
+    ) as stream:
+        while True:
+            events = []
+            deadline = time.monotonic() + batch_interval
+            while len(events) < batch_size and time.monotonic() < deadline:
+                change = await stream.try_next()
+                if change is not None:
+                    events.append(to_event(name, change))
+            if events:
+                await asyncio.to_thread(sink.write, name, events)
+            # The token also moves on without changes, so that a restart
+            # does not scan the oplog written for other collections
+            if stream.resume_token != token:
+                token = stream.resume_token
+                await asyncio.to_thread(checkpoint.save, token)
+
+
+async def main(fmt: str, batch_size: int, batch_interval: float) -> int:
+    mongo = await init_mongo(skip_indexes=True)
+    sink = SINKS[fmt](app_settings.export_dir)
+    try:
+        await asyncio.gather(
+            *(
+                export(
+                    model,
+                    sink,
+                    Checkpoint(
+                        app_settings.export_checkpoint_dir,
+                        model.get_collection_name(),
+                    ),
+                    batch_size,
+                    batch_interval,
+                )
+                for model in EXPORTED_MODELS
+            )
+        )
+    except OperationFailure as error:
+        if error.code != CHANGE_STREAM_HISTORY_LOST:
+            raise
+        # The oplog no longer has the checkpointed position
+        print(
+            "The checkpoint is older than the oplog, events were lost. "
+            "Reimport the collections and delete the checkpoints in "
+            f"{app_settings.export_checkpoint_dir} to resume from now",
+            file=sys.stderr,
+        )
+        return 1
+    finally:
+        mongo.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the UGC changes to files for analytics"
+    )
+    parser.add_argument(
+        "--format", choices=sorted(SINKS), default=app_settings.export_format
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=app_settings.export_batch_size
+    )
+    parser.add_argument(
+        "--batch-interval",
+        type=float,
+        default=app_settings.export_batch_interval,
+        help="seconds after which a smaller batch is written",
+    )
+    args = parser.parse_args()
+    sys.exit(
+        asyncio.run(main(args.format, args.batch_size, args.batch_interval))
+    )
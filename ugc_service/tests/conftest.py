@@ -0,0 +1,36 @@
+import os
+from uuid import uuid4
+
+import pytest
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from ugc_service.src.core.mongo import DOCUMENT_MODELS
+
+# A throwaway database is created on it for each test that needs Mongo
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL", "mongodb://localhost:27017")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def mongo_db():
+    client = AsyncIOMotorClient(
+        MONGO_TEST_URL,
+        uuidRepresentation="standard",
+        serverSelectionTimeoutMS=1000,
+    )
+    try:
+        await client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        pytest.skip(f"no mongod reachable at {MONGO_TEST_URL}")
+    db = client[f"ugc_test_{uuid4().hex}"]
+    await init_beanie(database=db, document_models=DOCUMENT_MODELS)
+    yield db
+    await client.drop_database(db.name)
+    client.close()
@@ -0,0 +1,182 @@
+import asyncio
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+
+import pytest
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+
+from ugc_service.src.api.responses import NDJSONResponse
+from ugc_service.src.core.admission import AdmissionLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+def _limiter(**kwargs) -> AdmissionLimiter:
+    settings = {
+        "route_class": "test",
+        "limit": 1,
+        "queue_size": 10,
+        "queue_timeout": 1.0,
+        "pool_wait_threshold": 0.0,
+        "retry_after": 1,
+        **kwargs,
+    }
+    return AdmissionLimiter(**settings)
+
+
+def _admitted(limiter: AdmissionLimiter):
+    # As FastAPI runs the dependency around the endpoint
+    return asynccontextmanager(limiter.__call__)()
+
+
+def _shed(reason: str) -> float:
+    return REGISTRY.get_sample_value(
+        "ugc_admission_shed_total",
+        {"route_class": "test", "reason": reason},
+    ) or 0.0
+
+
+async def test_waiters_are_admitted_in_arrival_order():
+    limiter = _limiter()
+    admitted = []
+
+    async def request(name: str):
+        async with _admitted(limiter):
+            admitted.append(name)
+            await asyncio.sleep(0)
+
+    async with _admitted(limiter):
+        requests = [
+            asyncio.create_task(request(name)) for name in "abcd"
+        ]
+        await asyncio.sleep(0)
+        assert len(limiter._waiters) == 4
+    await asyncio.gather(*requests)
+
+    assert admitted == list("abcd")
+    assert limiter._running == 0
+
+
+async def test_request_waiting_past_the_queue_timeout_is_shed():
+    limiter = _limiter(queue_timeout=0.01)
+    shed = _shed("queue_timeout")
+
+    async with _admitted(limiter):
+        with pytest.raises(HTTPException) as error:
+            async with _admitted(limiter):
+                pass
+
+    assert error.value.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert error.value.headers == {"Retry-After": "1"}
+    assert _shed("queue_timeout") - shed == 1
+    assert not limiter._waiters
+    assert limiter._running == 0
+
+
+async def test_request_beyond_the_queue_is_shed_at_once():
+    limiter = _limiter(queue_size=0)
+
+    async with _admitted(limiter):
+        with pytest.raises(HTTPException):
+            async with _admitted(limiter):
+                pass
+
+
+async def test_slot_is_released_when_the_endpoint_fails():
+    limiter = _limiter()
+
+    with pytest.raises(RuntimeError):
+        async with _admitted(limiter):
+            raise RuntimeError
+
+    assert limiter._running == 0
+
+
+async def test_slots_are_released_when_the_client_disconnects():
+    limiter = _limiter()
+
+    async def request():
+        async with _admitted(limiter):
+            await asyncio.Event().wait()
+
+    # Cancelled while running and while waiting for a slot
+    running = asyncio.create_task(request())
+    waiting = asyncio.create_task(request())
+    await asyncio.sleep(0)
+    assert len(limiter._waiters) == 1
+    waiting.cancel()
+    running.cancel()
+    await asyncio.gather(running, waiting, return_exceptions=True)
+
+    assert not limiter._waiters
+    assert limiter._running == 0
+
+
+async def test_requests_are_shed_while_the_pool_is_saturated(monkeypatch):
+    limiter = _limiter(pool_wait_threshold=0.1)
+    shed = _shed("pool_saturated")
+    monkeypatch.setattr(
+        "ugc_service.src.core.admission.pool_wait_listener.recent_wait",
+        lambda max_age: 0.5,
+    )
+
+    with pytest.raises(HTTPException) as error:
+        async with _admitted(limiter):
+            pass
+
+    assert error.value.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert _shed("pool_saturated") - shed == 1
+    assert limiter._running == 0
+
+
+async def _rows(limiter: AdmissionLimiter, running: list[int]):
+    for number in range(3):
+        running.append(limiter._running)
+        yield {"number": number}
+
+
+SCOPE = {"type": "http", "method": "GET", "path": "/", "headers": []}
+
+
+async def test_streamed_response_holds_the_slot_until_the_stream_ends():
+    limiter = _limiter()
+    running, sent = [], []
+
+    async with _admitted(limiter):
+        response = NDJSONResponse(_rows(limiter, running))
+    assert limiter._running == 1
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    await response(SCOPE, receive, send)
+
+    assert running == [1, 1, 1]
+    assert sent[-2]["body"].count(b"\n") == 3
+    assert limiter._running == 0
+
+
+async def test_streamed_response_releases_the_slot_on_disconnect():
+    limiter = _limiter()
+
+    async def rows():
+        yield {"number": 0}
+        await asyncio.Event().wait()
+
+    async with _admitted(limiter):
+        response = NDJSONResponse(rows())
+
+    async def receive():
+        await asyncio.sleep(0.01)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    await response(SCOPE, receive, send)
+
+    assert limiter._running == 0
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta, UTC
+from uuid import uuid4
+
+import pytest
+
+from ugc_service.src.commands.compact import (
+    RAW_OPTIONS,
+    _delete,
+    tombstone_filter,
+)
+from ugc_service.src.models.fields import F
+from ugc_service.src.models.like import Like
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_reactivated_tombstones_are_not_counted(mongo_db):
+    cutoff = datetime.now(UTC)
+    deleted_at = cutoff - timedelta(days=1)
+    collection = Like.get_motor_collection().with_options(
+        codec_options=RAW_OPTIONS
+    )
+    await collection.insert_many(
+        [
+            {
+                "_id": uuid4(),
+                F.user_id: uuid4(),
+                F.film_id: uuid4(),
+                # Of different sizes, to tell which one is counted
+                F.rating: 5 + position,
+                "note": "x" * (position + 1),
+                F.created_at: deleted_at,
+                F.updated_at: deleted_at,
+                F.is_deleted: True,
+            }
+            for position in range(2)
+        ]
+    )
+    tombstones = await collection.find(tombstone_filter(cutoff)).sort(
+        F.rating, 1
+    ).to_list()
+    await collection.update_one(
+        {"_id": tombstones[1]["_id"]},
+        {"$set": {F.is_deleted: False, F.updated_at: cutoff}},
+    )
+
+    deleted, size = await _delete(collection, tombstones, cutoff)
+
+    assert (deleted, size) == (1, len(tombstones[0].raw))
+    assert await collection.count_documents({}) == 1
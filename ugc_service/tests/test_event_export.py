@@ -0,0 +1,48 @@
+from datetime import datetime, UTC
+from uuid import uuid4
+
+from bson import Timestamp
+
+from ugc_service.src.models.fields import F
+from ugc_service.src.workers.event_export import to_event
+
+CLUSTER_TIME = Timestamp(datetime(2024, 1, 1, tzinfo=UTC), 1)
+
+
+def test_event_ids_are_read_by_their_stored_names():
+    doc_id, user_id, film_id = uuid4(), uuid4(), uuid4()
+
+    event = to_event(
+        "likes",
+        {
+            "operationType": "update",
+            "clusterTime": CLUSTER_TIME,
+            "documentKey": {
+                "_id": doc_id,
+                F.user_id: user_id,
+                F.film_id: film_id,
+            },
+            "updateDescription": {"updatedFields": {F.rating: 7}},
+        },
+    )
+
+    assert (event["id"], event["user_id"], event["film_id"]) == (
+        str(doc_id),
+        str(user_id),
+        str(film_id),
+    )
+    assert event["fields"] == {"rating": 7}
+
+
+def test_missing_event_ids_are_null():
+    event = to_event(
+        "likes",
+        {
+            "operationType": "delete",
+            "clusterTime": CLUSTER_TIME,
+            "documentKey": {"_id": uuid4()},
+        },
+    )
+
+    assert event["user_id"] is None
+    assert event["film_id"] is None
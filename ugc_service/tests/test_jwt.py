@@ -0,0 +1,118 @@
+import time
+
+import jwt
+import pytest
+from jwt import DecodeError
+
+from ugc_service.src.core.jwt import MAX_TOKEN_LENGTH, JWTBearer
+
+SECRET = "test-secret"
+NOW = time.time()
+
+
+class Clock:
+    def __init__(self):
+        self.now = NOW
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("ugc_service.src.core.jwt.time.time", clock)
+    return clock
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """Payloads actually decoded, as opposed to served from the cache."""
+    decoded = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        payload = decode(*args, **kwargs)
+        decoded.append(payload)
+        return payload
+
+    monkeypatch.setattr("ugc_service.src.core.jwt.jwt.decode", counting_decode)
+    return decoded
+
+
+@pytest.fixture
+def bearer():
+    bearer = JWTBearer()
+    bearer.algorithms = ["HS256"]
+    bearer.key = SECRET
+    bearer.cache_ttl = 300
+    return bearer
+
+
+def _token(**claims) -> str:
+    token = jwt.encode(claims, SECRET, algorithm="HS256")
+    # PyJWT 1 returns bytes, the header value is a str
+    return token.decode() if isinstance(token, bytes) else token
+
+
+def test_claims_are_cached_for_the_ttl(bearer, clock, decodes):
+    token = _token(user_id="user")
+
+    bearer.parse_token(token)
+    clock.now = NOW + 299
+    bearer.parse_token(token)
+    assert len(decodes) == 1
+
+    clock.now = NOW + 301
+    assert bearer.parse_token(token) == {"user_id": "user"}
+    assert len(decodes) == 2
+
+
+def test_claims_are_not_cached_past_the_expiry(bearer, clock, decodes):
+    token = _token(user_id="user", exp=int(NOW) + 60)
+
+    bearer.parse_token(token)
+    clock.now = NOW + 59
+    bearer.parse_token(token)
+    assert len(decodes) == 1
+
+    clock.now = NOW + 61
+    bearer.parse_token(token)
+    assert len(decodes) == 2
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "",
+        "header.payload",
+        "header.payload.signature.extra",
+        "header.pay load.signature",
+        "hеader.payload.signature",
+        "header.payload." + "s" * MAX_TOKEN_LENGTH,
+    ],
+)
+def test_malformed_tokens_are_rejected_before_decoding(
+        bearer, decodes, token
+):
+    with pytest.raises(DecodeError):
+        bearer.parse_token(token)
+
+    assert not decodes
+
+
+def test_least_recently_used_claims_are_evicted(bearer, clock, decodes):
+    bearer.cache_size = 2
+    first, second, third = (_token(user_id=str(n)) for n in range(3))
+
+    bearer.parse_token(first)
+    bearer.parse_token(second)
+    bearer.parse_token(first)
+    bearer.parse_token(third)
+    assert len(decodes) == 3
+
+    bearer.parse_token(first)
+    assert len(decodes) == 3
+    bearer.parse_token(second)
+    assert len(decodes) == 4
+    assert len(bearer._cache) == 2
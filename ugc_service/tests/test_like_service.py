@@ -0,0 +1,68 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ugc_service.src.core.jwt import security_jwt
+from ugc_service.src.core.settings import app_settings
+from ugc_service.src.main import app
+from ugc_service.src.schemas.like import LikeInput
+from ugc_service.src.services.like import LikeService, like_buffer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def write_behind(monkeypatch):
+    monkeypatch.setattr(app_settings, "write_behind", True)
+    yield
+    like_buffer._pending.clear()
+
+
+@pytest.fixture
+def client(write_behind):
+    app.dependency_overrides[LikeService] = lambda: LikeService.__new__(
+        LikeService
+    )
+    user_id = str(uuid4())
+    app.dependency_overrides[security_jwt] = lambda: {"user_id": user_id}
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_buffered_like_is_accepted_without_an_id(client):
+    like = {"film_id": str(uuid4()), "rating": 7}
+
+    created = client.post("/api/v1/likes", json=like)
+    updated = client.patch("/api/v1/likes", json=like)
+
+    assert created.status_code == HTTPStatus.ACCEPTED
+    assert created.content == b""
+    assert updated.status_code == HTTPStatus.ACCEPTED
+    assert len(like_buffer._pending) == 1
+
+
+async def test_film_stats_loaded_before_an_invalidation_are_not_served(
+        mongo_db, monkeypatch
+):
+    monkeypatch.setattr(app_settings, "write_behind", False)
+    film_id = uuid4()
+    service = LikeService()
+    reader = service.stats_reader
+
+    class LikedWhileReading:
+        async def find_one(self, *args, **kwargs):
+            stats = await reader.find_one(*args, **kwargs)
+            # The film is liked after its stats were read from Mongo
+            service.stats_reader = reader
+            await service.create(
+                str(uuid4()), LikeInput(film_id=film_id, rating=8)
+            )
+            return stats
+
+    service.stats_reader = LikedWhileReading()
+    stale = await service.count_by_film_id(film_id)
+    fresh = await service.count_by_film_id(film_id)
+
+    assert (stale, fresh) == (0, 1)
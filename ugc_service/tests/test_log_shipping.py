@@ -0,0 +1,103 @@
+import json
+import logging
+
+import pytest
+from prometheus_client import REGISTRY
+
+from ugc_service.src.core.log_shipping import (
+    DROP_NEWEST,
+    DROP_OLDEST,
+    AsyncLogstashHandler,
+    _Shipper,
+)
+
+
+class Socket:
+    def __init__(self):
+        self.datagrams = []
+
+    def sendto(self, data: bytes, address):
+        self.datagrams.append(data)
+
+    def close(self):
+        pass
+
+
+def _dropped() -> float:
+    return REGISTRY.get_sample_value(
+        "ugc_log_records_total", {"outcome": "dropped"}
+    ) or 0.0
+
+
+def _record(message: str) -> logging.LogRecord:
+    return logging.LogRecord(
+        "ugc", logging.INFO, __file__, 1, message, None, None
+    )
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    # The shipper thread is not started: the queue is only drained by
+    # the test, which sends through a fake socket
+    monkeypatch.setattr(_Shipper, "start", lambda self: None)
+
+    def create(**kwargs) -> AsyncLogstashHandler:
+        handler = AsyncLogstashHandler("localhost", 5044, **kwargs)
+        handler._shipper.socket = Socket()
+        return handler
+
+    return create
+
+
+def _queued(handler: AsyncLogstashHandler) -> list[str]:
+    return [record.msg for record in list(handler.queue.queue)]
+
+
+@pytest.mark.parametrize(
+    "policy, kept",
+    [(DROP_NEWEST, ["0", "1"]), (DROP_OLDEST, ["2", "3"])],
+)
+def test_full_queue_drops_by_policy(handler, policy, kept):
+    handler = handler(queue_size=2, overflow_policy=policy)
+    dropped = _dropped()
+
+    for position in range(4):
+        handler.handle(_record(str(position)))
+
+    assert _queued(handler) == kept
+    assert _dropped() - dropped == 2
+
+
+def test_records_are_batched_in_datagrams_under_the_size_limit(handler):
+    handler = handler(max_datagram_size=600, flush_interval=0)
+    shipper = handler._shipper
+    messages = [f"message {position}" for position in range(10)]
+    for message in messages:
+        handler.handle(_record(message))
+
+    batch, stopping = shipper._collect()
+    shipper._send(batch)
+
+    datagrams = shipper.socket.datagrams
+    assert not stopping
+    assert 1 < len(datagrams) < len(messages)
+    assert all(len(datagram) <= 600 for datagram in datagrams)
+    assert [
+        event["message"]
+        for datagram in datagrams
+        for event in json.loads(datagram)
+    ] == messages
+
+
+def test_record_over_the_size_limit_is_sent_alone(handler):
+    handler = handler(max_datagram_size=100, flush_interval=0)
+    shipper = handler._shipper
+    handler.handle(_record("first"))
+    handler.handle(_record("second"))
+
+    shipper._send(shipper._collect()[0])
+
+    assert [
+        [event["message"] for event in json.loads(datagram)]
+        for datagram in shipper.socket.datagrams
+    ] == [["first"], ["second"]]
@@ -0,0 +1,119 @@
+import base64
+from datetime import datetime, UTC
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ugc_service.src.core.exceptions import InvalidCursorException
+from ugc_service.src.core.jwt import security_jwt
+from ugc_service.src.core.pagination import (
+    decode_cursor,
+    encode_cursor,
+    keyset_filter,
+    paginate_rows,
+)
+from ugc_service.src.main import app
+from ugc_service.src.services.like import LikeService
+
+
+def _b64(value: str) -> str:
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+@pytest.mark.parametrize(
+    "created_at",
+    [
+        datetime(2024, 5, 17, 8, 30, 12, 123456, tzinfo=UTC),
+        datetime(2024, 5, 17, 8, 30, 12, 123000),
+        datetime(2024, 5, 17),
+    ],
+)
+def test_cursor_round_trip(created_at):
+    doc_id = uuid4()
+
+    assert decode_cursor(encode_cursor(created_at, doc_id)) == (
+        created_at,
+        doc_id,
+    )
+
+
+MALFORMED_CURSORS = [
+    "not base64!",
+    "YQ",
+    _b64("2024-01-01T00:00:00"),
+    _b64(f"2024-01-01T00:00:00|{uuid4()}|extra"),
+    _b64(f"yesterday|{uuid4()}"),
+    _b64("2024-01-01T00:00:00|not-a-uuid"),
+    base64.urlsafe_b64encode(b"\xff\xfe|\xfd").decode(),
+    "",
+]
+
+
+@pytest.mark.parametrize("cursor", MALFORMED_CURSORS[:-1])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursorException):
+        decode_cursor(cursor)
+
+
+def test_empty_cursor_selects_everything():
+    assert keyset_filter(MALFORMED_CURSORS[-1]) == {}
+
+
+class _LikeService:
+    async def get_by_user_id(self, user_id, limit, cursor=None):
+        keyset_filter(cursor)
+        return [], None
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[LikeService] = _LikeService
+    app.dependency_overrides[security_jwt] = lambda: {
+        "user_id": str(uuid4())
+    }
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("cursor", MALFORMED_CURSORS[:-1])
+def test_malformed_cursor_is_answered_with_422(client, cursor):
+    response = client.get("/api/v1/likes", params={"cursor": cursor})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def _rows(count: int) -> list[dict]:
+    return [
+        {
+            "_id": uuid4(),
+            "film_id": uuid4(),
+            "created_at": datetime(2024, 1, 1, minute=59 - position),
+        }
+        for position in range(count)
+    ]
+
+
+def test_page_of_exactly_limit_rows_is_the_last():
+    rows = _rows(3)
+
+    page, cursor = paginate_rows([dict(row) for row in rows], 3)
+
+    assert cursor is None
+    assert page == [
+        {"film_id": row["film_id"], "created_at": row["created_at"]}
+        for row in rows
+    ]
+
+
+def test_page_of_limit_plus_one_rows_points_at_the_last_kept_row():
+    rows = _rows(4)
+
+    page, cursor = paginate_rows([dict(row) for row in rows], 3)
+
+    assert [row["film_id"] for row in page] == [
+        row["film_id"] for row in rows[:3]
+    ]
+    assert "_id" not in page[-1]
+    assert decode_cursor(cursor) == (rows[2]["created_at"], rows[2]["_id"])
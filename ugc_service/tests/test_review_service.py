@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, UTC
+from uuid import uuid4
+
+import pytest
+
+from ugc_service.src.models.fields import F
+from ugc_service.src.models.like import Like
+from ugc_service.src.models.review import Review
+from ugc_service.src.services.review import ReviewService
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+def _document(user_id, film_id, minutes: int, **fields) -> dict:
+    created_at = NOW + timedelta(minutes=minutes)
+    return {
+        "_id": uuid4(),
+        F.user_id: user_id,
+        F.film_id: film_id,
+        F.created_at: created_at,
+        F.updated_at: created_at,
+        F.is_deleted: False,
+        **{getattr(F, name): value for name, value in fields.items()},
+    }
+
+
+@pytest.fixture
+async def reviews(mongo_db):
+    """Three reviews of a film: by a reviewer with several likes, by one
+    whose like of the film is deleted and by one with no like. The film
+    is also liked by users who did not review it."""
+    film_id, other_film_id = uuid4(), uuid4()
+    liker, unliker, silent = uuid4(), uuid4(), uuid4()
+    await Like.get_motor_collection().insert_many(
+        [
+            _document(liker, film_id, 0, rating=7),
+            _document(liker, other_film_id, 1, rating=2),
+            _document(unliker, film_id, 2, rating=9, is_deleted=True),
+            *(
+                _document(uuid4(), film_id, 3 + minutes, rating=5)
+                for minutes in range(5)
+            ),
+        ]
+    )
+    await Review.get_motor_collection().insert_many(
+        [
+            _document(liker, film_id, 10, text="liked"),
+            _document(liker, other_film_id, 11, text="other film"),
+            _document(unliker, film_id, 12, text="unliked"),
+            _document(silent, film_id, 13, text="no like"),
+        ]
+    )
+    return film_id, liker, unliker, silent
+
+
+async def test_film_reviews_have_one_row_per_review(reviews):
+    film_id, liker, unliker, silent = reviews
+
+    rows, cursor = await ReviewService().get_all(film_id=film_id, limit=10)
+
+    assert cursor is None
+    assert [(row["user_id"], row["rating"]) for row in rows] == [
+        (silent, None),
+        (unliker, None),
+        (liker, 7),
+    ]
+
+
+async def test_streamed_film_reviews_have_one_row_per_review(reviews):
+    film_id, *_ = reviews
+
+    rows = [
+        row async for row in ReviewService().stream_all(film_id=film_id)
+    ]
+
+    assert len(rows) == 3
+
+
+async def test_user_reviews_have_the_rating_of_each_film(reviews):
+    _, liker, *_ = reviews
+
+    rows, _ = await ReviewService().get_all(user_id=str(liker), limit=10)
+
+    assert [(row["text"], row["rating"]) for row in rows] == [
+        ("other film", 2),
+        ("liked", 7),
+    ]
+
+
+async def test_pages_of_film_reviews_do_not_repeat_rows(reviews):
+    film_id, *_ = reviews
+    service = ReviewService()
+
+    first, cursor = await service.get_all(film_id=film_id, limit=2)
+    second, last_cursor = await service.get_all(
+        film_id=film_id, limit=2, cursor=cursor
+    )
+
+    assert len(first) == 2 and len(second) == 1
+    assert last_cursor is None
+
+
+async def test_first_page_loaded_before_an_invalidation_is_not_served(
+        reviews,
+):
+    film_id, liker, *_ = reviews
+    service = ReviewService()
+    get_page = service._get_page
+
+    async def get_page_then_delete(**kwargs):
+        page = await get_page(**kwargs)
+        # The review is deleted after the page was read from Mongo
+        service._get_page = get_page
+        await service.delete(str(liker), film_id)
+        return page
+
+    service._get_page = get_page_then_delete
+    stale, _ = await service.get_all(film_id=film_id, limit=10)
+    fresh, _ = await service.get_all(film_id=film_id, limit=10)
+
+    assert len(stale) == 3
+    assert liker not in [row["user_id"] for row in fresh]
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from ugc_service.src.core.singleflight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+class Call:
+    """A call counting its runs, which returns once released."""
+
+    def __init__(self, result=None, error: Exception | None = None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+        self.released = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        await self.released.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+
+async def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test")
+    call = Call(result="rows")
+
+    callers = [
+        asyncio.create_task(flight.do("key", call)) for _ in range(5)
+    ]
+    await asyncio.sleep(0)
+    call.released.set()
+
+    assert await asyncio.gather(*callers) == ["rows"] * 5
+    assert call.runs == 1
+
+
+async def test_calls_with_other_keys_are_not_shared():
+    flight = SingleFlight("test")
+    call = Call(result="rows")
+    call.released.set()
+
+    await asyncio.gather(flight.do("key", call), flight.do("other", call))
+
+    assert call.runs == 2
+
+
+async def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight("test")
+    call = Call(result="rows")
+    leader = asyncio.create_task(flight.do("key", call))
+    follower = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    await asyncio.sleep(0)
+    call.released.set()
+
+    assert await follower == "rows"
+    assert leader.cancelled()
+    assert call.runs == 1
+
+
+async def test_exception_reaches_every_waiter_and_is_cleared():
+    flight = SingleFlight("test")
+    failing = Call(error=RuntimeError("mongo is down"))
+    callers = [
+        asyncio.create_task(flight.do("key", failing)) for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    failing.released.set()
+
+    results = await asyncio.gather(*callers, return_exceptions=True)
+
+    assert all(result is failing.error for result in results)
+    assert failing.runs == 1
+    call = Call(result="rows")
+    call.released.set()
+    assert await flight.do("key", call) == "rows"
+    assert call.runs == 1
@@ -0,0 +1,89 @@
+from http import HTTPStatus
+
+import pytest
+import sentry_sdk
+from sentry_sdk import Client, Hub
+from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
+from sentry_sdk.transport import Transport
+
+from ugc_service.src.core.tracing import (
+    AdaptiveTracesSampler,
+    TraceTailMiddleware,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class Transactions(Transport):
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def capture_event(self, event):
+        pass
+
+    def capture_envelope(self, envelope):
+        transaction = envelope.get_transaction_event()
+        if transaction is not None:
+            self.sent.append(transaction)
+
+
+def _endpoint(status: int, spans: int):
+    async def app(scope, receive, send):
+        for number in range(spans):
+            with sentry_sdk.start_span(op="db", description=str(number)):
+                pass
+        await send({"type": "http.response.start", "status": status})
+        await send({"type": "http.response.body", "body": b""})
+
+    return app
+
+
+async def _traces(
+        status: int, slow_threshold: float, spans: int = 5
+) -> list[dict]:
+    """The transactions sent for one request, none of them head sampled"""
+    transport = Transactions()
+    sampler = AdaptiveTracesSampler(
+        target_per_second=1.0, route_weights={"/": 0.0}, tail_fraction=1.0
+    )
+    app = SentryAsgiMiddleware(
+        TraceTailMiddleware(
+            _endpoint(status, spans),
+            slow_threshold=slow_threshold,
+            max_spans=3,
+        )
+    )
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/v1/likes",
+        "headers": [],
+        "query_string": b"",
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    with Hub(Client(transport=transport, traces_sampler=sampler)):
+        await app(scope, receive, send)
+    return transport.sent
+
+
+async def test_fast_request_is_not_traced():
+    assert await _traces(HTTPStatus.OK, slow_threshold=60) == []
+
+
+@pytest.mark.parametrize(
+    "status, slow_threshold",
+    [(HTTPStatus.INTERNAL_SERVER_ERROR, 60), (HTTPStatus.OK, 0)],
+)
+async def test_failed_or_slow_request_is_traced_with_few_spans(
+        status, slow_threshold
+):
+    [trace] = await _traces(status, slow_threshold)
+
+    assert 0 < len(trace["spans"]) <= 3
@@ -0,0 +1,182 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from ugc_service.src.core.cache import LRUCache
+from ugc_service.src.models.fields import F
+from ugc_service.src.services.like import LikeService
+from ugc_service.src.services.write_behind import (
+    PendingWrite,
+    WriteBehindBuffer,
+    bulk_apply,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class Collection:
+    """Records the bulk writes, failing those at failed_indexes, or all of
+    them with error."""
+
+    def __init__(self, failed_indexes=(), error: Exception | None = None):
+        self.failed_indexes = failed_indexes
+        self.error = error
+        self.bulk_writes = []
+
+    async def find(self, filters, projection=None):
+        for document in ():
+            yield document
+
+    async def bulk_write(self, requests, ordered=True):
+        self.bulk_writes.append(requests)
+        if self.error:
+            raise self.error
+        if self.failed_indexes:
+            raise BulkWriteError(
+                {
+                    "writeErrors": [
+                        {"index": index, "errmsg": "E11000 duplicate key"}
+                        for index in self.failed_indexes
+                    ]
+                }
+            )
+
+
+def _buffer(writer) -> WriteBehindBuffer:
+    return WriteBehindBuffer(
+        "test",
+        writer,
+        max_size=100,
+        flush_size=100,
+        flush_interval=60,
+        put_timeout=1,
+    )
+
+
+def _like_service(collection, stats_collection) -> LikeService:
+    service = LikeService.__new__(LikeService)
+    service.collection = collection
+    service.stats_collection = stats_collection
+    service.cache = LRUCache(100, 5)
+    return service
+
+
+async def test_flush_pending_waits_for_the_flush_writing_the_pair():
+    events = []
+    writing, released = asyncio.Event(), asyncio.Event()
+
+    async def writer(entries):
+        writing.set()
+        await released.wait()
+        events.append("buffered write")
+
+    buffer = _buffer(writer)
+    key = (uuid4(), uuid4())
+    await buffer.put(*key, {F.rating: 5}, upsert=True)
+    flush = asyncio.create_task(buffer.flush())
+    await writing.wait()
+
+    async def delete():
+        # Taken from _pending by the flush, but not written yet
+        await buffer.flush_pending(key)
+        events.append("delete")
+
+    deleted = asyncio.create_task(delete())
+    await asyncio.sleep(0)
+    released.set()
+    await asyncio.gather(flush, deleted)
+
+    assert events == ["buffered write", "delete"]
+
+
+async def test_flush_pending_does_not_wait_for_other_pairs():
+    released = asyncio.Event()
+
+    async def writer(entries):
+        await released.wait()
+
+    buffer = _buffer(writer)
+    await buffer.put(uuid4(), uuid4(), {F.rating: 5}, upsert=True)
+    flush = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0)
+
+    await asyncio.wait_for(buffer.flush_pending((uuid4(), uuid4())), 1)
+    released.set()
+    await flush
+
+
+async def test_bulk_apply_returns_the_pairs_written():
+    entries = {
+        (uuid4(), uuid4()): PendingWrite({F.rating: 5}, True, uuid4())
+        for _ in range(3)
+    }
+
+    applied = await bulk_apply(Collection(failed_indexes=[1]), entries)
+
+    keys = list(entries)
+    assert applied == {keys[0], keys[2]}
+
+
+async def test_stats_count_only_the_applied_likes():
+    user_id, film_id, other_film_id = uuid4(), uuid4(), uuid4()
+    stats = Collection()
+    service = _like_service(Collection(failed_indexes=[1]), stats)
+
+    await service.write_buffered(
+        {
+            (user_id, film_id): PendingWrite({F.rating: 5}, True, uuid4()),
+            (user_id, other_film_id): PendingWrite(
+                {F.rating: 7}, True, uuid4()
+            ),
+        }
+    )
+
+    [requests] = stats.bulk_writes
+    assert [request._filter for request in requests] == [{"_id": film_id}]
+
+
+async def test_failed_stats_write_does_not_requeue_the_likes():
+    likes = Collection()
+    service = _like_service(likes, Collection(error=AutoReconnect()))
+    buffer = _buffer(service.write_buffered)
+    await buffer.put(uuid4(), uuid4(), {F.rating: 5}, upsert=True)
+
+    await buffer.flush()
+
+    assert len(likes.bulk_writes) == 1
+    assert not buffer._pending
+
+
+async def test_close_during_a_flush_loses_no_write():
+    written = []
+    writing, released = asyncio.Event(), asyncio.Event()
+
+    async def writer(entries):
+        writing.set()
+        await released.wait()
+        written.extend(entries)
+
+    buffer = WriteBehindBuffer(
+        "test",
+        writer,
+        max_size=100,
+        flush_size=1,
+        flush_interval=60,
+        put_timeout=1,
+    )
+    await buffer.start()
+    first, second = (uuid4(), uuid4()), (uuid4(), uuid4())
+    await buffer.put(*first, {F.rating: 5}, upsert=True)
+    await writing.wait()
+
+    closed = asyncio.create_task(buffer.close())
+    await buffer.put(*second, {F.rating: 7}, upsert=True)
+    await asyncio.sleep(0)
+    assert not closed.done()
+    released.set()
+    await closed
+
+    assert written == [first, second]
+    assert not buffer._pending